@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Activity, ActivityLog
+from .models import Activity, ActivityLog, ActivityLogArchive, IdempotencyKey
 
 
 @admin.register(Activity)
@@ -38,4 +38,24 @@ class ActivityLogAdmin(admin.ModelAdmin):
     ordering = ['-created_at']
     
     def get_queryset(self, request):
-        return super().get_queryset(request).select_related('activity', 'activity__user')
\ No newline at end of file
+        return super().get_queryset(request).select_related('activity', 'activity__user')
+
+
+@admin.register(ActivityLogArchive)
+class ActivityLogArchiveAdmin(admin.ModelAdmin):
+    list_display = ['activity', 'log_count', 'first_logged_at', 'last_logged_at', 'archived_at']
+    search_fields = ['activity__title', 'activity__user__username']
+    date_hierarchy = 'archived_at'
+    ordering = ['-archived_at']
+    exclude = ['entries']
+    readonly_fields = ['activity', 'log_count', 'transitions', 'first_logged_at', 'last_logged_at', 'archived_at']
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('activity', 'activity__user')
+
+
+@admin.register(IdempotencyKey)
+class IdempotencyKeyAdmin(admin.ModelAdmin):
+    list_display = ['key', 'user', 'status_code', 'created_at', 'expires_at']
+    search_fields = ['key', 'user__username']
+    ordering = ['-created_at']
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class ActivitiesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'activities'
+
+    def ready(self):
+        from django.core import checks
+
+        from fitness_tracker_backend.db_routers import check_pin_cache
+        from . import signals  # noqa: F401
+        checks.register(check_pin_cache, checks.Tags.caches)
@@ -0,0 +1,385 @@
+"""
+Synthetic users, activities and status logs for load and scale testing.
+
+Users are generated in chunks of ``chunk_size``. Each chunk draws from its own
+``random.Random`` seeded with the run's seed and the chunk number, and gets a
+fixed slice of the id space, so the same seed, end date and chunk size
+produce the same rows whether the chunks run in one process or are spread over
+``workers`` processes.
+
+Activities and logs are built as tuples of database-ready values and inserted
+with ``executemany`` in batches of ``batch_size`` activities per transaction.
+Model instances and ``bulk_create`` spend far more time preparing each field
+than SQLite spends inserting the row, and ``bulk_create`` would overwrite the
+generated ``created_at``/``updated_at`` with the current time; no signals are
+sent. Activities land on their owner's shard when ``ACTIVITY_SHARDS`` is set.
+"""
+import math
+import multiprocessing
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, time as dt_time, timedelta, timezone as dt_timezone
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Max
+
+from fitness_tracker_backend.sqlite_backend import write_transactions
+from . import sharding
+from .models import Activity, ActivityLog, ShardAssignment
+
+
+ACTIVITY_TYPE_WEIGHTS = {
+    'workout': 30,
+    'meal': 30,
+    'steps': 15,
+    'sleep': 10,
+    'hydration': 10,
+    'other': 5,
+}
+
+TITLES = {
+    'workout': ['Morning run', 'Strength training', 'Cycling', 'Yoga', 'Swimming', 'HIIT', 'Evening walk'],
+    'meal': ['Breakfast', 'Lunch', 'Dinner', 'Snack', 'Protein shake'],
+    'steps': ['Daily steps', 'Step goal', 'Walk to work'],
+    'sleep': ['Night sleep', 'Nap'],
+    'hydration': ['Water intake', 'Hydration goal'],
+    'other': ['Stretching', 'Meditation', 'Physio exercises'],
+}
+
+# Hour of day each type usually happens at, as (mean, standard deviation)
+USUAL_HOURS = {
+    'workout': (12, 5),
+    'meal': (13, 4),
+    'steps': (18, 2),
+    'sleep': (23, 1),
+    'hydration': (14, 3),
+    'other': (17, 4),
+}
+
+# Planned activities this far ahead of the end date are generated too
+FUTURE_DAYS = 14
+
+# Column order of the generated rows
+ACTIVITY_FIELDS = (
+    'id', 'user', 'title', 'description', 'activity_type', 'status', 'planned_date', 'completed_date',
+    'duration_minutes', 'calories_burned', 'calories_consumed', 'steps_count', 'notes', 'deleted', 'version',
+    'created_at', 'updated_at',
+)
+LOG_FIELDS = ('id', 'activity', 'old_status', 'new_status', 'notes', 'created_at')
+
+# At most planned -> in_progress -> completed, so two logs per activity
+MAX_LOGS_PER_ACTIVITY = 2
+
+
+def _clamp(value, low, high):
+    return max(low, min(high, value))
+
+
+def datetime_adapter(connection):
+    """Database value for the naive UTC datetimes generated here.
+
+    Same result as ``ops.adapt_datetimefield_value`` on the aware datetime, at
+    a fraction of the cost on backends that store UTC strings.
+    """
+    if connection.features.supports_timezones:
+        return lambda value: None if value is None else value.replace(tzinfo=dt_timezone.utc)
+    if connection.timezone_name == 'UTC':
+        return lambda value: None if value is None else str(value)
+    adapt = connection.ops.adapt_datetimefield_value
+    return lambda value: None if value is None else adapt(value.replace(tzinfo=dt_timezone.utc))
+
+
+class Generator:
+    """Builds the rows of one chunk of users from a seeded random stream."""
+
+    def __init__(self, task, adapt_datetime):
+        self.rng = random.Random(f'{task["seed"]}:{task["chunk"]}')
+        self.end = task['end']
+        self.days = task['days']
+        self.password_hash = task['password_hash']
+        self.username_prefix = task['username_prefix']
+        self.first_activity_id = task['first_activity_id']
+        self.first_log_id = task['first_log_id']
+        self.adapt_datetime = adapt_datetime
+        # Each type repeated by its weight, so one rng.choice() picks a weighted type
+        self.type_table = [name for name, weight in ACTIVITY_TYPE_WEIGHTS.items() for _ in range(weight)]
+
+    def user(self, user_id):
+        end = self.end.replace(tzinfo=dt_timezone.utc)
+        return User(
+            id=user_id,
+            username=f'{self.username_prefix}{user_id}',
+            email=f'{self.username_prefix}{user_id}@example.com',
+            password=self.password_hash,
+            date_joined=end - timedelta(days=self.days + self.rng.uniform(0, 30)),
+            last_login=end - timedelta(days=self.rng.expovariate(1 / 7)),
+        )
+
+    def activity(self, activity_id, user_id):
+        """One activity as a row of ``ACTIVITY_FIELDS`` values, plus its log rows."""
+        rng = self.rng
+        activity_type = rng.choice(self.type_table)
+        hour_mean, hour_deviation = USUAL_HOURS[activity_type]
+        planned = self.end + timedelta(
+            days=-rng.randint(-FUTURE_DAYS, self.days), hours=_clamp(rng.gauss(hour_mean, hour_deviation), 0, 23.99)
+        )
+        status = self._status(planned)
+        duration = self._duration(activity_type)
+        created = min(planned - timedelta(hours=rng.uniform(0, 7 * 24)), self.end)
+        # The invariant Activity.save() keeps: completed activities have a completed_date
+        completed = planned + timedelta(minutes=duration or 15) if status == 'completed' else None
+        calories_burned = calories_consumed = steps = None
+        if status in ('in_progress', 'completed'):
+            calories_burned, calories_consumed, steps = self._measurements(activity_type, duration)
+
+        adapt = self.adapt_datetime
+        row = (
+            activity_id, user_id, rng.choice(TITLES[activity_type]), None, activity_type, status,
+            adapt(planned), adapt(completed), duration, calories_burned, calories_consumed, steps, None, False, 0,
+            adapt(created), adapt(completed or created),
+        )
+        return row, self._logs(activity_id, status, planned, completed)
+
+    def _status(self, planned):
+        roll = self.rng.random()
+        if planned > self.end:
+            return 'cancelled' if roll < 0.05 else 'planned'
+        if self.end - planned < timedelta(hours=3) and roll < 0.5:
+            return 'in_progress'
+        if roll < 0.78:
+            return 'completed'
+        if roll < 0.90:
+            return 'cancelled'
+        return 'planned'
+
+    def _duration(self, activity_type):
+        rng = self.rng
+        if activity_type == 'workout':
+            return round(_clamp(rng.gauss(45, 15), 10, 180))
+        if activity_type == 'meal':
+            return round(_clamp(rng.gauss(25, 10), 5, 90))
+        if activity_type == 'steps':
+            return round(_clamp(rng.gauss(60, 25), 10, 240))
+        if activity_type == 'sleep':
+            return round(_clamp(rng.gauss(450, 60), 60, 720))
+        if activity_type == 'other':
+            return rng.randint(10, 90)
+        return None
+
+    def _measurements(self, activity_type, duration):
+        """Calories burned, calories consumed and steps recorded for a started activity."""
+        rng = self.rng
+        if activity_type == 'workout':
+            return round(duration * rng.uniform(5, 12)), None, None
+        if activity_type == 'meal':
+            return None, round(_clamp(rng.gauss(650, 200), 80, 1800)), None
+        if activity_type == 'steps':
+            steps = round(_clamp(rng.lognormvariate(8.9, 0.45), 500, 40000))
+            return round(steps * 0.04), None, steps
+        if activity_type == 'other':
+            return round(duration * rng.uniform(2, 5)), None, None
+        return None, None, None
+
+    def _logs(self, activity_id, status, planned, completed):
+        """Status change logs leading to ``status``, with ids after the activity's own slots."""
+        if status == 'in_progress':
+            transitions = [('planned', 'in_progress', planned)]
+        elif status == 'cancelled':
+            transitions = [('planned', 'cancelled', min(planned, self.end))]
+        elif status == 'completed' and self.rng.random() < 0.4:
+            transitions = [('planned', 'in_progress', planned), ('in_progress', 'completed', completed)]
+        elif status == 'completed':
+            transitions = [('planned', 'completed', completed)]
+        else:
+            return []
+        first_id = self.first_log_id + (activity_id - self.first_activity_id) * MAX_LOGS_PER_ACTIVITY
+        return [
+            (first_id + offset, activity_id, old_status, new_status,
+             f'Status changed from {old_status} to {new_status}', self.adapt_datetime(at))
+            for offset, (old_status, new_status, at) in enumerate(transitions)
+        ]
+
+
+def activity_counts(seed, chunk, users, activities_per_user):
+    """How many activities each user of a chunk gets, drawn from a separate stream.
+
+    Kept apart from the row stream so the parent can size id ranges without
+    generating the rows.
+    """
+    rng = random.Random(f'{seed}:{chunk}:counts')
+    cap = max(1, activities_per_user * 3)
+    # Gamma with shape 2: most users near the mean, a long tail of heavy users
+    return [min(cap, round(rng.gammavariate(2, activities_per_user / 2))) for _ in range(users)]
+
+
+def _insert_sql(model, field_names, using):
+    quote = connections[using].ops.quote_name
+    columns = ', '.join(quote(model._meta.get_field(name).column) for name in field_names)
+    placeholders = ', '.join(['%s'] * len(field_names))
+    return f'INSERT INTO {quote(model._meta.db_table)} ({columns}) VALUES ({placeholders})'
+
+
+def _highest_id(model, aliases):
+    highest = 0
+    for alias in aliases:
+        highest = max(highest, model._base_manager.using(alias).aggregate(highest=Max('id'))['highest'] or 0)
+    return highest
+
+
+def generate_chunk(task):
+    """Generate and insert one chunk; returns the number of rows written per model."""
+    generator = Generator(task, datetime_adapter(connections[DEFAULT_DB_ALIAS]))
+    first_user_id = task['first_user_id']
+    user_ids = range(first_user_id, first_user_id + len(task['counts']))
+    aliases = {user_id: sharding.ring_shard(user_id) if sharding.is_enabled() else DEFAULT_DB_ALIAS
+               for user_id in user_ids}
+
+    written = {'users': len(user_ids), 'activities': 0, 'logs': 0}
+    with write_transactions(), ExitStack() as stack:
+        for alias in {DEFAULT_DB_ALIAS, *aliases.values()}:
+            stack.enter_context(_unsynchronized(alias))
+        with transaction.atomic(using=DEFAULT_DB_ALIAS):
+            User.objects.using(DEFAULT_DB_ALIAS).bulk_create([generator.user(user_id) for user_id in user_ids])
+            if sharding.is_enabled():
+                ShardAssignment.objects.using(DEFAULT_DB_ALIAS).bulk_create(
+                    [ShardAssignment(user_id=user_id, alias=alias) for user_id, alias in aliases.items()]
+                )
+
+        next_id = task['first_activity_id']
+        pending = {}
+        for user_id, count in zip(user_ids, task['counts']):
+            alias = aliases[user_id]
+            activities, logs = pending.setdefault(alias, ([], []))
+            for activity_id in range(next_id, next_id + count):
+                row, log_rows = generator.activity(activity_id, user_id)
+                activities.append(row)
+                logs.extend(log_rows)
+            next_id += count
+            if len(activities) >= task['batch_size']:
+                _flush(alias, activities, logs, written)
+        for alias, (activities, logs) in pending.items():
+            _flush(alias, activities, logs, written)
+    return written
+
+
+@contextmanager
+def _unsynchronized(alias):
+    """Skip fsyncs on a SQLite database while loading: generated data can be regenerated."""
+    connection = connections[alias]
+    # SQLite refuses to change it inside a transaction
+    if connection.vendor != 'sqlite' or connection.in_atomic_block:
+        yield
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA synchronous')
+        previous = cursor.fetchone()[0]
+        cursor.execute('PRAGMA synchronous = OFF')
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA synchronous = {int(previous)}')
+
+
+def _flush(alias, activities, logs, written):
+    with transaction.atomic(using=alias), connections[alias].cursor() as cursor:
+        cursor.executemany(_insert_sql(Activity, ACTIVITY_FIELDS, alias), activities)
+        if logs:
+            cursor.executemany(_insert_sql(ActivityLog, LOG_FIELDS, alias), logs)
+    written['activities'] += len(activities)
+    written['logs'] += len(logs)
+    activities.clear()
+    logs.clear()
+
+
+def _init_worker():
+    import django
+    django.setup()
+
+
+def generate(users, activities_per_user, seed=0, days=365, end=None, workers=1, chunk_size=100,
+             batch_size=5000, password='password123', username_prefix='gen', progress=None):
+    """Create ``users`` users with about ``activities_per_user`` activities each.
+
+    ``end`` (a date, default today) anchors all generated dates, so together
+    with ``seed`` and ``chunk_size`` it makes runs reproducible. ``progress`` is called with the
+    running totals after each chunk. Returns the totals and elapsed seconds.
+    """
+    end = end or datetime.now(dt_timezone.utc).date()
+    # Naive UTC, see datetime_adapter()
+    end = datetime.combine(end, dt_time.min)
+    chunks = math.ceil(users / chunk_size)
+    counts = [
+        activity_counts(seed, chunk, min(chunk_size, users - chunk * chunk_size), activities_per_user)
+        for chunk in range(chunks)
+    ]
+    total_activities = sum(map(sum, counts))
+    first_ids = _reserve_ids(users, total_activities)
+
+    # A salt from the seed keeps the users table reproducible too
+    password_hash = make_password(password, salt=f'generated{seed}')
+    tasks = []
+    user_id, activity_id, log_id = first_ids
+    for chunk, chunk_counts in enumerate(counts):
+        tasks.append({
+            'seed': seed, 'chunk': chunk, 'end': end, 'days': days, 'counts': chunk_counts,
+            'first_user_id': user_id, 'first_activity_id': activity_id, 'first_log_id': log_id,
+            'batch_size': batch_size, 'password_hash': password_hash, 'username_prefix': username_prefix,
+        })
+        user_id += len(chunk_counts)
+        activity_id += sum(chunk_counts)
+        log_id += sum(chunk_counts) * MAX_LOGS_PER_ACTIVITY
+
+    totals = {'users': 0, 'activities': 0, 'logs': 0}
+    start = time.perf_counter()
+    if workers > 1:
+        # Forked workers must not share the parent's database connections
+        connections.close_all()
+        context = multiprocessing.get_context(
+            'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+        )
+        with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker) as pool:
+            for written in pool.map(generate_chunk, tasks):
+                _add(totals, written, progress)
+    else:
+        for task in tasks:
+            _add(totals, generate_chunk(task), progress)
+    _reset_sequences()
+    return totals, time.perf_counter() - start
+
+
+def _add(totals, written, progress):
+    for key, value in written.items():
+        totals[key] += value
+    if progress is not None:
+        progress(totals)
+
+
+def _reserve_ids(users, activities):
+    """First user, activity and log ids of the run's contiguous id ranges."""
+    first_user_id = _highest_id(User, [DEFAULT_DB_ALIAS]) + 1
+    if sharding.is_enabled():
+        # Sharded ids come from ShardSequence, like every other insert
+        first_activity_id = sharding.allocators[Activity].reserve(activities)
+        first_log_id = sharding.allocators[ActivityLog].reserve(activities * MAX_LOGS_PER_ACTIVITY)
+    else:
+        first_activity_id = _highest_id(Activity, [DEFAULT_DB_ALIAS]) + 1
+        first_log_id = _highest_id(ActivityLog, [DEFAULT_DB_ALIAS]) + 1
+    return first_user_id, first_activity_id, first_log_id
+
+
+def _reset_sequences():
+    """Move database sequences past the explicit ids (a no-op on SQLite)."""
+    for alias in set(sharding.get_shards()) | {DEFAULT_DB_ALIAS}:
+        connection = connections[alias]
+        models = [User, Activity, ActivityLog] if alias == DEFAULT_DB_ALIAS else [Activity, ActivityLog]
+        statements = connection.ops.sequence_reset_sql(no_style(), models)
+        if statements:
+            with connection.cursor() as cursor:
+                for statement in statements:
+                    cursor.execute(statement)
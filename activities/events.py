@@ -0,0 +1,283 @@
+"""
+In-process publish/subscribe for activity change events.
+
+Write paths (see ``activities.signals``) publish small event dicts for a user;
+the SSE view in ``activities.views`` subscribes and streams them to the
+browser. Each subscription holds a bounded queue: when a slow client falls
+behind, the oldest events are dropped and the stream tells the client to
+resync instead of letting memory grow.
+
+The broker is pluggable through ``ACTIVITY_EVENTS['BROKER']``.
+``InProcessBroker`` only reaches streams held by the process that made the
+write, so it suits a single process serving both. ``SocketBroker`` (the
+default) fans events out to every process on the host, so writes made by the
+WSGI workers reach the streams held by the ASGI server. Across several hosts
+a broker over shared infrastructure (e.g. Redis pub/sub) is needed; it can
+still deliver locally through ``InProcessBroker.deliver``.
+"""
+import asyncio
+import json
+import os
+import socket
+import tempfile
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+DEFAULTS = {
+    'BROKER': 'activities.events.InProcessBroker',
+    'QUEUE_SIZE': 100,
+    'HEARTBEAT_SECONDS': 15,
+    'RETRY_MILLISECONDS': 5000,
+    'SOCKET_DIR': os.path.join(tempfile.gettempdir(), 'fitness-tracker-events'),
+}
+
+# Largest event SocketBroker receives; events are a few hundred bytes
+MAX_DATAGRAM = 65536
+
+
+def get_setting(name):
+    return getattr(settings, 'ACTIVITY_EVENTS', {}).get(name, DEFAULTS[name])
+
+
+def _wake(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class Subscription:
+    """A single stream's view of the broker.
+
+    Idle subscriptions only cost a handful of slots: the queue is allocated on
+    the first event and the waiter future only while a consumer is awaiting.
+    """
+    __slots__ = ('user_id', 'maxlen', 'queue', 'dropped', '_waiter')
+
+    def __init__(self, user_id, maxlen):
+        self.user_id = user_id
+        self.maxlen = maxlen
+        self.queue = None
+        self.dropped = 0
+        self._waiter = None
+
+    def push(self, event):
+        """Queue an event, dropping the oldest one if the consumer is behind.
+
+        Safe to call from any thread; the consumer's event loop is woken with
+        ``call_soon_threadsafe``.
+        """
+        queue = self.queue
+        if queue is None:
+            queue = self.queue = deque(maxlen=self.maxlen)
+        if len(queue) == self.maxlen:
+            self.dropped += 1
+        queue.append(event)
+        waiter = self._waiter
+        if waiter is not None:
+            self._waiter = None
+            waiter.get_loop().call_soon_threadsafe(_wake, waiter)
+
+    def pop(self):
+        """Return the next queued event or ``None``."""
+        if self.queue:
+            return self.queue.popleft()
+        return None
+
+    async def get(self, timeout=None):
+        """Wait for the next event; return ``None`` if ``timeout`` expires."""
+        event = self.pop()
+        if event is not None:
+            return event
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiter = waiter
+        # Re-check after publishing the waiter so a push racing with us from
+        # another thread is never lost.
+        event = self.pop()
+        if event is not None:
+            self._waiter = None
+            return event
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            self._waiter = None
+            return None
+        return self.pop()
+
+
+class BaseBroker:
+    """Interface for event brokers."""
+
+    def subscribe(self, user_id):
+        raise NotImplementedError
+
+    def unsubscribe(self, subscription):
+        raise NotImplementedError
+
+    def publish(self, user_id, event):
+        raise NotImplementedError
+
+
+class InProcessBroker(BaseBroker):
+    """Fans events out to the subscriptions of this process.
+
+    Subscriptions are kept per user as immutable tuples, so ``publish`` reads a
+    consistent snapshot without taking the lock.
+    """
+
+    def __init__(self, queue_size=None):
+        self.queue_size = queue_size or get_setting('QUEUE_SIZE')
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        subscription = Subscription(user_id, self.queue_size)
+        with self._lock:
+            self._subscribers[user_id] = self._subscribers.get(user_id, ()) + (subscription,)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            remaining = tuple(
+                s for s in self._subscribers.get(subscription.user_id, ()) if s is not subscription
+            )
+            if remaining:
+                self._subscribers[subscription.user_id] = remaining
+            else:
+                self._subscribers.pop(subscription.user_id, None)
+
+    def publish(self, user_id, event):
+        self.deliver(user_id, event)
+
+    def deliver(self, user_id, event):
+        """Push an event to every local subscription of ``user_id``."""
+        for subscription in self._subscribers.get(user_id, ()):
+            subscription.push(event)
+
+    def subscriber_count(self, user_id=None):
+        if user_id is not None:
+            return len(self._subscribers.get(user_id, ()))
+        return sum(len(subs) for subs in self._subscribers.values())
+
+
+class SocketBroker(InProcessBroker):
+    """Fans events out to the subscriptions of every process on the host.
+
+    A process binds a Unix datagram socket, ``<SOCKET_DIR>/<pid>.sock``, when
+    it gets its first subscription, and a daemon thread delivers what arrives
+    on it locally. ``publish`` sends each event to every socket in the
+    directory, its own process's included, so publishing processes without
+    subscribers (WSGI workers) never bind one. Sockets of processes that are
+    gone are removed by the next publish, and an event a receiver has no
+    buffer space for is dropped, like the oldest event of a full queue.
+
+    Where Unix datagram sockets are unavailable (Windows) it only delivers
+    within the process, like ``InProcessBroker``.
+    """
+
+    supported = hasattr(socket, 'AF_UNIX') and os.name == 'posix'
+
+    def __init__(self, queue_size=None, path=None):
+        super().__init__(queue_size)
+        self.path = path or get_setting('SOCKET_DIR')
+        self._listening_pid = None
+        self._sender = None
+
+    def subscribe(self, user_id):
+        if self.supported and self._listening_pid != os.getpid():
+            self._listen()
+        return super().subscribe(user_id)
+
+    def _listen(self):
+        with self._lock:
+            if self._listening_pid == os.getpid():
+                return
+            os.makedirs(self.path, exist_ok=True)
+            address = os.path.join(self.path, f'{os.getpid()}.sock')
+            if os.path.exists(address):
+                # Left by an earlier process with the same pid
+                os.unlink(address)
+            receiver = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            receiver.bind(address)
+            threading.Thread(target=self._receive, args=(receiver,), name='activity-events', daemon=True).start()
+            self._listening_pid = os.getpid()
+
+    def _receive(self, receiver):
+        while True:
+            user_id, event = json.loads(receiver.recv(MAX_DATAGRAM))
+            self.deliver(user_id, event)
+
+    def publish(self, user_id, event):
+        if not self.supported:
+            self.deliver(user_id, event)
+            return
+        try:
+            names = os.listdir(self.path)
+        except FileNotFoundError:
+            return  # No process has subscribers
+        data = json.dumps([user_id, event], separators=(',', ':')).encode('utf-8')
+        if self._sender is None:
+            with self._lock:
+                if self._sender is None:
+                    sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+                    sender.setblocking(False)
+                    self._sender = sender
+        for name in names:
+            if not name.endswith('.sock'):
+                continue
+            address = os.path.join(self.path, name)
+            try:
+                self._sender.sendto(data, address)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Its process is gone
+                try:
+                    os.unlink(address)
+                except FileNotFoundError:
+                    pass
+            except BlockingIOError:
+                pass
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """Return the process-wide broker configured in ``ACTIVITY_EVENTS``."""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(get_setting('BROKER'))()
+    return _broker
+
+
+def reset_broker():
+    """Drop the cached broker (used by tests and settings changes)."""
+    global _broker
+    with _broker_lock:
+        _broker = None
+
+
+def activity_event(event_type, activity, **extra):
+    """Build the compact payload sent to clients for an activity change."""
+    event = {
+        'type': event_type,
+        'activity_id': activity.pk,
+        'activity_type': activity.activity_type,
+        'status': activity.status,
+        'updated_at': activity.updated_at.isoformat() if activity.updated_at else None,
+    }
+    event.update(extra)
+    return event
+
+
+def publish(user_id, event):
+    get_broker().publish(user_id, event)
+
+
+def format_sse(event):
+    """Serialize an event dict as a Server-Sent Events frame."""
+    return f"event: {event['type']}\ndata: {json.dumps(event, separators=(',', ':'))}\n\n"
@@ -0,0 +1,98 @@
+"""
+Sparse fieldsets (``?fields=``) and opt-in expansion (``?expand=``) for activities.
+
+Without either parameter responses keep the full legacy shape. Once a client
+asks for specific fields or expansions, ``user`` is rendered as its id unless
+expanded, ``logs`` are omitted unless expanded, and the queryset only loads
+the columns and relations the response needs.
+"""
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+
+from . import sharding
+
+
+ACTIVITY_FIELDS = (
+    'id', 'user', 'title', 'description', 'activity_type', 'status',
+    'planned_date', 'completed_date', 'duration_minutes', 'calories_burned',
+    'calories_consumed', 'steps_count', 'notes', 'created_at', 'updated_at', 'logs',
+)
+EXPANDABLE_FIELDS = ('user', 'logs')
+
+
+def _split(value):
+    return [part.strip() for part in value.split(',') if part.strip()]
+
+
+def _with_user(queryset):
+    # Users aren't on the activity shards, so fetch them separately there
+    if sharding.is_enabled():
+        return queryset.prefetch_related('user')
+    return queryset.select_related('user')
+
+
+class FieldSelection:
+    """The fields and expansions a client asked for on an activity response."""
+
+    def __init__(self, fields=None, expand=(), sparse=True):
+        self.fields = fields
+        self.expand = frozenset(expand)
+        self.sparse = sparse
+
+    @classmethod
+    def from_request(cls, request):
+        params = request.query_params if hasattr(request, 'query_params') else request.GET
+        fields = params.get('fields')
+        expand = params.get('expand')
+        if fields is None and expand is None:
+            return cls.legacy()
+
+        errors = {}
+        selected = None
+        if fields is not None:
+            selected = _split(fields)
+            unknown = [name for name in selected if name not in ACTIVITY_FIELDS]
+            if unknown:
+                errors['fields'] = [f"Unknown field: {name}" for name in unknown]
+        expanded = _split(expand or '')
+        unknown = [name for name in expanded if name not in EXPANDABLE_FIELDS]
+        if unknown:
+            errors['expand'] = [f"Cannot expand: {name}" for name in unknown]
+        if errors:
+            raise ValidationError(errors)
+        return cls(selected, expanded)
+
+    @classmethod
+    def legacy(cls):
+        return cls(None, EXPANDABLE_FIELDS, sparse=False)
+
+    @property
+    def field_names(self):
+        """Serializer fields to render, in declaration order."""
+        requested = set(self.fields) if self.fields is not None else set(ACTIVITY_FIELDS) - {'logs'}
+        requested |= self.expand
+        requested.add('id')
+        return [name for name in ACTIVITY_FIELDS if name in requested]
+
+    def apply(self, queryset):
+        """Restrict ``queryset`` to the columns and relations this selection renders."""
+        if not self.sparse:
+            return _with_user(queryset).prefetch_related('logs')
+
+        names = self.field_names
+        queryset = queryset.only(*[name for name in names if name != 'logs'])
+        if 'user' in self.expand:
+            queryset = _with_user(queryset)
+        if 'logs' in names:
+            queryset = queryset.prefetch_related('logs')
+        return queryset
+
+    def filter_serializer_fields(self, fields):
+        """Drop unrequested fields and collapse ``user`` to its id unless expanded."""
+        if not self.sparse:
+            return fields
+        names = self.field_names
+        selected = {name: fields[name] for name in names if name in fields}
+        if 'user' in selected and 'user' not in self.expand:
+            selected['user'] = serializers.PrimaryKeyRelatedField(read_only=True)
+        return selected
@@ -0,0 +1,28 @@
+import django_filters
+
+from .models import Activity
+
+
+class ChoiceInFilter(django_filters.BaseInFilter, django_filters.ChoiceFilter):
+    """Accepts one choice or a comma-separated list, e.g. ?status=planned,in_progress"""
+
+
+class ActivityFilter(django_filters.FilterSet):
+    """Filters for the activity list.
+
+    Every lookup here is served by one of the (user, ...) indexes declared on
+    ``Activity.Meta``; add a matching index when adding a filter.
+    """
+    activity_type = ChoiceInFilter(field_name='activity_type', lookup_expr='in', choices=Activity.ACTIVITY_TYPES)
+    status = ChoiceInFilter(field_name='status', lookup_expr='in', choices=Activity.STATUS_CHOICES)
+
+    class Meta:
+        model = Activity
+        fields = {
+            'planned_date': ['gte', 'lte'],
+            'completed_date': ['gte', 'lte'],
+            'created_at': ['gte', 'lte'],
+            'duration_minutes': ['gte', 'lte'],
+            'calories_burned': ['gte', 'lte'],
+            'steps_count': ['gte', 'lte'],
+        }
@@ -0,0 +1,297 @@
+"""
+Event-sourced activity history and point-in-time reads.
+
+Every save of an ``Activity`` appends an ``ActivityEvent`` holding only the
+fields that changed (the full state on creation), and every
+``ACTIVITY_HISTORY['SNAPSHOT_EVERY']`` versions an ``ActivitySnapshot`` of the
+whole row. ``reconstruct()`` rebuilds activities as they were at a moment by
+loading the latest snapshot taken before it and replaying the few events
+after it, so the cost per activity stays under ``SNAPSHOT_EVERY`` events
+however long the history is.
+
+Rows that predate history get a baseline snapshot of their stored state the
+first time they change. Until then their current state is the best answer
+for any moment after their creation.
+"""
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import OuterRef, Q, Subquery
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+
+from .models import Activity, ActivityEvent, ActivitySnapshot
+
+
+DEFAULTS = {
+    'SNAPSHOT_EVERY': 20,
+}
+
+# Columns that make up a snapshot; the tombstone flag is recorded as a deletion
+STATE_FIELDS = [field for field in Activity._meta.concrete_fields if field.attname != 'deleted']
+# Columns whose changes events record; the rest are identity or bookkeeping
+TRACKED_FIELDS = [
+    field for field in STATE_FIELDS
+    if field.attname not in ('id', 'user_id', 'version', 'created_at', 'updated_at')
+]
+
+_paused = contextvars.ContextVar('activity_history_paused', default=False)
+
+
+def get_setting(name):
+    return getattr(settings, 'ACTIVITY_HISTORY', {}).get(name, DEFAULTS[name])
+
+
+@contextmanager
+def paused():
+    """Don't record history in this block, e.g. while rows move between shards."""
+    token = _paused.set(True)
+    try:
+        yield
+    finally:
+        _paused.reset(token)
+
+
+def is_paused():
+    return _paused.get()
+
+
+def state_of(activity):
+    return {field.attname: getattr(activity, field.attname) for field in STATE_FIELDS}
+
+
+def _changed_fields(activity):
+    loaded = getattr(activity, '_loaded_values', None)
+    if loaded is None:
+        return TRACKED_FIELDS
+    return [
+        field for field in TRACKED_FIELDS
+        # Also fields that were deferred when loading but assigned since
+        if (field.attname in loaded and loaded[field.attname] != getattr(activity, field.attname))
+        or (field.attname not in loaded and field.attname in activity.__dict__)
+    ]
+
+
+def record_save(activity, created):
+    """Append the event for a save of ``activity``, and a snapshot when one is due."""
+    if is_paused():
+        return
+    using = activity._state.db
+    loaded = getattr(activity, '_loaded_values', None)
+    if created:
+        kind, changed = ActivityEvent.CREATED, STATE_FIELDS
+    else:
+        kind, changed = ActivityEvent.UPDATED, _changed_fields(activity)
+        if loaded is not None and loaded.get('version') == 0 and all(
+            field.attname in loaded for field in STATE_FIELDS
+        ):
+            # First change since history started: keep what the row held until now
+            ActivitySnapshot.objects.using(using).create(
+                activity_id=activity.pk, user_id=activity.user_id, version=0,
+                state={field.attname: loaded[field.attname] for field in STATE_FIELDS},
+                taken_at=loaded['updated_at'],
+            )
+    if changed:
+        ActivityEvent.objects.using(using).create(
+            activity_id=activity.pk, user_id=activity.user_id, version=activity.version, kind=kind,
+            changes={field.attname: getattr(activity, field.attname) for field in changed},
+            created_at=activity.updated_at,
+        )
+    if activity.version % get_setting('SNAPSHOT_EVERY') == 0:
+        ActivitySnapshot.objects.using(using).create(
+            activity_id=activity.pk, user_id=activity.user_id, version=activity.version,
+            state=state_of(activity), taken_at=activity.updated_at,
+        )
+    activity._loaded_values = state_of(activity)
+
+
+def record_deletion(activity, at=None):
+    """Append the event marking ``activity`` as deleted (or queued for deletion)."""
+    if is_paused():
+        return
+    ActivityEvent.objects.using(activity._state.db).create(
+        activity_id=activity.pk, user_id=activity.user_id, version=activity.version + 1,
+        kind=ActivityEvent.DELETED, changes={'created_at': activity.created_at},
+        created_at=at or timezone.now(),
+    )
+
+
+def record_deletions(activities, at):
+    """``record_deletion()`` for many activities at once, in one insert."""
+    if is_paused() or not activities:
+        return
+    # sharding records moves through this module, so it is imported late
+    from . import sharding
+
+    deletions = [
+        ActivityEvent(
+            activity_id=activity.pk, user_id=activity.user_id, version=activity.version + 1,
+            kind=ActivityEvent.DELETED, changes={'created_at': activity.created_at}, created_at=at,
+        )
+        for activity in activities
+    ]
+    if sharding.is_enabled():
+        first_id = sharding.allocators[ActivityEvent].reserve(len(deletions))
+        for offset, event in enumerate(deletions):
+            event.id = first_id + offset
+    ActivityEvent.objects.using(activities[0]._state.db).bulk_create(deletions)
+
+
+def purge_user(user_id, using, batch_size, on_batch=None):
+    """Delete a user's events and snapshots, ``batch_size`` rows per transaction.
+
+    ``on_batch`` is called with the running total after each batch. Returns
+    how many rows went.
+    """
+    removed = 0
+    for model in (ActivityEvent, ActivitySnapshot):
+        rows = model.objects.using(using).filter(user_id=user_id)
+        while True:
+            ids = list(rows.order_by().values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            with transaction.atomic(using=using):
+                removed += model.objects.using(using).filter(id__in=ids).delete()[0]
+            if on_batch is not None:
+                on_batch(removed)
+    return removed
+
+
+def parse_as_of(value):
+    """``?as_of=`` as an aware datetime; a bare date means the end of that day."""
+    try:
+        # Dates first: parse_datetime() reads a bare date as its midnight
+        day = parse_date(value)
+        moment = parse_datetime(value) if day is None else None
+    except ValueError:
+        day = moment = None
+    if day is not None:
+        moment = datetime.combine(day + timedelta(days=1), time.min) - timedelta(microseconds=1)
+    if moment is None:
+        raise ValidationError({'as_of': ['Expected an ISO 8601 date or datetime']})
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def _load_state(state):
+    values = {}
+    for field in STATE_FIELDS:
+        if field.attname in state:
+            values[field.attname] = field.to_python(state[field.attname])
+    return values
+
+
+def _apply(state, event):
+    if event.kind == ActivityEvent.DELETED:
+        return None
+    if event.kind == ActivityEvent.CREATED:
+        return _load_state(event.changes)
+    if state is None:
+        return None
+    state = {**state, **_load_state(event.changes)}
+    state['version'] = event.version
+    state['updated_at'] = event.created_at
+    return state
+
+
+def _instance(state, using):
+    activity = Activity(**state)
+    activity._state.adding = False
+    activity._state.db = using
+    return activity
+
+
+def reconstruct(activity_ids, as_of, using=None):
+    """Activities in ``activity_ids`` as they were at ``as_of``, keyed by id.
+
+    Activities that didn't exist then, or were deleted by then, are left out.
+    Runs one query for snapshots and one for events, however long the history is.
+    """
+    activity_ids = list(activity_ids)
+    if not activity_ids:
+        return {}
+    # The latest snapshot at or before as_of of each activity, each found
+    # through the (activity, taken_at) index
+    latest_id = ActivitySnapshot.objects.filter(
+        activity_id=OuterRef('activity_id'), taken_at__lte=as_of
+    ).order_by('-taken_at', '-version', '-id').values('id')[:1]
+    snapshots = ActivitySnapshot.objects.using(using).filter(
+        activity_id__in=activity_ids, taken_at__lte=as_of, id=Subquery(latest_id)
+    )
+    latest = {snapshot.activity_id: snapshot for snapshot in snapshots}
+
+    after_snapshot = Q()
+    for activity_id in activity_ids:
+        version = latest[activity_id].version if activity_id in latest else -1
+        after_snapshot |= Q(activity_id=activity_id, version__gt=version)
+    events = ActivityEvent.objects.using(using).filter(after_snapshot, created_at__lte=as_of).order_by(
+        'activity_id', 'version', 'id'
+    )
+    replay = {}
+    for event in events:
+        replay.setdefault(event.activity_id, []).append(event)
+
+    states = {}
+    unresolved = []
+    for activity_id in activity_ids:
+        if activity_id not in latest and activity_id not in replay:
+            unresolved.append(activity_id)
+            continue
+        state = _load_state(latest[activity_id].state) if activity_id in latest else None
+        for event in replay.get(activity_id, ()):
+            state = _apply(state, event)
+        if state is not None:
+            states[activity_id] = state
+
+    if unresolved:
+        states.update(_unrecorded_states(unresolved, as_of, using))
+    return {activity_id: _instance(state, using) for activity_id, state in states.items()}
+
+
+def _unrecorded_states(activity_ids, as_of, using):
+    """Best known state of activities with no history before ``as_of``.
+
+    Either they predate history and changed only later (the baseline snapshot
+    holds their state before that), or they never changed since (the row does).
+    """
+    states = {}
+    baselines = ActivitySnapshot.objects.using(using).filter(activity_id__in=activity_ids, version=0)
+    for baseline in baselines:
+        states[baseline.activity_id] = _load_state(baseline.state)
+    current = Activity.objects.using(using).filter(id__in=[i for i in activity_ids if i not in states])
+    for activity in current:
+        states[activity.id] = state_of(activity)
+    return {
+        activity_id: state for activity_id, state in states.items()
+        if state['created_at'] <= as_of
+    }
+
+
+def ids_as_of(activities, user, as_of):
+    """Ids of ``user``'s activities that existed at ``as_of``, newest first.
+
+    ``activities`` is the user's queryset including tombstoned rows. Deleted
+    activities come from their deletion events, so this stays one pass over
+    the user's ids plus their deletions.
+    """
+    using = activities.db
+    deletions = ActivityEvent.objects.using(using).filter(user=user, kind=ActivityEvent.DELETED)
+    deleted_before = set(deletions.filter(created_at__lte=as_of).values_list('activity_id', flat=True))
+    rows = [
+        (created_at, activity_id)
+        for activity_id, created_at in activities.filter(created_at__lte=as_of).values_list('id', 'created_at')
+        if activity_id not in deleted_before
+    ]
+    present = {activity_id for _, activity_id in rows}
+    for activity_id, changes in deletions.filter(created_at__gt=as_of).values_list('activity_id', 'changes'):
+        created_at = parse_datetime(changes.get('created_at') or '')
+        if activity_id not in present and activity_id not in deleted_before and created_at and created_at <= as_of:
+            rows.append((created_at, activity_id))
+            present.add(activity_id)
+    rows.sort(reverse=True)
+    return [activity_id for _, activity_id in rows]
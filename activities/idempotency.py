@@ -0,0 +1,163 @@
+"""
+Idempotency-Key support for retried POST requests.
+
+The first request with a given key claims it by inserting an
+``IdempotencyKey`` row; the unique constraint on (user, key) makes exactly one
+concurrent request the winner. Its response is stored on the row and replayed
+for later requests with the same key and payload, without running the view.
+
+A claim whose request never finished (the worker was killed mid-request) is
+taken over by a retry once it is older than ``IDEMPOTENCY_KEY_LEASE_SECONDS``,
+a few request timeouts; until then retries get ``409``. Only the request
+holding the current claim stores its response.
+"""
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+# Response headers stored and replayed with the body
+REPLAYED_HEADERS = ('Location',)
+
+
+def get_ttl():
+    return timedelta(hours=getattr(settings, 'IDEMPOTENCY_KEY_TTL_HOURS', 24))
+
+
+def get_lease():
+    return timedelta(seconds=getattr(settings, 'IDEMPOTENCY_KEY_LEASE_SECONDS', 120))
+
+
+def request_fingerprint(request):
+    """Hash of the parts of a request that must match for a replay."""
+    body = json.dumps(request.data, sort_keys=True, separators=(',', ':'), default=str)
+    raw = f"{request.method}\n{request.path}\n{body}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _claim(user, key, fingerprint):
+    """Insert the key row, or take over a stale in-flight one; return it, or the
+    existing row if another request owns the key."""
+    now = timezone.now()
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                record = IdempotencyKey.objects.create(
+                    user=user, key=key, fingerprint=fingerprint, claimed_at=now, expires_at=now + get_ttl()
+                )
+            return record, True
+        except IntegrityError:
+            record = IdempotencyKey.objects.filter(user=user, key=key).first()
+            if record is None:
+                continue
+            if record.expires_at <= now:
+                # Expired but not purged yet: evict it and claim again
+                IdempotencyKey.objects.filter(pk=record.pk, expires_at__lte=now).delete()
+                continue
+            if record.status_code is None and record.claimed_at <= now - get_lease():
+                # Its request died without finishing; whoever moves claimed_at first runs it again
+                taken = IdempotencyKey.objects.filter(
+                    pk=record.pk, status_code__isnull=True, claimed_at=record.claimed_at
+                ).update(fingerprint=fingerprint, claimed_at=now, expires_at=now + get_ttl())
+                if not taken:
+                    continue
+                record.fingerprint, record.claimed_at, record.expires_at = fingerprint, now, now + get_ttl()
+                return record, True
+            return record, False
+    return None, False
+
+
+def _replay(record, fingerprint):
+    if record.status_code is None:
+        return Response(
+            {'error': 'A request with this Idempotency-Key is still being processed'},
+            status=status.HTTP_409_CONFLICT,
+            headers={'Retry-After': '1'}
+        )
+    if record.fingerprint != fingerprint:
+        return Response(
+            {'error': 'Idempotency-Key was already used with a different request'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+    return Response(
+        record.response_body,
+        status=record.status_code,
+        headers={**(record.response_headers or {}), 'Idempotent-Replayed': 'true'}
+    )
+
+
+def _owned(record):
+    """``record``'s row, unless a retry has taken its claim over since."""
+    return IdempotencyKey.objects.filter(pk=record.pk, claimed_at=record.claimed_at)
+
+
+def idempotent_response(request, handler):
+    """Run ``handler`` at most once per (user, Idempotency-Key) and replay its result."""
+    key = request.headers.get(HEADER)
+    if not key:
+        return handler()
+    if len(key) > MAX_KEY_LENGTH:
+        return Response(
+            {'error': f'{HEADER} must be at most {MAX_KEY_LENGTH} characters'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    fingerprint = request_fingerprint(request)
+    record, claimed = _claim(request.user, key, fingerprint)
+    if record is None:
+        return Response(
+            {'error': 'Could not claim Idempotency-Key, please retry'},
+            status=status.HTTP_409_CONFLICT,
+            headers={'Retry-After': '1'}
+        )
+    if not claimed:
+        return _replay(record, fingerprint)
+
+    try:
+        response = handler()
+    except Exception:
+        _owned(record).delete()
+        raise
+
+    if response.status_code >= 500:
+        # Let the client retry server errors with the same key
+        _owned(record).delete()
+    else:
+        _owned(record).update(
+            status_code=response.status_code,
+            response_body=response.data,
+            response_headers={name: response[name] for name in REPLAYED_HEADERS if response.has_header(name)},
+        )
+    return response
+
+
+def idempotent(view_func):
+    """Decorator for DRF views and view methods taking ``request`` first."""
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        return idempotent_response(request, lambda: view_func(request, *args, **kwargs))
+    return wrapper
+
+
+def purge_expired_keys(batch_size=1000):
+    """Delete expired keys in bounded batches; return the number removed."""
+    removed = 0
+    now = timezone.now()
+    while True:
+        ids = list(
+            IdempotencyKey.objects.filter(expires_at__lte=now).values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return removed
+        removed += IdempotencyKey.objects.filter(id__in=ids).delete()[0]
@@ -0,0 +1,83 @@
+import json
+import os
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.forms.models import model_to_dict
+
+from jobs.queue import PermanentJobError, job
+from . import history
+from .models import ActivityLog
+from .retention import archived_history
+from .sharding import activities_for, delete_in_batches
+
+
+EXPORT_BATCH_SIZE = 500
+
+
+def export_path(job_id):
+    return os.path.join(settings.ACTIVITY_EXPORT_DIR, f'activities-{job_id}.jsonl')
+
+
+@job('activities.export', concurrency=2)
+def export_activities(job):
+    """Write the user's activities, with their status logs, as JSON lines."""
+    if job.user is None:
+        raise PermanentJobError('The user no longer exists')
+    activities = activities_for(job.user).order_by('id')
+    total = activities.count()
+    job.report_progress(0, total, 'Exporting activities')
+
+    os.makedirs(settings.ACTIVITY_EXPORT_DIR, exist_ok=True)
+    path = export_path(job.pk)
+    # Written under a temporary name so a retried job never serves a partial file
+    partial = f'{path}.partial'
+    done = 0
+    last_id = 0
+    with open(partial, 'w') as output:
+        while True:
+            # Keyset pagination keeps each batch an index range scan
+            batch = list(activities.filter(id__gt=last_id)[:EXPORT_BATCH_SIZE])
+            if not batch:
+                break
+            logs = defaultdict(list)
+            log_rows = ActivityLog.objects.db_manager(activities.db).filter(
+                activity_id__in=[activity.id for activity in batch]
+            ).order_by('created_at', 'id')
+            for log in log_rows:
+                logs[log.activity_id].append(model_to_dict(log, exclude=['activity']) | {'created_at': log.created_at})
+            archived = archived_history([activity.id for activity in batch], using=activities.db)
+            for activity in batch:
+                row = model_to_dict(activity, exclude=['user', 'deleted'])
+                row.update(
+                    created_at=activity.created_at, updated_at=activity.updated_at, logs=logs[activity.id],
+                    archived_logs=archived[activity.id]['logs'], archived_summaries=archived[activity.id]['summaries'],
+                )
+                output.write(json.dumps(row, cls=DjangoJSONEncoder) + '\n')
+            done += len(batch)
+            last_id = batch[-1].id
+            job.report_progress(done)
+    os.replace(partial, path)
+    return {'file': os.path.basename(path), 'activities': done}
+
+
+@job('activities.bulk_delete')
+def delete_activities(job):
+    """Delete activities tombstoned by a bulk delete request, in small transactions."""
+    if job.user is None:
+        # The account deletion removed them along with the user
+        return {'deleted': len(job.payload['activity_ids'])}
+    ids = job.payload['activity_ids']
+    batch_size = settings.DELETION_BATCH_SIZE
+    chunks = [ids[start:start + batch_size] for start in range(0, len(ids), batch_size)]
+    tombstoned = activities_for(job.user, for_write=True, include_deleted=True).filter(deleted=True)
+    # A retry resumes: rows deleted by the earlier attempt are gone
+    done = len(ids) - sum(tombstoned.filter(id__in=chunk).count() for chunk in chunks)
+    job.report_progress(done, len(ids), 'Deleting activities')
+    # Their deletion was recorded in the history when they were tombstoned
+    with history.paused():
+        for chunk in chunks:
+            done += delete_in_batches(tombstoned.filter(id__in=chunk), batch_size)
+            job.report_progress(done)
+    return {'deleted': done}
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from activities import retention
+
+
+class Command(BaseCommand):
+    help = (
+        'Move activity status logs older than the retention period into the '
+        'compact archive table, in batches. Run it daily, e.g. from cron.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='archive logs older than this many days')
+        parser.add_argument('--policy', choices=retention.POLICIES,
+                            help='keep compressed logs (archive) or only transition counts (summarize)')
+        parser.add_argument('--batch-size', type=int, help='logs per transaction')
+        parser.add_argument('--database', help='only this database alias (default: every activity shard)')
+
+    def handle(self, *args, **options):
+        if options['days'] is not None and options['days'] < 0:
+            raise CommandError('--days must not be negative')
+        totals = retention.archive_logs(
+            days=options['days'],
+            policy=options['policy'],
+            batch_size=options['batch_size'],
+            using=options['database'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {totals["logs"]} logs into {totals["archives"]} archive rows'
+        ))
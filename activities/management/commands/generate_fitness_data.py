@@ -0,0 +1,46 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from activities.datagen import generate
+
+
+class Command(BaseCommand):
+    help = (
+        'Create synthetic users, activities and status logs for load testing. '
+        'The same --seed, --end-date and --chunk-size give the same data.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--activities-per-user', type=int, default=100,
+                            help='mean number of activities per user')
+        parser.add_argument('--days', type=int, default=365, help='days of history before --end-date')
+        parser.add_argument('--end-date', type=date.fromisoformat, help='YYYY-MM-DD, defaults to today')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--workers', type=int, default=1, help='processes generating chunks in parallel')
+        parser.add_argument('--chunk-size', type=int, default=100, help='users per chunk')
+        parser.add_argument('--batch-size', type=int, default=5000, help='activities per insert transaction')
+        parser.add_argument('--password', default='password123', help='password of every generated user')
+        parser.add_argument('--username-prefix', default='gen')
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['activities_per_user'] < 0:
+            raise CommandError('--users must be positive and --activities-per-user not negative')
+
+        def progress(totals):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{totals["users"]} users, {totals["activities"]} activities, '
+                                  f'{totals["logs"]} logs')
+
+        totals, elapsed = generate(
+            options['users'], options['activities_per_user'], seed=options['seed'], days=options['days'],
+            end=options['end_date'], workers=options['workers'], chunk_size=options['chunk_size'],
+            batch_size=options['batch_size'], password=options['password'],
+            username_prefix=options['username_prefix'], progress=progress,
+        )
+        rows = sum(totals.values())
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {totals["users"]} users, {totals["activities"]} activities and {totals["logs"]} logs '
+            f'in {elapsed:.1f}s ({rows / max(elapsed, 1e-6):,.0f} rows/s)'
+        ))
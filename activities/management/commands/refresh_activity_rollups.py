@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from activities import rollups
+
+
+class Command(BaseCommand):
+    help = (
+        'Update the weekly and monthly activity rollups behind the stats '
+        'endpoint with the changes since the last run. Run it every few '
+        'minutes, e.g. from cron.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='rebuild every rollup, e.g. after loading activities in bulk')
+        parser.add_argument('--batch-size', type=int, help='changed activities looked up per query')
+        parser.add_argument('--database', help='only this database alias (default: every activity shard)')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] is not None and options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        totals = rollups.refresh(
+            full=options['full'],
+            using=options['database'],
+            batch_size=options['batch_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Refreshed {totals["rollups"]} rollups for {totals["users"]} users'
+        ))
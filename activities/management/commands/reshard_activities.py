@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from activities import sharding
+from activities.models import Activity, ShardAssignment
+
+
+class Command(BaseCommand):
+    help = (
+        'Move users\' activities between shards while the API keeps serving. '
+        'Use --adopt ALIAS once when enabling sharding on existing data, then '
+        '--rebalance after changing ACTIVITY_SHARDS.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--adopt', metavar='ALIAS',
+                            help='record ALIAS as the shard of every unassigned user with activities there')
+        parser.add_argument('--rebalance', action='store_true',
+                            help='move every user whose shard differs from the hash ring placement')
+        parser.add_argument('--user', type=int, action='append', default=[], help='user id to move (repeatable)')
+        parser.add_argument('--to', metavar='ALIAS', help='target shard for --user')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--grace-seconds', type=float, default=2.0,
+                            help='how long to wait for in-flight writes before the final catch-up')
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        shards = sharding.get_shards()
+        if not shards:
+            raise CommandError('Sharding is disabled: ACTIVITY_SHARDS is empty')
+        for alias in filter(None, [options['adopt'], options['to']]):
+            if alias not in shards:
+                raise CommandError(f'{alias} is not in ACTIVITY_SHARDS ({", ".join(shards)})')
+
+        if options['adopt']:
+            self.adopt(options['adopt'], options['dry_run'])
+        if options['user']:
+            if not options['to']:
+                raise CommandError('--user requires --to')
+            for user_id in options['user']:
+                self.move(user_id, options['to'], options)
+        if options['rebalance']:
+            for assignment in ShardAssignment.objects.filter(moving=False).iterator():
+                target = sharding.ring_shard(assignment.user_id)
+                if target != assignment.alias:
+                    self.move(assignment.user_id, target, options)
+
+    def adopt(self, alias, dry_run):
+        assigned = ShardAssignment.objects.values_list('user_id', flat=True)
+        user_ids = set(
+            Activity.objects.using(alias).exclude(user_id__in=list(assigned))
+            .values_list('user_id', flat=True).distinct()
+        )
+        if not dry_run:
+            ShardAssignment.objects.bulk_create(
+                [ShardAssignment(user_id=user_id, alias=alias) for user_id in user_ids],
+                ignore_conflicts=True
+            )
+        self.stdout.write(f'Adopted {len(user_ids)} users on {alias}')
+
+    def move(self, user_id, target, options):
+        if options['dry_run']:
+            self.stdout.write(f'Would move user {user_id} to {target}')
+            return
+        moved = sharding.move_user(
+            user_id, target, batch_size=options['batch_size'], grace_seconds=options['grace_seconds']
+        )
+        self.stdout.write(self.style.SUCCESS(f'Moved {moved} activities of user {user_id} to {target}'))
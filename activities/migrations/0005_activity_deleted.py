@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 20:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0004_activity_sharding'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activity',
+            name='deleted',
+            field=models.BooleanField(default=False),
+        ),
+    ]
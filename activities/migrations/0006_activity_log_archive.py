@@ -0,0 +1,42 @@
+# Generated by Django 4.2.7 on 2026-10-19 20:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0005_activity_deleted'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityLogArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('log_count', models.PositiveIntegerField()),
+                ('transitions', models.JSONField(default=dict)),
+                ('first_logged_at', models.DateTimeField()),
+                ('last_logged_at', models.DateTimeField()),
+                ('entries', models.BinaryField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['first_logged_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='activitylog',
+            index=models.Index(fields=['activity', 'created_at'], name='log_activity_created_idx'),
+        ),
+        migrations.AddField(
+            model_name='activitylogarchive',
+            name='activity',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='log_archives', to='activities.activity'),
+        ),
+        migrations.AddIndex(
+            model_name='activitylogarchive',
+            index=models.Index(fields=['activity', 'first_logged_at'], name='logarchive_activity_idx'),
+        ),
+    ]
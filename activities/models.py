@@ -1,5 +1,7 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 
 class Activity(models.Model):
@@ -19,7 +21,11 @@ class Activity(models.Model):
         ('cancelled', 'Cancelled'),
     ]
     
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='activities')
+    # Indexed through the composite (user, ...) indexes in Meta. No database
+    # constraint: with sharding the users table lives on another database.
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='activities', db_index=False, db_constraint=False
+    )
     title = models.CharField(max_length=200)
     description = models.TextField(blank=True, null=True)
     activity_type = models.CharField(max_length=20, choices=ACTIVITY_TYPES)
@@ -31,21 +37,49 @@ class Activity(models.Model):
     calories_consumed = models.PositiveIntegerField(blank=True, null=True)
     steps_count = models.PositiveIntegerField(blank=True, null=True)
     notes = models.TextField(blank=True, null=True)
+    # Tombstone: set when the activity is queued for deletion, which hides it
+    # from the API until a background job removes the row
+    deleted = models.BooleanField(default=False)
+    # Bumped by every save; numbers this activity's ActivityEvent rows
+    version = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['-created_at']
         verbose_name_plural = 'Activities'
+        # All list queries are scoped to one user, so each index leads with
+        # user_id and matches one filter/ordering of ActivityFilter.
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='activity_user_created_idx'),
+            models.Index(fields=['user', '-updated_at'], name='activity_user_updated_idx'),
+            models.Index(fields=['user', 'planned_date'], name='activity_user_planned_idx'),
+            models.Index(fields=['user', 'completed_date'], name='activity_user_completed_idx'),
+            models.Index(fields=['user', 'status', 'planned_date'], name='activity_user_status_idx'),
+            models.Index(fields=['user', 'activity_type', 'planned_date'], name='activity_user_type_idx'),
+            models.Index(fields=['user', 'duration_minutes'], name='activity_user_duration_idx'),
+            models.Index(fields=['user', 'calories_burned'], name='activity_user_calories_idx'),
+            models.Index(fields=['user', 'steps_count'], name='activity_user_steps_idx'),
+        ]
     
     def __str__(self):
         return f"{self.title} - {self.get_status_display()}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The stored values, so history only records the fields a save changes
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+    
     def save(self, *args, **kwargs):
         # If status is completed and completed_date is not set, set it to now
         if self.status == 'completed' and not self.completed_date:
             from django.utils import timezone
             self.completed_date = timezone.now()
+        self.version += 1
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'version', 'updated_at'}
         super().save(*args, **kwargs)
 
 
@@ -59,6 +93,189 @@ class ActivityLog(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Inline logs per activity, and the retention scan for old logs
+            models.Index(fields=['activity', 'created_at'], name='log_activity_created_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.activity.title} - {self.old_status} to {self.new_status}"
+
+
+class ActivityLogArchive(models.Model):
+    """Status logs moved out of ActivityLog by ``archive_activity_logs``.
+    
+    One row per activity per archiving batch. ``entries`` holds the logs as
+    zlib-compressed JSON; under the ``summarize`` policy it is empty and only
+    the counts survive.
+    """
+    activity = models.ForeignKey(Activity, on_delete=models.CASCADE, related_name='log_archives')
+    log_count = models.PositiveIntegerField()
+    # "old_status>new_status" -> number of such changes
+    transitions = models.JSONField(default=dict)
+    first_logged_at = models.DateTimeField()
+    last_logged_at = models.DateTimeField()
+    entries = models.BinaryField(blank=True, null=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['first_logged_at']
+        indexes = [
+            models.Index(fields=['activity', 'first_logged_at'], name='logarchive_activity_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.activity_id}: {self.log_count} logs until {self.last_logged_at:%Y-%m-%d}"
+
+
+class ActivityEvent(models.Model):
+    """One change to an activity: the fields a save set, or its creation or deletion.
+    
+    Kept after the activity is deleted so past states can still be rebuilt,
+    hence no database-level foreign keys.
+    """
+    CREATED = 'created'
+    UPDATED = 'updated'
+    DELETED = 'deleted'
+    KIND_CHOICES = [
+        (CREATED, 'Created'),
+        (UPDATED, 'Updated'),
+        (DELETED, 'Deleted'),
+    ]
+    
+    activity = models.ForeignKey(
+        Activity, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, related_name='events'
+    )
+    user = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, related_name='+')
+    version = models.PositiveIntegerField()
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    # New values of the changed fields; the whole state for CREATED
+    changes = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField()
+    
+    class Meta:
+        # By the column: ordering by the relation would join away deleted activities
+        ordering = ['activity_id', 'version', 'id']
+        indexes = [
+            models.Index(fields=['activity', 'version'], name='activityevent_version_idx'),
+            models.Index(fields=['user', 'kind', 'created_at'], name='activityevent_user_kind_idx'),
+            # Changes since the last rollup refresh
+            models.Index(fields=['created_at'], name='activityevent_created_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.activity_id} v{self.version} {self.kind}"
+
+
+class ActivitySnapshot(models.Model):
+    """An activity's full state as of event ``version``, replayed from by ``?as_of=``"""
+    activity = models.ForeignKey(
+        Activity, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, related_name='snapshots'
+    )
+    user = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, related_name='+')
+    version = models.PositiveIntegerField()
+    state = models.JSONField(encoder=DjangoJSONEncoder)
+    # When this state became current
+    taken_at = models.DateTimeField()
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['activity', 'taken_at'], name='activitysnapshot_taken_idx'),
+            models.Index(fields=['user'], name='activitysnapshot_user_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.activity_id} v{self.version} at {self.taken_at:%Y-%m-%d %H:%M}"
+
+
+class ActivityRollup(models.Model):
+    """Totals of a user's activities created in one week or month.
+    
+    Maintained by ``refresh_activity_rollups``, so stats over many periods
+    read one row per period instead of every activity.
+    """
+    WEEK = 'week'
+    MONTH = 'month'
+    PERIOD_CHOICES = [
+        (WEEK, 'Week'),
+        (MONTH, 'Month'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, related_name='+')
+    period = models.CharField(max_length=5, choices=PERIOD_CHOICES)
+    # Monday of the week, or the first of the month
+    start = models.DateField()
+    activity_count = models.PositiveIntegerField(default=0)
+    completed_count = models.PositiveIntegerField(default=0)
+    planned_count = models.PositiveIntegerField(default=0)
+    in_progress_count = models.PositiveIntegerField(default=0)
+    calories_burned = models.PositiveBigIntegerField(default=0)
+    calories_consumed = models.PositiveBigIntegerField(default=0)
+    steps = models.PositiveBigIntegerField(default=0)
+    duration_minutes = models.PositiveBigIntegerField(default=0)
+    # activity_type -> number of activities
+    activities_by_type = models.JSONField(default=dict)
+    refreshed_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        constraints = [
+            # Also the index for reading a user's periods in order
+            models.UniqueConstraint(fields=['user', 'period', 'start'], name='unique_rollup_per_period'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user_id} {self.period} of {self.start}"
+
+
+class RollupCheckpoint(models.Model):
+    """How far ``refresh_activity_rollups`` has read a database's activity events"""
+    database = models.CharField(max_length=100, primary_key=True)
+    refreshed_until = models.DateTimeField()
+    
+    def __str__(self):
+        return f"{self.database}: {self.refreshed_until:%Y-%m-%d %H:%M:%S}"
+
+
+class IdempotencyKey(models.Model):
+    """Stored outcome of a request sent with an Idempotency-Key header"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    # Null while the first request with this key is still being processed
+    status_code = models.PositiveSmallIntegerField(blank=True, null=True)
+    response_body = models.JSONField(blank=True, null=True, encoder=DjangoJSONEncoder)
+    # Replayed with the response, e.g. the Location of a queued job
+    response_headers = models.JSONField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # When the request processing it started; a stale claim can be taken over
+    claimed_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField(db_index=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_idempotency_key_per_user'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user_id}:{self.key}"
+
+
+class ShardAssignment(models.Model):
+    """Which activity shard holds a user's Activity and ActivityLog rows"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    alias = models.CharField(max_length=100)
+    # Set while reshard_activities copies the user to another shard; writes are refused
+    moving = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.user_id} -> {self.alias}"
+
+
+class ShardSequence(models.Model):
+    """Global id counter so rows keep unique ids across shards and moves"""
+    name = models.CharField(max_length=100, primary_key=True)
+    next_value = models.BigIntegerField()
     
     def __str__(self):
-        return f"{self.activity.title} - {self.old_status} to {self.new_status}"
\ No newline at end of file
+        return f"{self.name}: {self.next_value}"
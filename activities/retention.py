@@ -0,0 +1,144 @@
+"""
+Retention of activity status logs.
+
+``ActivityLog`` gains a row for every status change, so ``archive_activity_logs``
+periodically moves logs older than ``ACTIVITY_LOG_RETENTION['DAYS']`` out of
+it, ``BATCH_SIZE`` logs per transaction. Each batch becomes one
+``ActivityLogArchive`` row per activity holding, depending on ``POLICY``:
+
+* ``archive``: the logs themselves, as zlib-compressed JSON, plus counts
+* ``summarize``: only the counts of each status transition and the time span
+
+API responses keep showing the remaining (recent) logs inline; the archived
+history of one activity is served by ``/api/activities/<id>/history/``.
+"""
+import json
+import zlib
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import sharding
+from .models import ActivityLog, ActivityLogArchive, ShardAssignment
+
+
+ARCHIVE = 'archive'
+SUMMARIZE = 'summarize'
+POLICIES = (ARCHIVE, SUMMARIZE)
+
+DEFAULTS = {
+    'DAYS': 90,
+    'POLICY': ARCHIVE,
+    'BATCH_SIZE': 500,
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'ACTIVITY_LOG_RETENTION', {}).get(name, DEFAULTS[name])
+
+
+def transition_key(old_status, new_status):
+    return f'{old_status or ""}>{new_status}'
+
+
+def pack_entries(logs):
+    """Compress ``logs`` into the bytes stored in ``ActivityLogArchive.entries``."""
+    rows = [[log.old_status, log.new_status, log.notes, log.created_at] for log in logs]
+    return zlib.compress(json.dumps(rows, cls=DjangoJSONEncoder, separators=(',', ':')).encode('utf-8'))
+
+
+def unpack_entries(archive):
+    """The logs stored in ``archive`` as dicts, oldest first; empty for summaries."""
+    if not archive.entries:
+        return []
+    rows = json.loads(zlib.decompress(bytes(archive.entries)))
+    return [
+        {'old_status': old_status, 'new_status': new_status, 'notes': notes, 'created_at': parse_datetime(created_at)}
+        for old_status, new_status, notes, created_at in rows
+    ]
+
+
+def summarize(activity_id, logs, policy):
+    """One unsaved archive row for ``logs`` (all of one activity, oldest first)."""
+    return ActivityLogArchive(
+        activity_id=activity_id,
+        log_count=len(logs),
+        transitions=dict(Counter(transition_key(log.old_status, log.new_status) for log in logs)),
+        first_logged_at=logs[0].created_at,
+        last_logged_at=logs[-1].created_at,
+        entries=pack_entries(logs) if policy == ARCHIVE else None,
+    )
+
+
+def _moving_user_ids():
+    # Their rows are being copied to another shard; archive them next run
+    return list(ShardAssignment.objects.using(DEFAULT_DB_ALIAS).filter(moving=True).values_list('user_id', flat=True))
+
+
+def archive_logs(days=None, policy=None, batch_size=None, using=None, now=None):
+    """Move logs older than ``days`` into ``ActivityLogArchive`` in batches.
+
+    Runs on ``using``, or on every activity shard (the default database when
+    unsharded). Returns ``{'logs': archived log count, 'archives': rows written}``.
+    """
+    days = get_setting('DAYS') if days is None else days
+    policy = policy or get_setting('POLICY')
+    batch_size = batch_size or get_setting('BATCH_SIZE')
+    if policy not in POLICIES:
+        raise ValueError(f'Unknown retention policy: {policy}')
+    cutoff = (now or timezone.now()) - timedelta(days=days)
+    aliases = [using] if using else sharding.get_shards() or [DEFAULT_DB_ALIAS]
+    moving = _moving_user_ids()
+
+    totals = {'logs': 0, 'archives': 0}
+    for alias in aliases:
+        old_logs = ActivityLog.objects.using(alias).filter(created_at__lt=cutoff)
+        if moving:
+            old_logs = old_logs.exclude(activity__user_id__in=moving)
+        while True:
+            # Archived logs are deleted, so the next batch starts at the front again
+            batch = list(old_logs.order_by('activity_id', 'created_at', 'id')[:batch_size])
+            if not batch:
+                break
+            by_activity = defaultdict(list)
+            for log in batch:
+                by_activity[log.activity_id].append(log)
+            archives = [summarize(activity_id, logs, policy) for activity_id, logs in by_activity.items()]
+            if sharding.is_enabled():
+                first_id = sharding.allocators[ActivityLogArchive].reserve(len(archives))
+                for offset, archive in enumerate(archives):
+                    archive.id = first_id + offset
+            with transaction.atomic(using=alias):
+                ActivityLogArchive.objects.using(alias).bulk_create(archives)
+                ActivityLog.objects.using(alias).filter(id__in=[log.id for log in batch]).delete()
+            totals['logs'] += len(batch)
+            totals['archives'] += len(archives)
+    return totals
+
+
+def archived_history(activity_ids, using=None):
+    """Archived logs and summaries of ``activity_ids``, keyed by activity id.
+
+    Each value is ``{'logs': [...], 'summaries': [...]}`` in time order; summaries
+    describe logs that were compacted without keeping the entries.
+    """
+    history = defaultdict(lambda: {'logs': [], 'summaries': []})
+    archives = ActivityLogArchive.objects.using(using).filter(activity_id__in=activity_ids).order_by(
+        'activity_id', 'first_logged_at', 'id'
+    )
+    for archive in archives:
+        if archive.entries:
+            history[archive.activity_id]['logs'].extend(unpack_entries(archive))
+        else:
+            history[archive.activity_id]['summaries'].append({
+                'log_count': archive.log_count,
+                'transitions': archive.transitions,
+                'first_logged_at': archive.first_logged_at,
+                'last_logged_at': archive.last_logged_at,
+            })
+    return history
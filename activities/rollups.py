@@ -0,0 +1,318 @@
+"""
+Weekly and monthly activity rollups and period-over-period comparisons.
+
+``ActivityRollup`` holds one row per user and week or month: counts by status
+and type and the calorie, step and duration totals of the activities created
+in it (deleted ones left out), matching what ``/api/activities/stats/`` has
+always counted. ``refresh_activity_rollups`` keeps them current
+incrementally: it reads the ``ActivityEvent`` rows written since its last run
+(``RollupCheckpoint``), and since an activity's period is fixed by its
+``created_at``, recomputes only the periods of activities that changed.
+Events from the last ``OVERLAP_SECONDS`` are read again on the next run, so
+transactions still open while it ran aren't missed.
+
+``compare()`` reads closed periods from the rollups and computes the rest
+(the current period, and any the last refresh may not have covered) from the
+activities, so answers are never older than the rollups' refresh lag for
+edits to old activities, and exact for new ones. A year of months or weeks
+is at most ``MAX_PERIODS`` rollup rows plus one aggregate over the open
+period.
+
+Rows loaded without events (``generate_fitness_data``, fixtures) are picked
+up by a ``--full`` refresh, which the first run on a database does anyway.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import sharding
+from .models import Activity, ActivityEvent, ActivityRollup, RollupCheckpoint
+
+
+WEEK = ActivityRollup.WEEK
+MONTH = ActivityRollup.MONTH
+PERIODS = (WEEK, MONTH)
+
+DEFAULTS = {
+    'OVERLAP_SECONDS': 300,
+    'MAX_PERIODS': 53,
+    'BATCH_SIZE': 500,
+}
+
+TRUNCATE = {WEEK: TruncWeek, MONTH: TruncMonth}
+
+AGGREGATES = {
+    'activity_count': Count('id'),
+    'completed_count': Count('id', filter=Q(status='completed')),
+    'planned_count': Count('id', filter=Q(status='planned')),
+    'in_progress_count': Count('id', filter=Q(status='in_progress')),
+    'calories_burned': Sum('calories_burned'),
+    'calories_consumed': Sum('calories_consumed'),
+    'steps': Sum('steps_count'),
+    'duration_minutes': Sum('duration_minutes'),
+}
+
+# Metrics compared between periods
+COMPARED = ('calories_burned', 'steps', 'duration_minutes', 'completion_rate')
+
+
+def get_setting(name):
+    return getattr(settings, 'ACTIVITY_ROLLUPS', {}).get(name, DEFAULTS[name])
+
+
+def period_start(period, day):
+    """First day of the week (Monday) or month containing ``day``."""
+    if period == WEEK:
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def next_start(period, start):
+    if period == WEEK:
+        return start + timedelta(days=7)
+    return (start + timedelta(days=32)).replace(day=1)
+
+
+def previous_start(period, start):
+    if period == WEEK:
+        return start - timedelta(days=7)
+    return (start - timedelta(days=1)).replace(day=1)
+
+
+def _midnight(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _as_date(value):
+    return timezone.localtime(value).date() if isinstance(value, datetime) else value
+
+
+def aggregate(activities, period):
+    """Rollup values of ``activities`` per period, keyed by the period's start."""
+    by_start = activities.order_by().annotate(start=TRUNCATE[period]('created_at'))
+    rows = {}
+    for row in by_start.values('start').annotate(**AGGREGATES):
+        start = _as_date(row.pop('start'))
+        rows[start] = {name: value or 0 for name, value in row.items()}
+        rows[start]['activities_by_type'] = {}
+    for row in by_start.values('start', 'activity_type').annotate(count=Count('id')):
+        rows[_as_date(row['start'])]['activities_by_type'][row['activity_type']] = row['count']
+    return rows
+
+
+def _assign_ids(rollups):
+    if sharding.is_enabled() and rollups:
+        first_id = sharding.allocators[ActivityRollup].reserve(len(rollups))
+        for offset, rollup in enumerate(rollups):
+            rollup.id = first_id + offset
+
+
+def _replace(user_id, period, starts, using):
+    """Recompute ``user_id``'s rollups of the periods at ``starts`` (all when ``None``)."""
+    activities = Activity.objects.using(using).filter(user_id=user_id, deleted=False)
+    stored = ActivityRollup.objects.using(using).filter(user_id=user_id, period=period)
+    if starts is not None:
+        starts = sorted(starts)
+        activities = activities.filter(
+            created_at__gte=_midnight(starts[0]), created_at__lt=_midnight(next_start(period, starts[-1]))
+        )
+        stored = stored.filter(start__in=starts)
+    rows = aggregate(activities, period)
+    rollups = [
+        ActivityRollup(user_id=user_id, period=period, start=start, **values)
+        for start, values in rows.items()
+        if starts is None or start in starts
+    ]
+    _assign_ids(rollups)
+    with transaction.atomic(using=using):
+        stored.delete()
+        ActivityRollup.objects.using(using).bulk_create(rollups)
+    return len(rollups)
+
+
+def rebuild_user(user_id, using):
+    """Recompute all of ``user_id``'s rollups on ``using``; return rows written."""
+    return sum(_replace(user_id, period, None, using) for period in PERIODS)
+
+
+def purge_user(user_id, using, batch_size=None):
+    """Delete a user's rollups, ``batch_size`` rows per transaction; return how many went."""
+    batch_size = batch_size or get_setting('BATCH_SIZE')
+    rows = ActivityRollup.objects.using(using).filter(user_id=user_id)
+    removed = 0
+    while True:
+        ids = list(rows.order_by().values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return removed
+        with transaction.atomic(using=using):
+            removed += ActivityRollup.objects.using(using).filter(id__in=ids).delete()[0]
+
+
+def _created_at_of_changes(using, since, until, batch_size):
+    """``created_at`` of every activity with events in ``[since, until)``, by user."""
+    events = ActivityEvent.objects.using(using).filter(created_at__gte=since, created_at__lt=until)
+    owners = dict(events.order_by().values_list('activity_id', 'user_id').distinct())
+    changed = defaultdict(set)
+    ids = list(owners)
+    for offset in range(0, len(ids), batch_size):
+        chunk = ids[offset:offset + batch_size]
+        found = dict(Activity.objects.using(using).filter(id__in=chunk).values_list('id', 'created_at'))
+        missing = [activity_id for activity_id in chunk if activity_id not in found]
+        if missing:
+            # Deleted since: their deletion event kept when they were created
+            deletions = ActivityEvent.objects.using(using).filter(
+                activity_id__in=missing, kind=ActivityEvent.DELETED
+            ).values_list('activity_id', 'changes')
+            for activity_id, changes in deletions:
+                if 'created_at' in changes:
+                    found[activity_id] = parse_datetime(changes['created_at'])
+        for activity_id, created_at in found.items():
+            changed[owners[activity_id]].add(timezone.localdate(created_at))
+    return changed
+
+
+def _refresh_all(using):
+    totals = {'users': 0, 'rollups': 0}
+    user_ids = set(Activity.objects.using(using).order_by().values_list('user_id', flat=True).distinct())
+    for user_id in sorted(user_ids):
+        totals['rollups'] += rebuild_user(user_id, using)
+        totals['users'] += 1
+    # Users whose activities are all gone
+    stale = set(ActivityRollup.objects.using(using).order_by().values_list('user_id', flat=True).distinct())
+    for user_id in stale - user_ids:
+        purge_user(user_id, using)
+    return totals
+
+
+def _refresh_changed(using, since, until, batch_size):
+    totals = {'users': 0, 'rollups': 0}
+    for user_id, days in _created_at_of_changes(using, since, until, batch_size).items():
+        for period in PERIODS:
+            starts = {period_start(period, day) for day in days}
+            totals['rollups'] += _replace(user_id, period, starts, using)
+        totals['users'] += 1
+    return totals
+
+
+def refresh(full=False, using=None, batch_size=None, now=None):
+    """Bring the rollups up to date with the activities.
+
+    Runs on ``using``, or on every activity shard (the default database when
+    unsharded). Only periods with changes since the last run are recomputed,
+    unless ``full`` or this is the first run on a database. Returns
+    ``{'users': users refreshed, 'rollups': rows written}``.
+    """
+    batch_size = batch_size or get_setting('BATCH_SIZE')
+    until = now or timezone.now()
+    aliases = [using] if using else sharding.get_shards() or [DEFAULT_DB_ALIAS]
+
+    totals = {'users': 0, 'rollups': 0}
+    for alias in aliases:
+        checkpoint = RollupCheckpoint.objects.using(DEFAULT_DB_ALIAS).filter(database=alias).first()
+        if full or checkpoint is None:
+            counts = _refresh_all(alias)
+        else:
+            since = checkpoint.refreshed_until - timedelta(seconds=get_setting('OVERLAP_SECONDS'))
+            counts = _refresh_changed(alias, since, until, batch_size)
+        RollupCheckpoint.objects.using(DEFAULT_DB_ALIAS).update_or_create(
+            database=alias, defaults={'refreshed_until': until}
+        )
+        for name, count in counts.items():
+            totals[name] += count
+    return totals
+
+
+def _fresh_until(using):
+    """Rollups on ``using`` account for every change before this moment (``None``: not built)."""
+    checkpoint = RollupCheckpoint.objects.filter(database=using or DEFAULT_DB_ALIAS).first()
+    if checkpoint is None:
+        return None
+    return checkpoint.refreshed_until - timedelta(seconds=get_setting('OVERLAP_SECONDS'))
+
+
+def summary(period, start, values):
+    """One period of ``compare()``'s response."""
+    values = values or {}
+    total = values.get('activity_count', 0)
+    completed = values.get('completed_count', 0)
+    return {
+        'start': start,
+        'end': next_start(period, start) - timedelta(days=1),
+        'total_activities': total,
+        'completed_activities': completed,
+        'planned_activities': values.get('planned_count', 0),
+        'in_progress_activities': values.get('in_progress_count', 0),
+        'completion_rate': round(completed / total * 100 if total else 0, 2),
+        'totals': {
+            'calories_burned': values.get('calories_burned', 0),
+            'calories_consumed': values.get('calories_consumed', 0),
+            'steps': values.get('steps', 0),
+            'duration_minutes': values.get('duration_minutes', 0),
+        },
+        'activities_by_type': values.get('activities_by_type', {}),
+    }
+
+
+def _metric(summary, name):
+    return summary['completion_rate'] if name == 'completion_rate' else summary['totals'][name]
+
+
+def changes(current, previous):
+    """Change of each compared metric from ``previous`` to ``current``.
+
+    ``change_percent`` is relative to the previous value (``None`` from zero);
+    for ``completion_rate``, ``change`` is in percentage points.
+    """
+    result = {}
+    for name in COMPARED:
+        now_value, before = _metric(current, name), _metric(previous, name)
+        result[name] = {
+            'current': now_value,
+            'previous': before,
+            'change': round(now_value - before, 2),
+            'change_percent': round((now_value - before) / before * 100, 2) if before else None,
+        }
+    return result
+
+
+def compare(user, period=MONTH, periods=2, now=None):
+    """``user``'s last ``periods`` weeks or months, the current one last, and
+    the change from the previous period to the current one."""
+    starts = [period_start(period, timezone.localdate(now))]
+    while len(starts) < periods:
+        starts.insert(0, previous_start(period, starts[0]))
+
+    alias = sharding.shard_for_user(user)
+    fresh_until = _fresh_until(alias)
+    stored = [start for start in starts if fresh_until and _midnight(next_start(period, start)) <= fresh_until]
+    live = starts[len(stored):]
+
+    values = {}
+    if stored:
+        rollups = ActivityRollup.objects.using(alias).filter(
+            user=user, period=period, start__gte=stored[0], start__lte=stored[-1]
+        )
+        for rollup in rollups:
+            values[rollup.start] = {
+                name: getattr(rollup, name) for name in [*AGGREGATES, 'activities_by_type']
+            }
+    values.update(aggregate(
+        sharding.activities_for(user).filter(created_at__gte=_midnight(live[0])), period
+    ))
+
+    history = [summary(period, start, values.get(start)) for start in starts]
+    result = {
+        'period': period,
+        'current': history[-1],
+        'previous': history[-2],
+        'changes': changes(history[-1], history[-2]),
+    }
+    if periods > 2:
+        result['history'] = history
+    return result
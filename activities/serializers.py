@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
 from .models import Activity, ActivityLog
+from .sharding import activity_manager
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -30,16 +31,23 @@ class ActivitySerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'user', 'created_at', 'updated_at']
     
+    def get_fields(self):
+        fields = super().get_fields()
+        # Honour ?fields= / ?expand= when the view passes a FieldSelection
+        selection = self.context.get('field_selection')
+        if selection is not None:
+            fields = selection.filter_serializer_fields(fields)
+        return fields
+    
     def create(self, validated_data):
         # Set the user from the request context
-        validated_data['user'] = self.context['request'].user
-        return super().create(validated_data)
+        user = validated_data['user'] = self.context['request'].user
+        return activity_manager(user, for_write=True).create(**validated_data)
     
     def update(self, instance, validated_data):
         # Log status changes
         if 'status' in validated_data and instance.status != validated_data['status']:
-            ActivityLog.objects.create(
-                activity=instance,
+            instance.logs.create(
                 old_status=instance.status,
                 new_status=validated_data['status'],
                 notes=f"Status changed from {instance.status} to {validated_data['status']}"
@@ -58,8 +66,8 @@ class ActivityCreateSerializer(serializers.ModelSerializer):
         ]
     
     def create(self, validated_data):
-        validated_data['user'] = self.context['request'].user
-        return super().create(validated_data)
+        user = validated_data['user'] = self.context['request'].user
+        return activity_manager(user, for_write=True).create(**validated_data)
 
 
 class ActivityUpdateSerializer(serializers.ModelSerializer):
@@ -74,8 +82,7 @@ class ActivityUpdateSerializer(serializers.ModelSerializer):
     def update(self, instance, validated_data):
         # Log status changes
         if 'status' in validated_data and instance.status != validated_data['status']:
-            ActivityLog.objects.create(
-                activity=instance,
+            instance.logs.create(
                 old_status=instance.status,
                 new_status=validated_data['status'],
                 notes=f"Status changed from {instance.status} to {validated_data['status']}"
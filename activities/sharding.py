@@ -0,0 +1,382 @@
+"""
+Horizontal sharding of activity data by user.
+
+Each user's activity rows (``SHARDED_MODELS``) live on one of the database
+aliases in ``settings.ACTIVITY_SHARDS``. New users are placed by consistent
+hashing of their id; the placement is then recorded in ``ShardAssignment`` (on
+the default database) so that changing the shard list never strands data.
+``reshard_activities`` moves users whose assignment no longer matches the ring.
+
+With ``ACTIVITY_SHARDS`` empty, sharding is off and every helper here falls
+back to normal routing.
+
+Querysets don't carry enough information for a router to pick a shard, so
+views reach activities through ``activities_for``/``activity_manager``. Rows
+get ids from a global ``ShardSequence`` so they stay unique across shards and
+can be moved without renumbering.
+"""
+import bisect
+import hashlib
+import threading
+import time
+from datetime import timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connections, transaction
+from django.db.models import Max
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from fitness_tracker_backend.db_routers import owner_id
+from . import history
+from .models import (
+    Activity, ActivityEvent, ActivityLog, ActivityLogArchive, ActivityRollup, ActivitySnapshot, ShardAssignment,
+    ShardSequence,
+)
+
+
+SHARDED_MODELS = (Activity, ActivityLog, ActivityLogArchive, ActivityEvent, ActivitySnapshot, ActivityRollup)
+VIRTUAL_NODES = 64
+
+
+class ShardMoveInProgress(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Your activities are being moved, please retry shortly.'
+    default_code = 'shard_move_in_progress'
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.md5(str(value).encode('utf-8')).digest()[:8], 'big')
+
+
+class HashRing:
+    """Consistent hash ring with virtual nodes.
+
+    Adding a shard only moves roughly 1/N of the users to it.
+    """
+
+    def __init__(self, aliases, virtual_nodes=VIRTUAL_NODES):
+        points = sorted(
+            (_hash(f'{alias}#{replica}'), alias)
+            for alias in aliases
+            for replica in range(virtual_nodes)
+        )
+        self._hashes = [point for point, _ in points]
+        self._aliases = [alias for _, alias in points]
+
+    def get(self, key):
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._aliases[index]
+
+
+@lru_cache(maxsize=8)
+def _ring(aliases):
+    return HashRing(aliases)
+
+
+def get_shards():
+    return list(getattr(settings, 'ACTIVITY_SHARDS', []))
+
+
+def is_enabled():
+    return bool(get_shards())
+
+
+def ring_shard(user_id):
+    """Where the hash ring places ``user_id`` under the current shard list."""
+    return _ring(tuple(get_shards())).get(user_id)
+
+
+def _user_id(user):
+    return getattr(user, 'pk', user)
+
+
+def shard_for_user(user, for_write=False):
+    """Return the database alias holding ``user``'s activities, or ``None`` when unsharded.
+
+    Reads of users without an assignment fall back to the ring; the first
+    write records the assignment. Writes are refused while the user is being
+    moved. The answer is memoized on ``user`` objects for the request.
+    """
+    if not is_enabled():
+        return None
+    cached = getattr(user, '_activity_shard', None)
+    if cached is not None and not (for_write and cached._state.adding):
+        assignment = cached
+    else:
+        user_id = _user_id(user)
+        assignment = ShardAssignment.objects.using(DEFAULT_DB_ALIAS).filter(user_id=user_id).first()
+        if assignment is None:
+            assignment = ShardAssignment(user_id=user_id, alias=ring_shard(user_id))
+            if for_write:
+                try:
+                    with transaction.atomic(using=DEFAULT_DB_ALIAS):
+                        assignment.save(using=DEFAULT_DB_ALIAS, force_insert=True)
+                except IntegrityError:
+                    assignment = ShardAssignment.objects.using(DEFAULT_DB_ALIAS).get(user_id=user_id)
+        if not isinstance(user, int):
+            user._activity_shard = assignment
+    if for_write and assignment.moving:
+        raise ShardMoveInProgress()
+    return assignment.alias
+
+
+def activity_manager(user, for_write=False):
+    """``Activity.objects`` bound to ``user``'s shard."""
+    return Activity.objects.db_manager(shard_for_user(user, for_write=for_write))
+
+
+def activities_for(user, for_write=False, include_deleted=False):
+    """All of ``user``'s activities, on the right shard.
+
+    Activities queued for deletion are left out unless ``include_deleted``.
+    """
+    activities = activity_manager(user, for_write=for_write).filter(user=user)
+    return activities if include_deleted else activities.filter(deleted=False)
+
+
+def existing_activity_ids(ids):
+    """Subset of ``ids`` that exist (and aren't queued for deletion) on any shard."""
+    found = set()
+    for alias in get_shards() or [None]:
+        found.update(
+            Activity.objects.db_manager(alias).filter(id__in=ids, deleted=False).values_list('id', flat=True)
+        )
+    return found
+
+
+class IdBlockAllocator:
+    """Hands out ids from blocks reserved in ``ShardSequence``.
+
+    One short transaction on the default database reserves ``block_size`` ids,
+    so most inserts don't touch the sequence at all.
+    """
+
+    def __init__(self, model, block_size=1000):
+        self.model = model
+        self.name = model._meta.label_lower
+        self.block_size = block_size
+        self._next = 0
+        self._end = 0
+        self._lock = threading.Lock()
+
+    def next_id(self):
+        with self._lock:
+            if self._next >= self._end:
+                self._next, self._end = self._reserve(self.block_size)
+            value = self._next
+            self._next += 1
+            return value
+
+    def reserve(self, count):
+        """Reserve ``count`` consecutive ids for bulk inserts; return the first."""
+        return self._reserve(count)[0]
+
+    def _reserve(self, count):
+        with transaction.atomic(using=DEFAULT_DB_ALIAS):
+            sequence = ShardSequence.objects.using(DEFAULT_DB_ALIAS).select_for_update().filter(
+                name=self.name
+            ).first()
+            if sequence is None:
+                sequence = ShardSequence(name=self.name, next_value=self._highest_existing_id() + 1)
+                sequence.save(using=DEFAULT_DB_ALIAS, force_insert=True)
+            start = sequence.next_value
+            sequence.next_value = start + count
+            sequence.save(using=DEFAULT_DB_ALIAS, update_fields=['next_value'])
+        return start, start + count
+
+    def _highest_existing_id(self):
+        highest = 0
+        for alias in set(get_shards()) | {DEFAULT_DB_ALIAS}:
+            value = self.model._base_manager.using(alias).aggregate(highest=Max('id'))['highest']
+            highest = max(highest, value or 0)
+        return highest
+
+
+allocators = {model: IdBlockAllocator(model) for model in SHARDED_MODELS}
+
+
+def assign_id(instance):
+    """Give a new sharded row a globally unique id before it is inserted."""
+    if is_enabled() and instance.pk is None:
+        instance.pk = allocators[type(instance)].next_id()
+
+
+def _raw_insert(model, objs, using):
+    """Insert ``objs`` keeping their ids and timestamps.
+
+    ``bulk_create`` would run ``auto_now``/``auto_now_add`` again, so this goes
+    through the same raw insert that fixture loading uses.
+    """
+    fields = model._meta.concrete_fields
+    batch_size = max(1, connections[using].ops.bulk_batch_size(fields, objs))
+    for start in range(0, len(objs), batch_size):
+        model._base_manager.using(using)._insert(
+            objs[start:start + batch_size], fields=fields, using=using, raw=True
+        )
+
+
+def _copy_activities(user_id, source, target, batch_size, changed_since=None):
+    """Copy a user's activities and their logs from ``source`` to ``target``.
+
+    Rows already on the target (from an earlier partial run, or an earlier
+    pass) are replaced. Returns the number of activities copied.
+    """
+    activities = Activity.objects.using(source).filter(user_id=user_id).order_by('id')
+    if changed_since is not None:
+        activities = activities.filter(updated_at__gte=changed_since)
+    copied = 0
+    last_id = 0
+    while True:
+        batch = list(activities.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            return copied
+        ids = [activity.id for activity in batch]
+        logs = list(ActivityLog.objects.using(source).filter(activity_id__in=ids))
+        archives = list(ActivityLogArchive.objects.using(source).filter(activity_id__in=ids))
+        with transaction.atomic(using=target):
+            ActivityLogArchive.objects.using(target).filter(activity_id__in=ids).delete()
+            ActivityLog.objects.using(target).filter(activity_id__in=ids).delete()
+            Activity.objects.using(target).filter(id__in=ids).delete()
+            _raw_insert(Activity, batch, target)
+            _raw_insert(ActivityLog, logs, target)
+            _raw_insert(ActivityLogArchive, archives, target)
+        copied += len(batch)
+        last_id = ids[-1]
+
+
+def delete_in_batches(activities, batch_size, on_batch=None):
+    """Delete the ``activities`` queryset, with its logs, ``batch_size`` rows per transaction.
+
+    Each batch commits on its own, so other writers wait for one batch at
+    most and an interrupted run picks up where it stopped. ``on_batch`` is
+    called with the running total after each batch.
+    """
+    using = activities.db
+    deleted = 0
+    while True:
+        ids = list(activities.order_by().values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        with transaction.atomic(using=using):
+            ActivityLogArchive.objects.using(using).filter(activity_id__in=ids).delete()
+            ActivityLog.objects.using(using).filter(activity_id__in=ids).delete()
+            deleted += Activity.objects.using(using).filter(id__in=ids).delete()[0]
+        if on_batch is not None:
+            on_batch(deleted)
+
+
+def delete_user_activities(user_id, using, batch_size, keep_ids=None):
+    """Delete a user's activities (and logs) on ``using`` in bounded batches."""
+    queryset = Activity.objects.using(using).filter(user_id=user_id)
+    if keep_ids is not None:
+        queryset = queryset.exclude(id__in=keep_ids)
+    return delete_in_batches(queryset, batch_size)
+
+
+def _copy_history(user_id, source, target, batch_size):
+    """Copy the user's events and snapshots that ``target`` doesn't have yet.
+
+    They never change once written, so rows already copied are skipped.
+    """
+    for model in (ActivityEvent, ActivitySnapshot):
+        copied = set(model.objects.using(target).filter(user_id=user_id).values_list('id', flat=True))
+        rows = model.objects.using(source).filter(user_id=user_id).order_by('id')
+        last_id = 0
+        while True:
+            batch = list(rows.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1].id
+            missing = [row for row in batch if row.id not in copied]
+            if missing:
+                with transaction.atomic(using=target):
+                    _raw_insert(model, missing, target)
+
+
+def move_user(user_id, target, batch_size=500, grace_seconds=2.0):
+    """Move one user's activities to ``target`` while the API stays up.
+
+    1. Copy everything while reads and writes continue on the source.
+    2. Mark the assignment as moving so new writes get a 503, and wait
+       ``grace_seconds`` for in-flight requests to finish.
+    3. Re-copy rows changed since step 1 and drop rows deleted meanwhile.
+    4. Point the assignment at the target, then clean up the source.
+
+    Returns the number of activities moved.
+    """
+    # Rows are copied and dropped here, not created or deleted by the user
+    with history.paused():
+        return _move_user(user_id, target, batch_size, grace_seconds)
+
+
+def _move_user(user_id, target, batch_size, grace_seconds):
+    assignment = ShardAssignment.objects.using(DEFAULT_DB_ALIAS).filter(user_id=user_id).first()
+    if assignment is None:
+        assignment = ShardAssignment(user_id=user_id, alias=ring_shard(user_id))
+    source = assignment.alias
+    if source == target:
+        return 0
+
+    started = timezone.now() - timedelta(seconds=1)
+    moved = _copy_activities(user_id, source, target, batch_size)
+    _copy_history(user_id, source, target, batch_size)
+
+    assignment.moving = True
+    assignment.save(using=DEFAULT_DB_ALIAS)
+    try:
+        if grace_seconds:
+            time.sleep(grace_seconds)
+        _copy_activities(user_id, source, target, batch_size, changed_since=started)
+        _copy_history(user_id, source, target, batch_size)
+        remaining = list(Activity.objects.using(source).filter(user_id=user_id).values_list('id', flat=True))
+        delete_user_activities(user_id, target, batch_size, keep_ids=remaining)
+        assignment.alias = target
+    finally:
+        assignment.moving = False
+        assignment.save(using=DEFAULT_DB_ALIAS)
+
+    delete_user_activities(user_id, source, batch_size)
+    history.purge_user(user_id, source, batch_size)
+    # Rollups are derived from the rows, so rebuild them rather than copy them;
+    # rollups imports this module, hence the late import
+    from . import rollups
+    rollups.rebuild_user(user_id, target)
+    rollups.purge_user(user_id, source)
+    return moved
+
+
+class ShardRouter:
+    """Keeps sharded rows on their user's shard and everything else on default."""
+
+    def _db_for_instance(self, model, instance):
+        if instance is None:
+            return None
+        if model in SHARDED_MODELS:
+            if instance._state.db:
+                return instance._state.db
+            user_id = owner_id(instance)
+            return shard_for_user(user_id) if user_id is not None else None
+        if instance._state.db in get_shards():
+            # e.g. activity.user: users live on the default database
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def db_for_read(self, model, **hints):
+        if not is_enabled():
+            return None
+        return self._db_for_instance(model, hints.get('instance'))
+
+    def db_for_write(self, model, **hints):
+        if not is_enabled():
+            return None
+        return self._db_for_instance(model, hints.get('instance'))
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if not is_enabled():
+            return None
+        if isinstance(obj1, SHARDED_MODELS) or isinstance(obj2, SHARDED_MODELS):
+            return True
+        return None
@@ -0,0 +1,74 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import events, history, rollups, sharding
+from .models import Activity, ActivityEvent, ActivityLog, ActivityLogArchive, ActivityRollup, ActivitySnapshot
+
+
+def _publish_on_commit(user_id, event):
+    # Only tell subscribers about rows other connections can already read
+    transaction.on_commit(lambda: events.publish(user_id, event))
+
+
+@receiver(post_save, sender=Activity)
+def activity_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    history.record_save(instance, created)
+    event_type = 'activity.created' if created else 'activity.updated'
+    _publish_on_commit(instance.user_id, events.activity_event(event_type, instance))
+
+
+@receiver(post_delete, sender=Activity)
+def activity_deleted(sender, instance, **kwargs):
+    history.record_deletion(instance)
+    _publish_on_commit(instance.user_id, events.activity_event('activity.deleted', instance))
+
+
+@receiver(post_save, sender=ActivityLog)
+def activity_log_saved(sender, instance, created, raw=False, **kwargs):
+    if raw or not created:
+        return
+    # Logs are created through activity.logs, which attaches the activity
+    activity = instance._state.fields_cache.get('activity')
+    if activity is None:
+        activity = Activity.objects.using(instance._state.db).get(pk=instance.activity_id)
+    _publish_on_commit(activity.user_id, events.activity_event(
+        'activity.status_changed',
+        activity,
+        status=instance.new_status,
+        old_status=instance.old_status,
+        new_status=instance.new_status,
+    ))
+
+
+@receiver(pre_save, sender=Activity)
+@receiver(pre_save, sender=ActivityLog)
+@receiver(pre_save, sender=ActivityLogArchive)
+@receiver(pre_save, sender=ActivityEvent)
+@receiver(pre_save, sender=ActivitySnapshot)
+@receiver(pre_save, sender=ActivityRollup)
+def assign_sharded_id(sender, instance, raw=False, **kwargs):
+    sharding.assign_id(instance)
+
+
+@receiver(pre_delete, sender=User)
+def delete_sharded_activities(sender, instance, **kwargs):
+    # The deletion cascade only reaches rows on the user's own database
+    alias = sharding.shard_for_user(instance)
+    instance._activity_history_alias = alias
+    if alias is not None and alias != DEFAULT_DB_ALIAS:
+        Activity.objects.using(alias).filter(user_id=instance.pk).delete()
+
+
+@receiver(post_delete, sender=User)
+def delete_activity_history(sender, instance, **kwargs):
+    # History and rollups outlive deleted activities, but not their user. The
+    # delete_account job purges them in batches first; this catches users
+    # deleted directly (admin, shell), inside the deletion's transaction.
+    alias = getattr(instance, '_activity_history_alias', None) or DEFAULT_DB_ALIAS
+    history.purge_user(instance.pk, alias, batch_size=settings.DELETION_BATCH_SIZE)
+    rollups.purge_user(instance.pk, alias, batch_size=settings.DELETION_BATCH_SIZE)
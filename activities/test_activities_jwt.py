@@ -16,64 +16,66 @@ from activities.views import ActivityListCreateView, ActivityDetailView, activit
 User = get_user_model()
 
 class ActivityAPITest(APITestCase):
-    def setUp(self):
+    @classmethod
+    def setUpTestData(cls):
         # Create a test user
-        self.user = User.objects.create_user(
+        cls.user = User.objects.create_user(
             username='testuser',
             email='test@example.com',
             password='testpass123'
         )
         
         # Generate JWT token for the user
-        refresh = RefreshToken.for_user(self.user)
-        self.access_token = str(refresh.access_token)
-        
-        # Set up the client with JWT authentication
-        self.client = APIClient()
-        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access_token}')
+        refresh = RefreshToken.for_user(cls.user)
+        cls.access_token = str(refresh.access_token)
         
         # Create some test activities
-        self.now = timezone.now()
-        self.activities = [
+        cls.now = timezone.now()
+        cls.activities = [
             Activity.objects.create(
                 title='Morning Workout',
                 activity_type='workout',
                 status='completed',
-                planned_date=self.now - timedelta(days=1),
+                planned_date=cls.now - timedelta(days=1),
                 duration_minutes=30,
                 calories_burned=300,
-                user=self.user
+                user=cls.user
             ),
             Activity.objects.create(
                 title='Evening Run',
                 activity_type='running',
                 status='completed',
-                planned_date=self.now - timedelta(days=2),
+                planned_date=cls.now - timedelta(days=2),
                 duration_minutes=45,
                 calories_burned=400,
-                user=self.user
+                user=cls.user
             ),
             Activity.objects.create(
                 title='Yoga Session',
                 activity_type='yoga',
                 status='pending',
-                planned_date=self.now + timedelta(days=1),
+                planned_date=cls.now + timedelta(days=1),
                 duration_minutes=60,
                 calories_burned=200,
-                user=self.user
+                user=cls.user
             ),
         ]
         
         # Create activity logs
-        self.activity_logs = [
+        cls.activity_logs = [
             ActivityLog.objects.create(
                 activity=activity,
                 old_status='planned',
                 new_status=activity.status,
                 notes=f'Activity {activity.title} was created with status {activity.status}'
-            ) for activity in self.activities
+            ) for activity in cls.activities
         ]
 
+    def setUp(self):
+        # Set up the client with JWT authentication
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access_token}')
+
     def test_activity_creation(self):
         """Test creating a new activity."""
         data = {
@@ -177,19 +179,69 @@ class ActivityAPITest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         
         # Check if the response contains the expected stats
-        self.assertIn('monthly_stats', response.data)
-        self.assertIn('totals', response.data)
-        self.assertIn('activities_by_type', response.data)
+        self.assertEqual(response.data['period'], 'month')
+        self.assertIn('current', response.data)
+        self.assertIn('previous', response.data)
+        self.assertIn('changes', response.data)
         
         # Verify the stats values
-        monthly_stats = response.data['monthly_stats']
-        totals = response.data['totals']
+        current = response.data['current']
+        totals = current['totals']
         
-        self.assertEqual(monthly_stats['total_activities'], 3)
-        self.assertEqual(monthly_stats['completed_activities'], 2)
+        self.assertEqual(current['total_activities'], 3)
+        self.assertEqual(current['completed_activities'], 2)
         self.assertEqual(totals['calories_burned'], 900)  # 300 + 400 + 200
         self.assertEqual(totals['duration_minutes'], 135)  # 30 + 45 + 60
-        self.assertIn('workout', response.data['activities_by_type'])
+        self.assertIn('workout', current['activities_by_type'])
+        self.assertEqual(response.data['changes']['calories_burned']['change'], 900)
+
+    def test_sparse_fields(self):
+        """Test ?fields= limits the payload and skips the log prefetch."""
+        with self.assertNumQueries(3):  # user lookup, count, page
+            response = self.client.get('/api/activities/?fields=id,title,status')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(response.data['results'][0]), {'id', 'title', 'status'})
+
+        response = self.client.get(f'/api/activities/{self.activities[0].id}/?fields=title,user')
+        self.assertEqual(response.data, {'id': self.activities[0].id, 'user': self.user.id, 'title': 'Morning Workout'})
+
+        response = self.client.get('/api/activities/recent/?fields=title,bogus')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_expand_logs_and_user(self):
+        """Test ?expand= embeds related objects with batched queries."""
+        with self.assertNumQueries(4):  # user lookup, count, page with user join, logs
+            response = self.client.get('/api/activities/?fields=title&expand=logs,user')
+        first = response.data['results'][0]
+        self.assertEqual(first['user']['username'], 'testuser')
+        self.assertEqual(len(first['logs']), 1)
+
+        response = self.client.get('/api/auth/dashboard/?fields=title')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(response.data['recent_activities'][0]), {'id', 'title'})
+        self.assertEqual(response.data['stats']['recent_activities_count'], 3)
+
+    def test_batch_activities(self):
+        """Test fetching several activities by id in the requested order."""
+        other_user = User.objects.create_user(username='other', password='testpass123')
+        foreign = Activity.objects.create(
+            title='Not Mine', activity_type='workout', planned_date=self.now, user=other_user
+        )
+        ids = [self.activities[2].id, foreign.id, 999999, self.activities[0].id]
+
+        with self.assertNumQueries(4):  # user lookup, activities, logs, ownership check
+            response = self.client.get(f"/api/activities/batch/?ids={','.join(map(str, ids))}&expand=logs")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [item['id'] for item in response.data['results']],
+            [self.activities[2].id, self.activities[0].id]
+        )
+        self.assertEqual(response.data['forbidden'], [foreign.id])
+        self.assertEqual(response.data['not_found'], [999999])
+
+        for ids in ('1,abc', '99999999999999999999999', '0', '-5'):
+            response = self.client.get(f'/api/activities/batch/?ids={ids}')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
 
 
@@ -214,74 +266,74 @@ class ActivityAPITest(APITestCase):
 class ActivityFilterTest(APITestCase):
     """Test cases for Activity filtering functionality."""
     
-    def setUp(self):
-        """Set up test data and client."""
+    @classmethod
+    def setUpTestData(cls):
+        """Set up test data, once per class."""
         # Create a test user
-        self.user = User.objects.create_user(
+        cls.user = User.objects.create_user(
             username='testuser',
             email='test@example.com',
             password='testpass123'
         )
         
         # Generate JWT token for the user
-        refresh = RefreshToken.for_user(self.user)
-        self.access_token = str(refresh.access_token)
-        
-        # Set up the client with JWT authentication
-        self.client = APIClient()
-        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access_token}')
+        refresh = RefreshToken.for_user(cls.user)
+        cls.access_token = str(refresh.access_token)
         
         # Create test activities with different dates
-        self.now = timezone.now()
-        self.activities = [
+        cls.now = timezone.now()
+        cls.activities = [
             Activity.objects.create(
                 title='Morning Workout',
                 activity_type='workout',
                 status='completed',
-                planned_date=self.now,
+                planned_date=cls.now,
                 duration_minutes=30,
                 calories_burned=300,
-                user=self.user
+                user=cls.user
             ),
             Activity.objects.create(
                 title='Evening Run',
                 activity_type='running',
                 status='completed',
-                planned_date=self.now - timedelta(days=1),
+                planned_date=cls.now - timedelta(days=1),
                 duration_minutes=45,
                 calories_burned=400,
-                user=self.user
+                user=cls.user
             ),
             Activity.objects.create(
                 title='Yoga Session',
                 activity_type='yoga',
-                status='pending',
-                planned_date=self.now + timedelta(days=1),
+                status='planned',
+                planned_date=cls.now + timedelta(days=1),
                 duration_minutes=60,
                 calories_burned=200,
-                user=self.user
+                user=cls.user
             ),
             Activity.objects.create(
                 title='Swimming',
                 activity_type='swimming',
                 status='completed',
-                planned_date=self.now - timedelta(days=2),
+                planned_date=cls.now - timedelta(days=2),
                 duration_minutes=30,
                 calories_burned=250,
-                user=self.user
+                user=cls.user
             ),
             Activity.objects.create(
                 title='Cycling',
-                activity_type='cycling',
+                activity_type='other',
                 status='in_progress',
-                planned_date=self.now,
+                planned_date=cls.now,
                 duration_minutes=60,
                 calories_burned=500,
-                user=self.user
+                user=cls.user
             ),
         ]
-    
 
+    def setUp(self):
+        """Set up the client with JWT authentication."""
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access_token}')
     
     def test_search_activity(self):
         """Test searching activities by title."""
@@ -343,6 +395,36 @@ class ActivityFilterTest(APITestCase):
     
 
     
+    def test_range_and_multi_value_filters(self):
+        """Test range lookups on dates and metrics and comma-separated choices."""
+        response = self.client.get('/api/activities/?calories_burned__gte=300&calories_burned__lte=450')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            sorted(item['title'] for item in response.data['results']),
+            ['Evening Run', 'Morning Workout']
+        )
+
+        response = self.client.get('/api/activities/?status=planned,in_progress&duration_minutes__gte=60')
+        self.assertEqual(
+            sorted(item['title'] for item in response.data['results']),
+            ['Cycling', 'Yoga Session']
+        )
+
+        since = (self.now - timedelta(hours=1)).isoformat().replace('+00:00', 'Z')
+        response = self.client.get('/api/activities/', {'planned_date__gte': since, 'activity_type': 'workout,other'})
+        self.assertEqual(
+            sorted(item['title'] for item in response.data['results']),
+            ['Cycling', 'Morning Workout']
+        )
+
+        # Values outside the model's choices are rejected, not silently unmatched
+        for params in ('status=bogus', 'status=planned,bogus', 'activity_type=cycling'):
+            response = self.client.get(f'/api/activities/?{params}')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.get('/api/activities/?steps_count__gte=abc')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
     def test_ordering_activities_desc(self):
         """Test ordering activities in descending order."""
         response = self.client.get(
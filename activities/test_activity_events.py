@@ -0,0 +1,182 @@
+import asyncio
+import os
+import tempfile
+import threading
+import tracemalloc
+from unittest import skipUnless
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import AsyncRequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from activities import events
+from activities.models import Activity
+from activities.views import activity_events
+
+User = get_user_model()
+
+
+class InProcessBrokerTest(TestCase):
+    def setUp(self):
+        self.broker = events.InProcessBroker(queue_size=3)
+
+    def test_publish_reaches_only_the_users_subscriptions(self):
+        mine = self.broker.subscribe(1)
+        other = self.broker.subscribe(2)
+        self.broker.publish(1, {'type': 'activity.created', 'activity_id': 7})
+
+        self.assertEqual(mine.pop(), {'type': 'activity.created', 'activity_id': 7})
+        self.assertIsNone(other.pop())
+
+        self.broker.unsubscribe(mine)
+        self.assertEqual(self.broker.subscriber_count(1), 0)
+        self.assertEqual(self.broker.subscriber_count(2), 1)
+
+    def test_slow_subscriber_drops_oldest_events(self):
+        subscription = self.broker.subscribe(1)
+        for i in range(5):
+            self.broker.publish(1, {'type': 'activity.updated', 'activity_id': i})
+
+        self.assertEqual(subscription.dropped, 2)
+        self.assertEqual([subscription.pop()['activity_id'] for _ in range(3)], [2, 3, 4])
+
+    def test_thousands_of_idle_subscribers_stay_small(self):
+        broker = events.InProcessBroker(queue_size=100)
+        count = 5000
+
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        subscriptions = [broker.subscribe(user_id) for user_id in range(count)]
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+
+        allocated = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+        self.assertEqual(broker.subscriber_count(), count)
+        self.assertLess(allocated / count, 512)
+
+        broker.publish(42, {'type': 'activity.created', 'activity_id': 1})
+        self.assertEqual(subscriptions[42].pop()['activity_id'], 1)
+        self.assertEqual(sum(1 for s in subscriptions if s.queue is not None), 1)
+
+    def test_get_wakes_on_publish_from_another_thread(self):
+        subscription = self.broker.subscribe(1)
+
+        async def consume():
+            loop = asyncio.get_running_loop()
+            loop.call_later(0.01, threading.Thread(
+                target=self.broker.publish, args=(1, {'type': 'activity.deleted'})
+            ).start)
+            return await subscription.get(timeout=5)
+
+        self.assertEqual(asyncio.run(consume()), {'type': 'activity.deleted'})
+
+
+@skipUnless(events.SocketBroker.supported, 'needs Unix datagram sockets')
+class SocketBrokerTest(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = directory.name
+
+    def test_events_reach_other_processes(self):
+        subscriber = events.SocketBroker(path=self.path)
+        subscription = subscriber.subscribe(1)
+
+        # A bare fork: the parallel test runner's workers can't have children
+        pid = os.fork()
+        if pid == 0:
+            try:
+                events.SocketBroker(path=self.path).publish(1, {'type': 'activity.created', 'activity_id': 7})
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+
+        async def receive():
+            return await subscription.get(timeout=5)
+
+        self.assertEqual(asyncio.run(receive()), {'type': 'activity.created', 'activity_id': 7})
+
+    def test_sockets_of_finished_processes_are_removed(self):
+        stale = os.path.join(self.path, '999999.sock')
+        with open(stale, 'w'):
+            pass
+        events.SocketBroker(path=self.path).publish(1, {'type': 'activity.deleted'})
+        self.assertFalse(os.path.exists(stale))
+
+
+@override_settings(ACTIVITY_EVENTS={'HEARTBEAT_SECONDS': 5})
+class ActivityEventStreamTest(TestCase):
+    def setUp(self):
+        events.reset_broker()
+        self.user = User.objects.create_user(username='streamer', password='testpass123')
+        self.access_token = str(RefreshToken.for_user(self.user).access_token)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access_token}')
+
+    def tearDown(self):
+        events.reset_broker()
+
+    def test_writes_publish_events_after_commit(self):
+        subscription = events.get_broker().subscribe(self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/activities/', {
+                'title': 'Morning Run',
+                'activity_type': 'workout',
+                'planned_date': timezone.now().isoformat(),
+            }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        activity = Activity.objects.get()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/activities/{activity.pk}/', {'status': 'completed'}, format='json')
+
+        types = []
+        while True:
+            event = subscription.pop()
+            if event is None:
+                break
+            types.append(event['type'])
+        self.assertEqual(types, ['activity.created', 'activity.status_changed', 'activity.updated'])
+
+    def test_status_change_events_use_the_attached_activity(self):
+        activity = Activity.objects.create(
+            user=self.user, title='Run', activity_type='workout', planned_date=timezone.now()
+        )
+        activity = Activity.objects.get(pk=activity.pk)
+        with CaptureQueriesContext(connection) as queries:
+            activity.logs.create(old_status='planned', new_status='completed')
+        self.assertFalse(any(q['sql'].startswith('SELECT') for q in queries.captured_queries))
+
+    def test_stream_is_refused_under_wsgi(self):
+        response = self.client.get('/api/activities/events/')
+        self.assertEqual(response.status_code, status.HTTP_501_NOT_IMPLEMENTED)
+        self.assertEqual(events.get_broker().subscriber_count(), 0)
+
+    def test_stream_requires_authentication(self):
+        request = AsyncRequestFactory().get('/api/activities/events/')
+        response = async_to_sync(activity_events)(request)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_stream_delivers_events_for_query_token(self):
+        request = AsyncRequestFactory().get(f'/api/activities/events/?access_token={self.access_token}')
+
+        async def first_frames():
+            response = await activity_events(request)
+            stream = response.streaming_content
+            frames = [await stream.__anext__()]
+            events.publish(self.user.pk, {'type': 'activity.created', 'activity_id': 5})
+            frames.append(await stream.__anext__())
+            await stream.aclose()
+            return response, frames
+
+        response, frames = async_to_sync(first_frames)()
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertTrue(frames[0].startswith(b'retry:'))
+        self.assertIn(b'event: activity.created', frames[1])
+        self.assertEqual(events.get_broker().subscriber_count(self.user.pk), 0)
@@ -0,0 +1,52 @@
+from datetime import date, datetime
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+
+from activities.datagen import Generator, datetime_adapter, generate
+from activities.models import Activity, ActivityLog
+
+User = get_user_model()
+
+
+class GenerateFitnessDataTest(TestCase):
+    def test_rows_are_consistent(self):
+        totals, _ = generate(12, 20, seed=3, end=date(2026, 1, 1), chunk_size=5, batch_size=50)
+
+        self.assertEqual(totals['users'], User.objects.count())
+        self.assertEqual(totals['activities'], Activity.objects.count())
+        self.assertEqual(totals['logs'], ActivityLog.objects.count())
+        self.assertGreater(totals['activities'], 0)
+        self.assertFalse(Activity.objects.filter(status='completed', completed_date__isnull=True).exists())
+        self.assertFalse(Activity.objects.exclude(status='completed').filter(completed_date__isnull=False).exists())
+        self.assertFalse(ActivityLog.objects.filter(activity__status='planned').exists())
+        for activity in Activity.objects.exclude(status='planned').prefetch_related('logs')[:50]:
+            self.assertEqual(activity.logs.all()[0].new_status, activity.status)
+        user = User.objects.get(username=f'gen{User.objects.order_by("id").first().id}')
+        self.assertTrue(user.check_password('password123'))
+
+    def test_same_seed_same_rows(self):
+        task = {
+            'seed': 5, 'chunk': 2, 'end': datetime(2026, 1, 1), 'days': 30, 'password_hash': '',
+            'username_prefix': 'gen', 'first_activity_id': 100, 'first_log_id': 500,
+        }
+        adapt = datetime_adapter(connection)
+        first = [Generator(task, adapt).activity(100 + index, 1) for index in range(50)]
+        second = [Generator(task, adapt).activity(100 + index, 1) for index in range(50)]
+        other_seed = [Generator({**task, 'seed': 6}, adapt).activity(100 + index, 1) for index in range(50)]
+
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other_seed)
+
+    def test_generated_ids_follow_existing_rows(self):
+        User.objects.create_user(username='existing', password='testpass123')
+        call_command('generate_fitness_data', users=3, activities_per_user=5, stdout=StringIO())
+        call_command('generate_fitness_data', users=3, activities_per_user=5, stdout=StringIO())
+
+        self.assertEqual(User.objects.count(), 7)
+        # New rows inserted the normal way get ids after the generated ones
+        user = User.objects.create_user(username='after', password='testpass123')
+        self.assertEqual(user.id, User.objects.exclude(id=user.id).order_by('-id').first().id + 1)
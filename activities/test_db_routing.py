@@ -0,0 +1,135 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from activities.models import Activity, ActivityLog
+from fitness_tracker_backend.db_routers import (
+    PrimaryReplicaRouter, check_pin_cache, is_pinned, pin_to_primary, replica_reads,
+)
+from fitness_tracker_backend.middleware import ReadYourWritesMiddleware
+
+User = get_user_model()
+
+
+ROUTING_SETTINGS = {
+    'DATABASE_REPLICAS': ['replica_1', 'replica_2'],
+    'READ_YOUR_WRITES_SECONDS': 30,
+    'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'routing-tests'}},
+    'READ_YOUR_WRITES_CACHE': 'default',
+}
+
+
+@override_settings(**ROUTING_SETTINGS)
+class PrimaryReplicaRouterTest(SimpleTestCase):
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+        self.user = User(pk=1, username='reader')
+        self.request = RequestFactory().get('/api/activities/stats/')
+        self.request.user = self.user
+
+        @replica_reads
+        def read_view(request):
+            return self.router.db_for_read(Activity)
+
+        self.read_view = read_view
+
+    def tearDown(self):
+        from django.core.cache import cache
+        cache.clear()
+
+    def test_reads_go_to_primary_outside_read_only_views(self):
+        self.assertIsNone(self.router.db_for_read(Activity))
+
+    def test_read_only_views_use_a_replica(self):
+        self.assertIn(self.read_view(self.request), ['replica_1', 'replica_2'])
+
+    def test_writes_pin_the_user_to_the_primary(self):
+        activity = Activity(user=self.user, title='Swim', activity_type='workout', planned_date=timezone.now())
+        self.assertEqual(self.router.db_for_write(Activity, instance=activity), 'default')
+        self.assertIsNone(self.read_view(self.request))
+
+        other = User(pk=2, username='someone-else')
+        request = RequestFactory().get('/api/activities/stats/')
+        request.user = other
+        self.assertIn(self.read_view(request), ['replica_1', 'replica_2'])
+
+    def test_log_writes_pin_the_activity_owner(self):
+        activity = Activity(pk=1, user=self.user, title='Swim', activity_type='workout', planned_date=timezone.now())
+        self.router.db_for_write(ActivityLog, instance=ActivityLog(activity=activity, new_status='completed'))
+        self.assertIsNone(self.read_view(self.request))
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_replicas_configured(self):
+        pin_to_primary(self.user.pk)
+        self.assertIsNone(self.read_view(self.request))
+        self.assertIsNone(self.router.db_for_write(Activity))
+
+
+@override_settings(**ROUTING_SETTINGS)
+class ReadYourWritesMiddlewareTest(SimpleTestCase):
+    def setUp(self):
+        self.user = User(pk=1, username='writer')
+        self.addCleanup(cache.clear)
+
+    def request(self, method, view):
+        request = getattr(RequestFactory(), method)('/api/activities/bulk-delete/')
+        request.user = self.user
+        return ReadYourWritesMiddleware(view)(request)
+
+    def test_write_requests_pin_their_user(self):
+        # Like a queryset update(), the view saves no instance the router could see
+        self.request('post', lambda request: HttpResponse())
+        self.assertTrue(is_pinned(self.user.pk))
+
+    def test_read_requests_do_not_pin(self):
+        self.request('get', lambda request: HttpResponse())
+        self.assertFalse(is_pinned(self.user.pk))
+
+    def test_saved_rows_pin_their_owners_when_the_request_is_done(self):
+        def view(request):
+            other = User(pk=2, username='someone-else')
+            PrimaryReplicaRouter().db_for_write(Activity, instance=Activity(user=other, title='Swim'))
+            self.assertFalse(is_pinned(other.pk))
+            return HttpResponse()
+
+        self.request('post', view)
+        self.assertTrue(is_pinned(2))
+
+
+class PinCacheCheckTest(SimpleTestCase):
+    LOCMEM = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+    @override_settings(DATABASE_REPLICAS=['replica_1'], CACHES=LOCMEM, READ_YOUR_WRITES_CACHE='default')
+    def test_per_process_cache_with_replicas_is_an_error(self):
+        self.assertEqual([error.id for error in check_pin_cache(None)], ['db_routers.E002'])
+
+    @override_settings(DATABASE_REPLICAS=['replica_1'], CACHES=LOCMEM, READ_YOUR_WRITES_CACHE='pins')
+    def test_undefined_cache_is_an_error(self):
+        self.assertEqual([error.id for error in check_pin_cache(None)], ['db_routers.E001'])
+
+    @override_settings(DATABASE_REPLICAS=['replica_1'], CACHES={
+        **LOCMEM, 'pins': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'pins'},
+    }, READ_YOUR_WRITES_CACHE='pins')
+    def test_shared_cache_passes(self):
+        self.assertEqual(check_pin_cache(None), [])
+
+    @override_settings(DATABASE_REPLICAS=[], CACHES=LOCMEM, READ_YOUR_WRITES_CACHE='default')
+    def test_no_replicas_need_no_shared_cache(self):
+        self.assertEqual(check_pin_cache(None), [])
+
+
+@override_settings(**ROUTING_SETTINGS)
+class ReplicaTransactionTest(TestCase):
+    def test_reads_inside_a_transaction_stay_on_primary(self):
+        request = RequestFactory().get('/api/activities/stats/')
+        request.user = User.objects.create_user(username='reader', password='testpass123')
+
+        @replica_reads
+        def read_view(request):
+            return PrimaryReplicaRouter().db_for_read(Activity)
+
+        with transaction.atomic():
+            self.assertEqual(read_view(request), 'default')
@@ -0,0 +1,122 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from activities import rollups
+from activities.models import Activity, ActivityEvent, ActivityLog, ActivityRollup, ActivitySnapshot
+from jobs.models import Job
+from jobs.worker import Worker
+
+User = get_user_model()
+
+
+@override_settings(DELETION_BATCH_SIZE=2)
+class BackgroundDeletionTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='leaver', password='testpass123')
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}'
+        )
+        self.activities = [
+            Activity.objects.create(
+                user=self.user, title=f'Walk {index}', activity_type='steps', planned_date=timezone.now()
+            )
+            for index in range(5)
+        ]
+        for activity in self.activities:
+            activity.logs.create(old_status='planned', new_status='completed')
+
+    def test_bulk_delete_hides_at_once_and_deletes_in_background(self):
+        other = User.objects.create_user(username='other', password='testpass123')
+        theirs = Activity.objects.create(user=other, title='Swim', activity_type='workout', planned_date=timezone.now())
+        ids = [activity.id for activity in self.activities[:3]] + [theirs.id]
+
+        response = self.client.post('/api/activities/bulk-delete/', {'activity_ids': ids}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['deleted_count'], 3)
+        self.assertEqual(self.client.get('/api/activities/').data['count'], 2)
+        self.assertEqual(
+            self.client.get(f'/api/activities/{self.activities[0].id}/').status_code, status.HTTP_404_NOT_FOUND
+        )
+        self.assertEqual(Activity.objects.count(), 6)
+
+        Worker('w1').run_once()
+        job = self.client.get(response['Location']).data
+        self.assertEqual(job['status'], Job.SUCCEEDED)
+        self.assertEqual(job['progress']['done'], 3)
+        self.assertEqual(job['result'], {'deleted': 3})
+        self.assertEqual(Activity.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(ActivityLog.objects.count(), 2)
+        self.assertTrue(Activity.objects.filter(pk=theirs.pk).exists())
+
+    def test_bulk_delete_requires_integer_ids(self):
+        response = self.client.post('/api/activities/bulk-delete/', {'activity_ids': ['1; DROP']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_account_deletion_deactivates_then_deletes_in_batches(self):
+        response = self.client.delete('/api/auth/profile/')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        # Tombstoned: the same token no longer works
+        self.assertEqual(self.client.get('/api/auth/profile/').status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(Activity.objects.count(), 5)
+
+        Worker('w1').run_once()
+        job = Job.objects.get(pk=response.data['id'])
+        self.assertEqual(job.status, Job.SUCCEEDED)
+        self.assertEqual((job.progress_done, job.progress_total), (5, 5))
+        self.assertIsNone(job.user)
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+        self.assertEqual(Activity.objects.count(), 0)
+        self.assertEqual(ActivityLog.objects.count(), 0)
+
+    def test_account_deletion_purges_history_before_deleting_the_user(self):
+        self.activities[0].delete()
+        rollups.refresh()
+        self.assertEqual(ActivityEvent.objects.filter(user=self.user).count(), 6)
+        response = self.client.delete('/api/auth/profile/')
+        delete = User.delete
+        left = []
+
+        def count_left(user, *args, **kwargs):
+            # What the user's own deletion transaction still has to remove
+            left.append([
+                model.objects.filter(user_id=user.pk).count()
+                for model in (ActivityEvent, ActivitySnapshot, ActivityRollup)
+            ])
+            return delete(user, *args, **kwargs)
+
+        with mock.patch.object(User, 'delete', count_left):
+            Worker('w1').run_once()
+        self.assertEqual(Job.objects.get(pk=response.data['id']).status, Job.SUCCEEDED)
+        self.assertEqual(left, [[0, 0, 0]])
+
+    def test_account_deletion_resumes_after_a_failure(self):
+        response = self.client.delete('/api/auth/profile/')
+        report_progress = Job.report_progress
+        reports = []
+
+        def lose_connection(job, *args, **kwargs):
+            # Fail once two batches have been committed
+            reports.append(args)
+            if len(reports) == 3:
+                raise RuntimeError('connection lost')
+            return report_progress(job, *args, **kwargs)
+
+        with mock.patch.object(Job, 'report_progress', lose_connection), self.assertLogs('jobs.queue', 'WARNING'):
+            Worker('w1').run_once()
+        job = Job.objects.get(pk=response.data['id'])
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertEqual(Activity.objects.count(), 1)
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        Worker('w1').run_once()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.progress_done, job.progress_total), (Job.SUCCEEDED, 5, 5))
+        self.assertEqual(job.result, {'activities_deleted': 5})
+        self.assertEqual(Activity.objects.count(), 0)
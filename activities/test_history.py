@@ -0,0 +1,116 @@
+from django.contrib.auth import get_user_model
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from activities import history
+from activities.models import Activity, ActivityEvent, ActivitySnapshot
+
+User = get_user_model()
+
+
+@override_settings(ACTIVITY_HISTORY={'SNAPSHOT_EVERY': 3})
+class ActivityHistoryTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='historian', password='testpass123')
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}'
+        )
+        self.activity = Activity.objects.create(
+            user=self.user, title='Run', activity_type='workout', planned_date=timezone.now()
+        )
+        self.created = timezone.now()
+
+    def as_of(self, path, moment, **params):
+        return self.client.get(path, {'as_of': moment.isoformat(), **params})
+
+    def test_saves_record_only_changed_fields(self):
+        self.client.patch(f'/api/activities/{self.activity.id}/', {'title': 'Long run'}, format='json')
+
+        created, updated = ActivityEvent.objects.filter(activity_id=self.activity.id).order_by('version')
+        self.assertEqual(created.kind, ActivityEvent.CREATED)
+        self.assertEqual(created.changes['title'], 'Run')
+        self.assertEqual((updated.kind, updated.version, updated.changes), (ActivityEvent.UPDATED, 2, {'title': 'Long run'}))
+
+    def test_snapshots_every_few_versions(self):
+        for index in range(5):
+            self.activity.title = f'Run {index}'
+            self.activity.save()
+
+        versions = list(ActivitySnapshot.objects.filter(activity_id=self.activity.id).values_list('version', flat=True))
+        self.assertEqual(sorted(versions), [3, 6])
+
+    def test_detail_as_of_replays_from_the_nearest_snapshot(self):
+        moments = []
+        for index in range(7):
+            self.activity.title = f'Run {index}'
+            self.activity.save()
+            moments.append(timezone.now())
+
+        with self.assertNumQueries(4):
+            # The token's user, the snapshot, the events after it, logs
+            response = self.as_of(f'/api/activities/{self.activity.id}/', moments[4])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['title'], response.data['user']['username']), ('Run 4', 'historian'))
+        self.assertEqual(self.as_of(f'/api/activities/{self.activity.id}/', self.created).data['title'], 'Run')
+        self.assertEqual(self.client.get(f'/api/activities/{self.activity.id}/').data['title'], 'Run 6')
+
+    def test_as_of_before_creation_is_not_found(self):
+        before = self.activity.created_at.replace(year=2000)
+        response = self.as_of(f'/api/activities/{self.activity.id}/', before)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_list_as_of_includes_activities_deleted_since(self):
+        second = Activity.objects.create(user=self.user, title='Swim', activity_type='workout', planned_date=timezone.now())
+        self.client.patch(f'/api/activities/{second.id}/', {'status': 'completed'}, format='json')
+        both = timezone.now()
+        self.client.delete(f'/api/activities/{self.activity.id}/')
+        self.client.post('/api/activities/bulk-delete/', {'activity_ids': [second.id]}, format='json')
+
+        self.assertEqual(self.client.get('/api/activities/').data['count'], 0)
+        response = self.as_of('/api/activities/', both, fields='id,title,status')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(row['title'], row['status']) for row in response.data['results']],
+            [('Swim', 'completed'), ('Run', 'planned')]
+        )
+        earlier = self.as_of('/api/activities/', self.created).data['results']
+        self.assertEqual([row['title'] for row in earlier], ['Run'])
+
+    def test_list_as_of_rejects_filters(self):
+        response = self.as_of('/api/activities/', self.created, status='planned')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_as_of_date_means_the_end_of_that_day(self):
+        today = self.client.get(f'/api/activities/{self.activity.id}/', {'as_of': timezone.now().date().isoformat()})
+        self.assertEqual(today.status_code, status.HTTP_200_OK)
+
+        for value in ('yesterday', '2024-02-30'):
+            response = self.client.get(f'/api/activities/{self.activity.id}/', {'as_of': value})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_rows_from_before_history_keep_a_baseline(self):
+        # As generate_fitness_data writes them: version 0, no events
+        ActivityEvent.objects.all().delete()
+        Activity.objects.filter(pk=self.activity.pk).update(version=0)
+        before_change = timezone.now()
+
+        activity = Activity.objects.get(pk=self.activity.pk)
+        activity.title = 'Tempo run'
+        activity.save()
+
+        self.assertEqual(history.reconstruct([activity.pk], before_change)[activity.pk].title, 'Run')
+        self.assertEqual(history.reconstruct([activity.pk], timezone.now())[activity.pk].title, 'Tempo run')
+
+    def test_other_users_activities_are_not_served(self):
+        other = User.objects.create_user(username='other', password='testpass123')
+        theirs = Activity.objects.create(user=other, title='Swim', activity_type='workout', planned_date=timezone.now())
+        response = self.as_of(f'/api/activities/{theirs.id}/', timezone.now())
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_history_goes_with_the_user(self):
+        self.user.delete()
+        self.assertFalse(ActivityEvent.objects.exists())
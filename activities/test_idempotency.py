@@ -0,0 +1,122 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from activities.idempotency import idempotent_response, purge_expired_keys
+from activities.models import Activity, ActivityLog, IdempotencyKey
+
+User = get_user_model()
+
+
+class IdempotencyKeyTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='retrier', password='testpass123')
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}'
+        )
+        self.payload = {
+            'title': 'Lunch',
+            'activity_type': 'meal',
+            'planned_date': timezone.now().isoformat(),
+        }
+
+    def test_retried_create_is_replayed(self):
+        first = self.client.post('/api/activities/', self.payload, format='json', HTTP_IDEMPOTENCY_KEY='abc')
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.post('/api/activities/', self.payload, format='json', HTTP_IDEMPOTENCY_KEY='abc')
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(Activity.objects.count(), 1)
+        self.assertFalse(any('activities_activity' in q['sql'] for q in queries.captured_queries))
+
+    def test_key_reused_with_different_payload(self):
+        self.client.post('/api/activities/', self.payload, format='json', HTTP_IDEMPOTENCY_KEY='abc')
+        response = self.client.post(
+            '/api/activities/', {**self.payload, 'title': 'Dinner'}, format='json', HTTP_IDEMPOTENCY_KEY='abc'
+        )
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(Activity.objects.count(), 1)
+
+    def test_in_flight_duplicate_conflicts(self):
+        IdempotencyKey.objects.create(
+            user=self.user, key='busy', fingerprint='x' * 64,
+            expires_at=timezone.now() + timedelta(hours=1)
+        )
+        response = self.client.post('/api/activities/', self.payload, format='json', HTTP_IDEMPOTENCY_KEY='busy')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(Activity.objects.count(), 0)
+
+    def test_stale_in_flight_claim_is_taken_over(self):
+        # Left behind by a worker killed while handling the request
+        IdempotencyKey.objects.create(
+            user=self.user, key='orphan', fingerprint='x' * 64,
+            claimed_at=timezone.now() - timedelta(minutes=5),
+            expires_at=timezone.now() + timedelta(hours=1)
+        )
+        with self.settings(IDEMPOTENCY_KEY_LEASE_SECONDS=120):
+            first = self.client.post('/api/activities/', self.payload, format='json', HTTP_IDEMPOTENCY_KEY='orphan')
+            second = self.client.post('/api/activities/', self.payload, format='json', HTTP_IDEMPOTENCY_KEY='orphan')
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn('Idempotent-Replayed', first)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(Activity.objects.count(), 1)
+
+    def test_taken_over_request_does_not_store_its_response(self):
+        request = mock.Mock(user=self.user, headers={'Idempotency-Key': 'slow'}, method='POST', path='/x/', data={})
+
+        def handler():
+            # A retry takes the claim over while this request is still running
+            IdempotencyKey.objects.update(claimed_at=timezone.now())
+            return Response({'id': 1}, status=status.HTTP_201_CREATED)
+
+        idempotent_response(request, handler)
+        self.assertIsNone(IdempotencyKey.objects.get().status_code)
+
+    def test_job_location_is_replayed(self):
+        activity = Activity.objects.create(
+            user=self.user, title='Run', activity_type='workout', planned_date=timezone.now()
+        )
+        requests = [
+            ('/api/activities/export/', {}),
+            ('/api/activities/bulk-delete/', {'activity_ids': [activity.id]}),
+        ]
+        for path, data in requests:
+            first = self.client.post(path, data, format='json', HTTP_IDEMPOTENCY_KEY=path)
+            second = self.client.post(path, data, format='json', HTTP_IDEMPOTENCY_KEY=path)
+            self.assertEqual(second.status_code, status.HTTP_202_ACCEPTED)
+            self.assertEqual(second['Idempotent-Replayed'], 'true')
+            self.assertEqual(second['Location'], first['Location'])
+
+    def test_bulk_update_replay_does_not_duplicate_logs(self):
+        activity = Activity.objects.create(
+            user=self.user, title='Run', activity_type='workout', planned_date=timezone.now()
+        )
+        data = {'activity_ids': [activity.id], 'status': 'completed'}
+        for _ in range(2):
+            response = self.client.post('/api/activities/bulk-update/', data, format='json', HTTP_IDEMPOTENCY_KEY='bulk-1')
+            self.assertEqual(response.data['updated_count'], 1)
+        self.assertEqual(ActivityLog.objects.filter(activity=activity).count(), 1)
+
+    def test_expired_keys_are_purged_and_reclaimable(self):
+        self.client.post('/api/activities/', self.payload, format='json', HTTP_IDEMPOTENCY_KEY='old')
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        response = self.client.post('/api/activities/', self.payload, format='json', HTTP_IDEMPOTENCY_KEY='old')
+        self.assertNotIn('Idempotent-Replayed', response)
+        self.assertEqual(Activity.objects.count(), 2)
+
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(purge_expired_keys(), 1)
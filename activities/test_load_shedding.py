@@ -0,0 +1,120 @@
+import threading
+import time
+
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from fitness_tracker_backend.load_shedding import (
+    HIGH, LOW, NORMAL, AIMDLimit, ConcurrencyLimiter, LoadSheddingMiddleware,
+)
+
+
+SHARES = {HIGH: 1.0, NORMAL: 0.8, LOW: 0.5}
+
+
+class AIMDLimitTest(SimpleTestCase):
+    def setUp(self):
+        self.limit = AIMDLimit(initial=10, minimum=2, maximum=20, tolerance=2.0, backoff=0.5)
+
+    def test_grows_by_about_one_per_window_while_latency_holds(self):
+        for _ in range(10):
+            self.limit.update('detail', 0.01, in_flight=10)
+        self.assertAlmostEqual(self.limit.value, 11, delta=0.1)
+
+    def test_backs_off_when_a_view_slows_down(self):
+        # Learnt while idle, so the limit doesn't move yet
+        for _ in range(5):
+            self.limit.update('stats', 0.01, in_flight=1, now=0)
+        for _ in range(5):
+            self.limit.update('stats', 0.1, in_flight=10, now=1)
+        # Once per slow response time, however many report it
+        self.assertEqual(self.limit.value, 5)
+        self.limit.update('stats', 0.1, in_flight=10, now=1.2)
+        self.assertEqual(self.limit.value, 2.5)
+        self.limit.update('stats', 0.1, in_flight=10, now=1.4)
+        self.assertEqual(self.limit.value, 2)
+
+    def test_idle_workers_keep_their_limit(self):
+        self.limit.update('stats', 0.01, in_flight=1, now=0)
+        self.limit.update('stats', 1.0, in_flight=1, now=1)
+        self.assertEqual(self.limit.value, 10)
+
+
+class ConcurrencyLimiterTest(SimpleTestCase):
+    def limiter(self, limit):
+        return ConcurrencyLimiter(AIMDLimit(limit, 1, limit, 2.0, 0.9), SHARES)
+
+    def wait_in_background(self, limiter, priority, admitted):
+        waiting = len(limiter._waiting)
+
+        def wait():
+            if limiter.acquire(priority, 5):
+                admitted.append(priority)
+        thread = threading.Thread(target=wait)
+        thread.start()
+        while len(limiter._waiting) == waiting:
+            time.sleep(0.001)
+        return thread
+
+    def test_sheds_after_the_queue_budget(self):
+        limiter = self.limiter(1)
+        self.assertTrue(limiter.acquire(NORMAL, 0))
+        self.assertFalse(limiter.acquire(HIGH, 0.01))
+        limiter.release('detail', 0.01)
+        self.assertTrue(limiter.acquire(HIGH, 0))
+
+    def test_higher_priority_goes_first(self):
+        limiter = self.limiter(1)
+        limiter.acquire(NORMAL, 0)
+        admitted = []
+        low = self.wait_in_background(limiter, LOW, admitted)
+        high = self.wait_in_background(limiter, HIGH, admitted)
+
+        limiter.release('detail', 0.01)
+        high.join()
+        self.assertEqual(admitted, [HIGH])
+        limiter.release('detail', 0.01)
+        low.join()
+        self.assertEqual(admitted, [HIGH, LOW])
+
+    def test_low_priority_leaves_room_for_the_rest(self):
+        limiter = self.limiter(4)
+        self.assertTrue(limiter.acquire(LOW, 0))
+        self.assertTrue(limiter.acquire(LOW, 0))
+        self.assertFalse(limiter.acquire(LOW, 0))
+        self.assertTrue(limiter.acquire(HIGH, 0))
+        self.assertTrue(limiter.acquire(NORMAL, 0))
+
+
+@override_settings(LOAD_SHEDDING={
+    'ENABLED': True,
+    'INITIAL_LIMIT': 1,
+    'MIN_LIMIT': 1,
+    'QUEUE_BUDGET_MS': {HIGH: 0, NORMAL: 0, LOW: 0},
+    'RETRY_AFTER_SECONDS': 2,
+    'PRIORITIES': {'activity-stats': LOW},
+    'EXEMPT': ['activity-events'],
+})
+class LoadSheddingMiddlewareTest(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.middleware = LoadSheddingMiddleware(lambda request: HttpResponse('ok'))
+
+    def test_sheds_with_retry_after_when_full(self):
+        self.assertEqual(self.middleware(self.factory.get('/api/activities/stats/')).status_code, 200)
+
+        self.middleware.limiter.in_flight = 1
+        response = self.middleware(self.factory.get('/api/activities/stats/'))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '2')
+
+    def test_priorities_by_url_name_and_method(self):
+        stats = self.middleware.classify(self.factory.get('/api/activities/stats/'))
+        detail = self.middleware.classify(self.factory.get('/api/activities/1/'))
+        self.assertEqual(stats, ('activity-stats', LOW))
+        self.assertEqual(detail, ('activity-detail', NORMAL))
+
+    def test_exempt_and_other_paths_are_not_limited(self):
+        self.middleware.limiter.in_flight = 1
+        self.assertEqual(self.middleware(self.factory.get('/api/activities/events/')).status_code, 200)
+        self.assertEqual(self.middleware(self.factory.get('/admin/')).status_code, 200)
@@ -0,0 +1,45 @@
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase
+
+from fitness_tracker_backend.middleware import RouteMiddleware
+
+User = get_user_model()
+
+
+class RouteMiddlewareTest(TestCase):
+    def test_api_requests_skip_browser_middleware(self):
+        response = self.client.get('/api/activities/')
+        self.assertEqual(response.status_code, 401)
+        self.assertNotIn('X-Frame-Options', response)
+        self.assertNotIn('csrftoken', response.cookies)
+        self.assertFalse(hasattr(response.wsgi_request, 'session'))
+
+    def test_admin_gets_full_chain(self):
+        response = self.client.get('/admin/login/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Frame-Options'], 'DENY')
+        self.assertIn('csrftoken', response.cookies)
+
+        self.client.force_login(User.objects.create_superuser(username='admin', password='testpass123'))
+        self.assertEqual(self.client.get('/admin/').status_code, 200)
+
+    def test_admin_csrf_is_enforced(self):
+        client = Client(enforce_csrf_checks=True)
+        response = client.post('/admin/login/', {'username': 'admin', 'password': 'testpass123'})
+        self.assertEqual(response.status_code, 403)
+
+
+class AsyncRouteMiddlewareTest(SimpleTestCase):
+    def test_async_dispatch(self):
+        async def get_response(request):
+            return HttpResponse('ok')
+
+        middleware = RouteMiddleware(get_response)
+        factory = RequestFactory()
+        api_response = async_to_sync(middleware)(factory.get('/api/activities/'))
+        self.assertNotIn('X-Frame-Options', api_response)
+
+        admin_response = async_to_sync(middleware)(factory.get('/admin/'))
+        self.assertEqual(admin_response['X-Frame-Options'], 'DENY')
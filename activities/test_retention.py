@@ -0,0 +1,73 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from activities import retention
+from activities.models import Activity, ActivityLog, ActivityLogArchive
+
+User = get_user_model()
+
+
+class LogRetentionTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='keeper', password='testpass123')
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}'
+        )
+        self.activity = Activity.objects.create(
+            user=self.user, title='Run', activity_type='workout', planned_date=timezone.now()
+        )
+        now = timezone.now()
+        for age, (old_status, new_status) in zip(
+            (200, 150, 1), [('planned', 'in_progress'), ('in_progress', 'planned'), ('planned', 'completed')]
+        ):
+            log = self.activity.logs.create(old_status=old_status, new_status=new_status, notes=f'{age} days ago')
+            ActivityLog.objects.filter(pk=log.pk).update(created_at=now - timedelta(days=age))
+
+    def test_old_logs_move_to_the_archive_in_batches(self):
+        totals = retention.archive_logs(days=90, batch_size=1)
+
+        self.assertEqual(totals, {'logs': 2, 'archives': 2})
+        self.assertEqual(list(self.activity.logs.values_list('notes', flat=True)), ['1 days ago'])
+        archived = [entry for archive in ActivityLogArchive.objects.all() for entry in retention.unpack_entries(archive)]
+        self.assertEqual([entry['notes'] for entry in archived], ['200 days ago', '150 days ago'])
+        self.assertEqual(retention.archive_logs(days=90), {'logs': 0, 'archives': 0})
+
+    def test_recent_logs_inline_and_archived_history_on_demand(self):
+        retention.archive_logs(days=90)
+
+        detail = self.client.get(f'/api/activities/{self.activity.id}/').data
+        self.assertEqual([log['notes'] for log in detail['logs']], ['1 days ago'])
+
+        response = self.client.get(f'/api/activities/{self.activity.id}/history/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([log['notes'] for log in response.data['logs']], ['1 days ago'])
+        self.assertEqual([log['notes'] for log in response.data['archived_logs']], ['150 days ago', '200 days ago'])
+        self.assertEqual(response.data['archived_summaries'], [])
+
+    def test_summarize_policy_keeps_only_counts(self):
+        out = StringIO()
+        call_command('archive_activity_logs', days=90, policy='summarize', stdout=out)
+        self.assertIn('Archived 2 logs into 1 archive rows', out.getvalue())
+
+        archive = ActivityLogArchive.objects.get()
+        self.assertIsNone(archive.entries)
+        self.assertEqual(archive.log_count, 2)
+        self.assertEqual(archive.transitions, {'planned>in_progress': 1, 'in_progress>planned': 1})
+
+        history = self.client.get(f'/api/activities/{self.activity.id}/history/').data
+        self.assertEqual(history['archived_logs'], [])
+        self.assertEqual(history['archived_summaries'][0]['log_count'], 2)
+
+    def test_history_of_another_users_activity_is_not_found(self):
+        other = User.objects.create_user(username='other', password='testpass123')
+        theirs = Activity.objects.create(user=other, title='Swim', activity_type='workout', planned_date=timezone.now())
+        response = self.client.get(f'/api/activities/{theirs.id}/history/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
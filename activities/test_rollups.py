@@ -0,0 +1,153 @@
+from datetime import date, timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import SimpleTestCase, override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from activities import rollups
+from activities.models import Activity, ActivityRollup, RollupCheckpoint
+
+User = get_user_model()
+
+
+class PeriodTest(SimpleTestCase):
+    def test_weeks_start_on_monday(self):
+        self.assertEqual(rollups.period_start(rollups.WEEK, date(2026, 1, 1)), date(2025, 12, 29))
+        self.assertEqual(rollups.next_start(rollups.WEEK, date(2025, 12, 29)), date(2026, 1, 5))
+        self.assertEqual(rollups.previous_start(rollups.WEEK, date(2025, 12, 29)), date(2025, 12, 22))
+
+    def test_months_across_the_year(self):
+        self.assertEqual(rollups.period_start(rollups.MONTH, date(2026, 1, 31)), date(2026, 1, 1))
+        self.assertEqual(rollups.next_start(rollups.MONTH, date(2026, 1, 1)), date(2026, 2, 1))
+        self.assertEqual(rollups.previous_start(rollups.MONTH, date(2026, 1, 1)), date(2025, 12, 1))
+
+    def test_changes_between_periods(self):
+        previous = rollups.summary(rollups.MONTH, date(2026, 9, 1), {
+            'activity_count': 4, 'completed_count': 2, 'calories_burned': 200, 'steps': 0, 'duration_minutes': 60,
+        })
+        current = rollups.summary(rollups.MONTH, date(2026, 10, 1), {
+            'activity_count': 4, 'completed_count': 3, 'calories_burned': 300, 'steps': 500, 'duration_minutes': 45,
+        })
+        changes = rollups.changes(current, previous)
+        self.assertEqual(changes['calories_burned'], {'current': 300, 'previous': 200, 'change': 100, 'change_percent': 50.0})
+        self.assertEqual(changes['duration_minutes']['change_percent'], -25.0)
+        self.assertIsNone(changes['steps']['change_percent'])
+        self.assertEqual(changes['completion_rate']['change'], 25.0)
+
+
+class RollupTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='roller', password='testpass123')
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}'
+        )
+        self.today = timezone.localdate()
+        self.this_month = rollups.period_start(rollups.MONTH, self.today)
+        self.last_month = rollups.previous_start(rollups.MONTH, self.this_month)
+
+    def create_activity(self, created_on, **fields):
+        fields = {'title': 'Run', 'activity_type': 'workout', 'planned_date': timezone.now(), **fields}
+        activity = Activity.objects.create(user=self.user, **fields)
+        # Created earlier than now; the event still marks it as changed now
+        created_at = timezone.now().replace(year=created_on.year, month=created_on.month, day=created_on.day)
+        Activity.objects.filter(pk=activity.pk).update(created_at=created_at)
+        activity.refresh_from_db()
+        return activity
+
+    def refresh(self, **kwargs):
+        return rollups.refresh(now=timezone.now() + timedelta(seconds=1), **kwargs)
+
+    def rollup(self, start, period=rollups.MONTH):
+        return ActivityRollup.objects.get(user=self.user, period=period, start=start)
+
+    def test_first_refresh_builds_every_period(self):
+        self.create_activity(self.last_month, status='completed', calories_burned=300, steps_count=1000)
+        self.create_activity(self.last_month, activity_type='meal', calories_consumed=600)
+        self.create_activity(self.last_month, calories_burned=50, deleted=True)
+        self.create_activity(self.today, duration_minutes=30)
+
+        self.assertEqual(self.refresh(), {'users': 1, 'rollups': ActivityRollup.objects.count()})
+        last = self.rollup(self.last_month)
+        self.assertEqual((last.activity_count, last.completed_count, last.planned_count), (2, 1, 1))
+        self.assertEqual((last.calories_burned, last.calories_consumed, last.steps), (300, 600, 1000))
+        self.assertEqual(last.activities_by_type, {'workout': 1, 'meal': 1})
+        self.assertEqual(self.rollup(self.this_month).duration_minutes, 30)
+        week = rollups.period_start(rollups.WEEK, self.today)
+        self.assertEqual(self.rollup(week, rollups.WEEK).activity_count, 1)
+
+    @override_settings(ACTIVITY_ROLLUPS={'OVERLAP_SECONDS': 0})
+    def test_refresh_only_recomputes_changed_periods(self):
+        changed = self.create_activity(self.last_month, calories_burned=100)
+        untouched = self.create_activity(self.today, calories_burned=100)
+        # Before the changes below, after the events so far
+        rollups.refresh(now=timezone.now())
+        # Edited behind the refresh's back: only events trigger a recompute
+        Activity.objects.filter(pk=untouched.pk).update(calories_burned=999)
+
+        changed.calories_burned = 250
+        changed.save()
+        self.create_activity(self.last_month, calories_burned=50).delete()
+        self.refresh()
+
+        self.assertEqual(self.rollup(self.last_month).calories_burned, 250)
+        self.assertEqual(self.rollup(self.this_month).calories_burned, 100)
+
+    def test_deleting_the_last_activity_of_a_period_removes_its_rollup(self):
+        self.create_activity(self.last_month)
+        self.refresh()
+        Activity.objects.get().delete()
+        self.refresh()
+        self.assertFalse(ActivityRollup.objects.filter(start=self.last_month).exists())
+
+    def test_stats_read_closed_periods_from_the_rollups(self):
+        self.create_activity(self.last_month, status='completed', calories_burned=200)
+        self.refresh()
+        # The rollup is what answers for last month...
+        ActivityRollup.objects.filter(start=self.last_month, period=rollups.MONTH).update(calories_burned=400)
+        self.create_activity(self.today, status='completed', calories_burned=300)
+
+        response = self.client.get('/api/activities/stats/')
+        self.assertEqual(response.data['previous']['totals']['calories_burned'], 400)
+        # ...and the current month is counted live
+        self.assertEqual(response.data['current']['totals']['calories_burned'], 300)
+        self.assertEqual(response.data['changes']['calories_burned']['change_percent'], -25.0)
+
+    def test_stats_are_counted_live_before_the_first_refresh(self):
+        self.create_activity(self.last_month, calories_burned=200)
+        response = self.client.get('/api/activities/stats/')
+        self.assertEqual(response.data['previous']['totals']['calories_burned'], 200)
+
+    def test_a_year_of_weeks_reads_one_row_per_week(self):
+        for weeks_ago in range(0, 52, 4):
+            self.create_activity(self.today - timedelta(weeks=weeks_ago), calories_burned=10)
+        self.refresh()
+
+        # Checkpoint, rollups, and the two aggregates over the current week
+        with self.assertNumQueries(4 + 1):  # plus the JWT user
+            response = self.client.get('/api/activities/stats/', {'period': 'week', 'periods': 52})
+        history = response.data['history']
+        self.assertEqual(len(history), 52)
+        self.assertEqual(sum(week['totals']['calories_burned'] for week in history), 130)
+        self.assertEqual(history[-1]['start'], rollups.period_start(rollups.WEEK, self.today))
+
+    def test_invalid_periods_are_rejected(self):
+        for params in ({'period': 'year'}, {'periods': 1}, {'periods': 'many'}, {'periods': 1000}):
+            response = self.client.get('/api/activities/stats/', params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('error', response.data)
+
+    def test_command_and_user_deletion(self):
+        self.create_activity(self.today)
+        out = StringIO()
+        call_command('refresh_activity_rollups', stdout=out)
+        self.assertIn('Refreshed 2 rollups for 1 users', out.getvalue())
+        self.assertTrue(RollupCheckpoint.objects.filter(database='default').exists())
+
+        self.user.delete()
+        self.assertFalse(ActivityRollup.objects.exists())
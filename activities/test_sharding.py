@@ -0,0 +1,138 @@
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from activities import retention, rollups, sharding
+from activities.models import (
+    Activity, ActivityEvent, ActivityLog, ActivityLogArchive, ActivityRollup, ShardAssignment,
+)
+
+User = get_user_model()
+SHARDS = ['shard_1', 'shard_2']
+
+
+class HashRingTest(TestCase):
+    databases = set()
+
+    def test_users_spread_across_shards(self):
+        ring = sharding.HashRing(SHARDS)
+        placement = Counter(ring.get(user_id) for user_id in range(2000))
+        self.assertEqual(set(placement), set(SHARDS))
+        self.assertGreater(min(placement.values()), 700)
+
+    def test_adding_a_shard_moves_a_fraction_of_users(self):
+        before = sharding.HashRing(SHARDS)
+        after = sharding.HashRing(SHARDS + ['shard_3'])
+        moved = [user_id for user_id in range(3000) if before.get(user_id) != after.get(user_id)]
+        self.assertTrue(all(after.get(user_id) == 'shard_3' for user_id in moved))
+        self.assertLess(len(moved), 1500)
+
+
+@override_settings(ACTIVITY_SHARDS=SHARDS)
+class ShardedActivityAPITest(TestCase):
+    databases = {'default', 'shard_1', 'shard_2'}
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='sharded', password='testpass123')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        self.home = sharding.ring_shard(self.user.pk)
+        self.other = next(alias for alias in SHARDS if alias != self.home)
+
+    def create_activity(self, title):
+        response = self.client.post('/api/activities/', {
+            'title': title,
+            'activity_type': 'workout',
+            'planned_date': timezone.now().isoformat(),
+            'calories_burned': 100,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return Activity.objects.using(self.home).get(title=title)
+
+    def test_activities_live_on_the_users_shard(self):
+        activity = self.create_activity('Row')
+        self.assertEqual(ShardAssignment.objects.get(user=self.user).alias, self.home)
+        self.assertFalse(Activity.objects.using(self.other).exists())
+        self.assertFalse(Activity.objects.using('default').exists())
+
+        response = self.client.patch(f'/api/activities/{activity.id}/', {'status': 'completed'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(ActivityLog.objects.using(self.home).get().new_status, 'completed')
+
+        response = self.client.post('/api/activities/bulk-update/', {
+            'activity_ids': [activity.id], 'status': 'cancelled'
+        }, format='json')
+        self.assertEqual(response.data['updated_count'], 1)
+
+        response = self.client.get('/api/activities/?expand=logs')
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(len(response.data['results'][0]['logs']), 2)
+        self.assertEqual(self.client.get('/api/activities/stats/').data['current']['totals']['calories_burned'], 100)
+
+    def test_move_user_keeps_ids_and_history(self):
+        first = self.create_activity('Row')
+        second = self.create_activity('Lift')
+        self.client.patch(f'/api/activities/{first.id}/', {'status': 'completed'}, format='json')
+
+        moved = sharding.move_user(self.user.pk, self.other, batch_size=1, grace_seconds=0)
+
+        self.assertEqual(moved, 2)
+        self.assertEqual(ShardAssignment.objects.get(user=self.user).alias, self.other)
+        self.assertFalse(Activity.objects.using(self.home).exists())
+        self.assertFalse(ActivityLog.objects.using(self.home).exists())
+        moved_first = Activity.objects.using(self.other).get(id=first.id)
+        self.assertEqual(moved_first.created_at, first.created_at)
+        self.assertEqual(moved_first.logs.count(), 1)
+
+        response = self.client.get(f'/api/activities/batch/?ids={second.id},{first.id}')
+        self.assertEqual([item['id'] for item in response.data['results']], [second.id, first.id])
+
+    def test_archived_logs_stay_with_the_user(self):
+        activity = self.create_activity('Row')
+        self.client.patch(f'/api/activities/{activity.id}/', {'status': 'completed'}, format='json')
+        self.assertEqual(retention.archive_logs(days=0), {'logs': 1, 'archives': 1})
+        self.assertTrue(ActivityLogArchive.objects.using(self.home).exists())
+
+        sharding.move_user(self.user.pk, self.other, grace_seconds=0)
+        self.assertFalse(ActivityLogArchive.objects.using(self.home).exists())
+        response = self.client.get(f'/api/activities/{activity.id}/history/')
+        self.assertEqual([log['new_status'] for log in response.data['archived_logs']], ['completed'])
+
+    def test_history_moves_with_the_user(self):
+        activity = self.create_activity('Row')
+        before = timezone.now()
+        self.client.patch(f'/api/activities/{activity.id}/', {'title': 'Rowing'}, format='json')
+
+        sharding.move_user(self.user.pk, self.other, grace_seconds=0)
+        self.assertFalse(ActivityEvent.objects.using(self.home).exists())
+        self.assertEqual(ActivityEvent.objects.using(self.other).count(), 2)
+        response = self.client.get(f'/api/activities/{activity.id}/', {'as_of': before.isoformat()})
+        self.assertEqual(response.data['title'], 'Row')
+
+    def test_rollups_are_rebuilt_on_the_new_shard(self):
+        self.create_activity('Row')
+        rollups.refresh()
+        self.assertEqual(ActivityRollup.objects.using(self.home).count(), 2)
+
+        sharding.move_user(self.user.pk, self.other, grace_seconds=0)
+        self.assertFalse(ActivityRollup.objects.using(self.home).exists())
+        moved = ActivityRollup.objects.using(self.other).get(period=rollups.MONTH)
+        self.assertEqual(moved.calories_burned, 100)
+
+    def test_writes_are_refused_while_moving(self):
+        activity = self.create_activity('Row')
+        ShardAssignment.objects.filter(user=self.user).update(moving=True)
+
+        response = self.client.patch(f'/api/activities/{activity.id}/', {'status': 'completed'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(self.client.get(f'/api/activities/{activity.id}/').status_code, status.HTTP_200_OK)
+
+    def test_deleting_user_removes_sharded_rows(self):
+        self.create_activity('Row')
+        self.user.delete()
+        self.assertFalse(Activity.objects.using(self.home).exists())
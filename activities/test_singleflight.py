@@ -0,0 +1,137 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient, APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from activities.models import Activity
+from fitness_tracker_backend import singleflight
+
+User = get_user_model()
+
+
+class SingleFlightTest(SimpleTestCase):
+    def setUp(self):
+        self.calls = 0
+        self.release = threading.Event()
+
+    def slow(self, value='result'):
+        def compute():
+            self.calls += 1
+            self.release.wait(5)
+            return value
+        return compute
+
+    def start_leader(self, pool, key, compute):
+        leader = pool.submit(singleflight.run, key, compute)
+        while key not in singleflight._flights:
+            pass
+        return leader
+
+    def test_concurrent_callers_share_one_computation(self):
+        with ThreadPoolExecutor(5) as pool:
+            leader = self.start_leader(pool, 'same', self.slow())
+            followers = [pool.submit(singleflight.run, 'same', self.slow()) for _ in range(4)]
+            self.release.set()
+            results = [leader.result()] + [follower.result() for follower in followers]
+
+        self.assertEqual(results, ['result'] * 5)
+        self.assertEqual(self.calls, 1)
+        # Nothing in flight any more: the next call computes again
+        self.assertEqual(singleflight.run('same', lambda: 'again'), 'again')
+
+    def test_different_keys_dont_wait_for_each_other(self):
+        with ThreadPoolExecutor(2) as pool:
+            leader = self.start_leader(pool, 'one', self.slow())
+            self.assertEqual(singleflight.run('two', lambda: 'two'), 'two')
+            self.release.set()
+            leader.result()
+
+    def test_followers_get_the_leaders_error(self):
+        def fail():
+            self.release.wait(5)
+            raise ValueError('database went away')
+
+        with ThreadPoolExecutor(2) as pool:
+            leader = self.start_leader(pool, 'failing', fail)
+            follower = pool.submit(singleflight.run, 'failing', self.slow())
+            self.release.set()
+            with self.assertRaises(ValueError):
+                leader.result()
+            with self.assertRaises(ValueError):
+                follower.result()
+        self.assertEqual(self.calls, 0)
+
+    @override_settings(SINGLE_FLIGHT={'STALE_SECONDS': 60})
+    def test_followers_take_the_last_result_while_it_is_refreshed(self):
+        self.assertEqual(singleflight.run('stats', lambda: 'old'), 'old')
+
+        with ThreadPoolExecutor(1) as pool:
+            leader = self.start_leader(pool, 'stats', self.slow('new'))
+            self.assertEqual(singleflight.run('stats', self.slow('unused')), 'old')
+            self.release.set()
+            self.assertEqual(leader.result(), 'new')
+        self.assertEqual(self.calls, 1)
+
+    @override_settings(SINGLE_FLIGHT={'WAIT_SECONDS': 0.01})
+    def test_followers_stop_waiting_for_a_stuck_leader(self):
+        with ThreadPoolExecutor(1) as pool:
+            leader = self.start_leader(pool, 'stuck', self.slow())
+            self.assertEqual(singleflight.run('stuck', lambda: 'own'), 'own')
+            self.release.set()
+            leader.result()
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'single-flight-tests'}},
+    SINGLE_FLIGHT={'CACHE': 'default', 'POLL_SECONDS': 0.001},
+)
+class SharedSingleFlightTest(SimpleTestCase):
+    def tearDown(self):
+        cache.clear()
+
+    def test_waits_for_the_result_of_another_worker(self):
+        # Another worker holds the lock and publishes its result shortly
+        cache.add('single-flight:lock:stats', 'other-worker')
+
+        def other_worker_finishes():
+            cache.set('single-flight:stats', (singleflight.time.time(), 'theirs'))
+            cache.delete('single-flight:lock:stats')
+
+        timer = threading.Timer(0.05, other_worker_finishes)
+        timer.start()
+        self.assertEqual(singleflight.run('stats', lambda: 'ours'), 'theirs')
+        timer.join()
+
+    def test_computes_and_publishes_when_no_one_else_is(self):
+        self.assertEqual(singleflight.run('stats', lambda: 'ours'), 'ours')
+        self.assertEqual(cache.get('single-flight:stats')[1], 'ours')
+        self.assertIsNone(cache.get('single-flight:lock:stats'))
+
+
+class CoalescedEndpointsTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='tabs', password='testpass123')
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}'
+        )
+
+    def test_results_are_not_reused_once_computed(self):
+        self.assertEqual(self.client.get('/api/activities/stats/').data['current']['total_activities'], 0)
+        Activity.objects.create(user=self.user, title='Run', activity_type='workout', planned_date=timezone.now())
+        self.assertEqual(self.client.get('/api/activities/stats/').data['current']['total_activities'], 1)
+        self.assertEqual(self.client.get('/api/auth/dashboard/').data['stats']['total_activities'], 1)
+
+    def test_key_covers_the_user_and_query_parameters(self):
+        other = User.objects.create_user(username='other', password='testpass123')
+        keys = set()
+        for user, params in [(self.user, {}), (self.user, {'fields': 'id'}), (other, {})]:
+            request = RequestFactory().get('/api/auth/dashboard/', params)
+            request.user = user
+            keys.add(singleflight.request_key('user-dashboard', request))
+        self.assertEqual(len(keys), 3)
@@ -0,0 +1,105 @@
+import os
+import sqlite3
+import tempfile
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase
+from django.test.utils import CaptureQueriesContext
+
+from fitness_tracker_backend.middleware import WriteTransactionMiddleware
+from fitness_tracker_backend.sqlite_backend import write_transactions
+from fitness_tracker_backend.sqlite_backend.base import DatabaseWrapper
+
+
+def tuned_settings(name, **options):
+    return {
+        'ENGINE': 'fitness_tracker_backend.sqlite_backend',
+        'NAME': name,
+        'OPTIONS': {
+            'timeout': 1,
+            'pragmas': {'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'cache_size': -2048},
+            **options,
+        },
+        'ATOMIC_REQUESTS': False,
+        'AUTOCOMMIT': True,
+        'CONN_MAX_AGE': 0,
+        'CONN_HEALTH_CHECKS': False,
+        'TIME_ZONE': None,
+        'TEST': {},
+    }
+
+
+class TunedSqliteBackendTest(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp(prefix='sqlite-backend-')
+        self.path = os.path.join(directory, 'db.sqlite3')
+        self.wrapper = DatabaseWrapper(tuned_settings(self.path), alias='tuned')
+        self.wrapper.cursor().execute('CREATE TABLE item (id INTEGER PRIMARY KEY)')
+        # Where transaction.atomic(using='tuned') finds it
+        connections['tuned'] = self.wrapper
+
+    def tearDown(self):
+        self.wrapper.close()
+        del connections['tuned']
+
+    def query(self, sql):
+        with self.wrapper.cursor() as cursor:
+            cursor.execute(sql)
+            return cursor.fetchone()[0]
+
+    def holds_write_lock(self):
+        other = sqlite3.connect(self.path, timeout=0, isolation_level=None)
+        try:
+            other.execute('BEGIN IMMEDIATE')
+            other.execute('ROLLBACK')
+            return False
+        except sqlite3.OperationalError:
+            return True
+        finally:
+            other.close()
+
+    def test_pragmas_applied_on_connect(self):
+        self.assertEqual(self.query('PRAGMA journal_mode'), 'wal')
+        self.assertEqual(self.query('PRAGMA synchronous'), 1)
+        self.assertEqual(self.query('PRAGMA cache_size'), -2048)
+        self.assertEqual(self.query('PRAGMA busy_timeout'), 1000)
+
+    def test_write_transactions_begin_immediate(self):
+        # What transaction.atomic() runs when it opens a transaction on SQLite
+        self.wrapper._start_transaction_under_autocommit()
+        self.assertFalse(self.holds_write_lock())
+        self.wrapper.cursor().execute('ROLLBACK')
+
+        with write_transactions():
+            self.wrapper._start_transaction_under_autocommit()
+        self.assertTrue(self.holds_write_lock())
+        self.wrapper.cursor().execute('ROLLBACK')
+
+    def test_invalid_options_rejected(self):
+        for options in ({'transaction_mode': 'sometimes'}, {'pragmas': {'journal_mode': 'WAL; DROP TABLE item'}}):
+            wrapper = DatabaseWrapper(tuned_settings(self.path, **options), alias='invalid')
+            with self.assertRaises(ImproperlyConfigured):
+                wrapper.get_connection_params()
+
+    def run_request(self, method, status=200):
+        def view(request):
+            self.wrapper.cursor().execute('INSERT INTO item DEFAULT VALUES')
+            return HttpResponse(status=status)
+
+        middleware = WriteTransactionMiddleware(view)
+        middleware.using = 'tuned'
+        with CaptureQueriesContext(self.wrapper) as queries:
+            middleware(getattr(RequestFactory(), method)('/api/activities/'))
+        return [query['sql'] for query in queries.captured_queries]
+
+    def test_write_requests_run_in_an_immediate_transaction(self):
+        self.assertEqual(self.run_request('post'), ['BEGIN IMMEDIATE', 'INSERT INTO item DEFAULT VALUES', 'COMMIT'])
+        self.assertEqual(self.query('SELECT COUNT(*) FROM item'), 1)
+        # Reads keep autocommit
+        self.assertEqual(self.run_request('get'), ['INSERT INTO item DEFAULT VALUES'])
+
+    def test_server_errors_roll_the_request_back(self):
+        self.run_request('post', status=500)
+        self.assertEqual(self.query('SELECT COUNT(*) FROM item'), 0)
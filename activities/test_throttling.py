@@ -0,0 +1,147 @@
+import os
+import tempfile
+from unittest import mock, skipIf
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, override_settings
+from rest_framework.test import APIClient, APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from activities.views import activity_stats, recent_activities
+from fitness_tracker_backend import throttling
+from fitness_tracker_backend.throttling import (
+    LocalBucketStore, ScopedRateThrottle, SharedBucketStore, UserRateThrottle, parse_rate,
+)
+
+User = get_user_model()
+
+
+def _consume_in_child(path, count):
+    store = SharedBucketStore(path, 64)
+    for _ in range(count):
+        store.consume('scope:user:1', 5, 1.0, now=100)
+
+
+class BucketStoreTests:
+    """Shared by both stores: ``make_store()`` returns an empty one."""
+
+    def test_allows_a_burst_then_says_how_long_to_wait(self):
+        store = self.make_store()
+        for _ in range(3):
+            self.assertEqual(store.consume('stats:user:1', 3, 0.5, now=100), (True, 0.0))
+        allowed, wait = store.consume('stats:user:1', 3, 0.5, now=100)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait, 2.0)
+
+    def test_refills_over_time_up_to_capacity(self):
+        store = self.make_store()
+        for _ in range(3):
+            store.consume('stats:user:1', 3, 1.0, now=100)
+        self.assertTrue(store.consume('stats:user:1', 3, 1.0, now=101)[0])
+        self.assertFalse(store.consume('stats:user:1', 3, 1.0, now=101)[0])
+        # A long pause doesn't bank more than a full bucket
+        for _ in range(3):
+            self.assertTrue(store.consume('stats:user:1', 3, 1.0, now=1000)[0])
+        self.assertFalse(store.consume('stats:user:1', 3, 1.0, now=1000)[0])
+
+    def test_clients_have_separate_buckets(self):
+        store = self.make_store()
+        store.consume('stats:user:1', 1, 1.0, now=100)
+        self.assertFalse(store.consume('stats:user:1', 1, 1.0, now=100)[0])
+        self.assertTrue(store.consume('stats:user:2', 1, 1.0, now=100)[0])
+
+
+class LocalBucketStoreTest(BucketStoreTests, SimpleTestCase):
+    def make_store(self):
+        return LocalBucketStore()
+
+
+@skipIf(throttling.fcntl is None, 'needs fcntl')
+class SharedBucketStoreTest(BucketStoreTests, SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'throttle.bin')
+
+    def make_store(self, slots=64):
+        return SharedBucketStore(self.path, slots)
+
+    def test_processes_share_buckets(self):
+        # A bare fork: the parallel test runner's workers can't have children
+        pid = os.fork()
+        if pid == 0:
+            try:
+                _consume_in_child(self.path, 4)
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+
+        store = self.make_store()
+        self.assertTrue(store.consume('scope:user:1', 5, 1.0, now=100)[0])
+        self.assertFalse(store.consume('scope:user:1', 5, 1.0, now=100)[0])
+
+    def test_full_probe_range_reuses_the_oldest_slot(self):
+        store = self.make_store(slots=SharedBucketStore.PROBES)
+        for client in range(SharedBucketStore.PROBES + 1):
+            self.assertTrue(store.consume(f'stats:user:{client}', 1, 1.0, now=100 + client)[0])
+        # The newest buckets are still there
+        self.assertFalse(store.consume(f'stats:user:{SharedBucketStore.PROBES}', 1, 1.0, now=108)[0])
+
+    def test_reset_empties_the_file(self):
+        store = self.make_store()
+        store.consume('stats:user:1', 1, 1.0, now=100)
+        store.reset()
+        self.assertTrue(store.consume('stats:user:1', 1, 1.0, now=100)[0])
+
+
+class ParseRateTest(SimpleTestCase):
+    def test_rates(self):
+        self.assertEqual(parse_rate('60/min'), (60, 1.0))
+        self.assertEqual(parse_rate('10/hour'), (10, 10 / 3600))
+        self.assertIsNone(parse_rate(None))
+
+
+@override_settings(
+    REST_FRAMEWORK={
+        **settings.REST_FRAMEWORK,
+        'DEFAULT_THROTTLE_RATES': {'user': '5/min', 'anon': '5/min', 'stats': '2/min'},
+    },
+    THROTTLING={'STORE': 'local', 'SCOPES': {'activity-stats': 'stats'}},
+)
+class ThrottledEndpointsTest(APITestCase):
+    def setUp(self):
+        throttling.reset_store()
+        self.addCleanup(throttling.reset_store)
+        # Views take their throttle classes when they are defined
+        for view in (activity_stats, recent_activities):
+            patcher = mock.patch.object(view.cls, 'throttle_classes', [UserRateThrottle, ScopedRateThrottle])
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user(username='tabs', password='testpass123')
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}'
+        )
+
+    def test_scoped_endpoints_get_429_with_retry_after(self):
+        for _ in range(2):
+            self.assertEqual(self.client.get('/api/activities/stats/').status_code, 200)
+        response = self.client.get('/api/activities/stats/')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+        # Other endpoints only count towards the user rate
+        self.assertEqual(self.client.get('/api/activities/recent/').status_code, 200)
+
+    def test_user_rate_covers_every_endpoint(self):
+        for _ in range(4):
+            self.client.get('/api/activities/recent/')
+        self.assertEqual(self.client.get('/api/activities/stats/').status_code, 200)
+        self.assertEqual(self.client.get('/api/activities/recent/').status_code, 429)
+
+    def test_users_are_throttled_separately(self):
+        for _ in range(3):
+            self.client.get('/api/activities/stats/')
+        other = User.objects.create_user(username='other', password='testpass123')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(other).access_token}')
+        self.assertEqual(self.client.get('/api/activities/stats/').status_code, 200)
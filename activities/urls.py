@@ -4,9 +4,15 @@ from . import views
 urlpatterns = [
     path('', views.ActivityListCreateView.as_view(), name='activity-list-create'),
     path('<int:pk>/', views.ActivityDetailView.as_view(), name='activity-detail'),
+    path('<int:pk>/history/', views.activity_history, name='activity-history'),
     path('stats/', views.activity_stats, name='activity-stats'),
     path('bulk-update/', views.bulk_update_status, name='bulk-update-status'),
+    path('bulk-delete/', views.bulk_delete, name='bulk-delete'),
     path('recent/', views.recent_activities, name='recent-activities'),
+    path('batch/', views.batch_activities, name='activity-batch'),
+    path('export/', views.export_activities, name='activity-export'),
+    path('export/<int:job_id>/', views.download_export, name='activity-export-download'),
+    path('events/', views.activity_events, name='activity-events'),
 ]
 
 
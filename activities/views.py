@@ -1,19 +1,99 @@
+from asgiref.sync import sync_to_async
 from rest_framework import generics, status, filters
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import SAFE_METHODS, IsAuthenticated
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q, Sum
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.db.models import Prefetch, Q, prefetch_related_objects
+from django.http import FileResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
 from django.utils import timezone
+from django.utils.decorators import method_decorator
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from . import events, history, rollups
+from fitness_tracker_backend import singleflight
+from fitness_tracker_backend.db_routers import replica_reads
+from jobs.models import Job
+from jobs.queue import enqueue
+from jobs.serializers import JobSerializer
+from .fieldsets import FieldSelection
+from .filters import ActivityFilter
+from .idempotency import idempotent
+from .jobs import export_path
 from .models import Activity, ActivityLog
-from .serializers import ActivitySerializer, ActivityCreateSerializer, ActivityUpdateSerializer
+from .sharding import activities_for, existing_activity_ids
+from .retention import archived_history
+from .serializers import (
+    ActivityCreateSerializer, ActivityLogSerializer, ActivitySerializer, ActivityUpdateSerializer
+)
 
+# Largest primary key a BigAutoField can hold
+MAX_ACTIVITY_ID = 2 ** 63 - 1
 
-class ActivityListCreateView(generics.ListCreateAPIView):
+
+class FieldSelectionMixin:
+    """Apply ?fields= / ?expand= to GET querysets and serializers"""
+    
+    @property
+    def field_selection(self):
+        if not hasattr(self, '_field_selection'):
+            self._field_selection = FieldSelection.from_request(self.request)
+        return self._field_selection
+    
+    @property
+    def writes(self):
+        return self.request.method not in SAFE_METHODS
+    
+    def select_fields(self, queryset):
+        if self.request.method == 'GET':
+            queryset = self.field_selection.apply(queryset)
+        return queryset
+    
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.request.method == 'GET':
+            context['field_selection'] = self.field_selection
+        return context
+
+
+class PointInTimeMixin:
+    """Serve GET ?as_of= from the recorded history instead of the current rows"""
+    
+    # Filtering, search and ordering apply to current rows only
+    AS_OF_PARAMS = {'as_of', 'page', 'page_size', 'fields', 'expand'}
+    
+    @property
+    def as_of(self):
+        if self.request.method != 'GET' or 'as_of' not in self.request.query_params:
+            return None
+        return history.parse_as_of(self.request.query_params['as_of'])
+    
+    def activities_as_of(self, ids, as_of):
+        """The user's activities among ``ids`` as they were at ``as_of``, in order."""
+        user = self.request.user
+        found = history.reconstruct(ids, as_of, using=activities_for(user, include_deleted=True).db)
+        activities = [found[pk] for pk in ids if pk in found and found[pk].user_id == user.pk]
+        for activity in activities:
+            activity.user = user
+        if 'logs' in self.field_selection.field_names:
+            # Logs of hard-deleted activities are gone with them
+            prefetch_related_objects(
+                activities, Prefetch('logs', queryset=ActivityLog.objects.filter(created_at__lte=as_of))
+            )
+        return activities
+
+
+class ActivityListCreateView(PointInTimeMixin, FieldSelectionMixin, generics.ListCreateAPIView):
     """List all activities for the authenticated user or create a new activity"""
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['activity_type', 'status']
+    filterset_class = ActivityFilter
     search_fields = ['title', 'description']
     ordering_fields = ['created_at', 'planned_date', 'updated_at']
     ordering = ['-created_at']
@@ -24,10 +104,33 @@ class ActivityListCreateView(generics.ListCreateAPIView):
         return ActivitySerializer
     
     def get_queryset(self):
-        return Activity.objects.filter(user=self.request.user)
+        return self.select_fields(activities_for(self.request.user, for_write=self.writes))
+    
+    @method_decorator(replica_reads)
+    def list(self, request, *args, **kwargs):
+        as_of = self.as_of
+        if as_of is None:
+            return super().list(request, *args, **kwargs)
+        unsupported = sorted(set(request.query_params) - self.AS_OF_PARAMS)
+        if unsupported:
+            return Response(
+                {'error': f"as_of can't be combined with: {', '.join(unsupported)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        ids = history.ids_as_of(activities_for(request.user, include_deleted=True), request.user, as_of)
+        page = self.paginate_queryset(ids)
+        activities = self.activities_as_of(ids if page is None else page, as_of)
+        serializer = self.get_serializer(activities, many=True)
+        if page is None:
+            return Response(serializer.data)
+        return self.get_paginated_response(serializer.data)
+    
+    @method_decorator(idempotent)
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
 
 
-class ActivityDetailView(generics.RetrieveUpdateDestroyAPIView):
+class ActivityDetailView(PointInTimeMixin, FieldSelectionMixin, generics.RetrieveUpdateDestroyAPIView):
     """Retrieve, update or delete an activity"""
     permission_classes = [IsAuthenticated]
     
@@ -37,75 +140,65 @@ class ActivityDetailView(generics.RetrieveUpdateDestroyAPIView):
         return ActivitySerializer
     
     def get_queryset(self):
-        return Activity.objects.filter(user=self.request.user)
+        return self.select_fields(activities_for(self.request.user, for_write=self.writes))
+    
+    def retrieve(self, request, *args, **kwargs):
+        as_of = self.as_of
+        if as_of is None:
+            return super().retrieve(request, *args, **kwargs)
+        activities = self.activities_as_of([kwargs['pk']], as_of)
+        if not activities:
+            return Response({'error': 'Activity did not exist at as_of'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(self.get_serializer(activities[0]).data)
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@replica_reads
 def activity_stats(request):
-    """Get activity statistics for the authenticated user"""
+    """This week's or month's activity statistics compared with the previous one's"""
+    period = request.query_params.get('period', rollups.MONTH)
+    if period not in rollups.PERIODS:
+        return Response(
+            {'error': f"period must be one of: {', '.join(rollups.PERIODS)}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    max_periods = rollups.get_setting('MAX_PERIODS')
+    try:
+        periods = int(request.query_params.get('periods', 2))
+    except ValueError:
+        periods = 0
+    if not 2 <= periods <= max_periods:
+        return Response(
+            {'error': f'periods must be a number from 2 to {max_periods}'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
     user = request.user
-    
-    # Get current month activities
-    from datetime import datetime, timedelta
-    now = timezone.now()
-    start_of_month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    
-    monthly_activities = Activity.objects.filter(
-        user=user,
-        created_at__gte=start_of_month
-    )
-    
-    # Calculate statistics
-    total_activities = monthly_activities.count()
-    completed_activities = monthly_activities.filter(status='completed').count()
-    planned_activities = monthly_activities.filter(status='planned').count()
-    in_progress_activities = monthly_activities.filter(status='in_progress').count()
-    
-    # Calculate totals
-    total_calories_burned = monthly_activities.aggregate(
-        total=Sum('calories_burned')
-    )['total'] or 0
-    
-    total_calories_consumed = monthly_activities.aggregate(
-        total=Sum('calories_consumed')
-    )['total'] or 0
-    
-    total_steps = monthly_activities.aggregate(
-        total=Sum('steps_count')
-    )['total'] or 0
-    
-    total_duration = monthly_activities.aggregate(
-        total=Sum('duration_minutes')
-    )['total'] or 0
-    
-    # Activities by type
-    activities_by_type = {}
-    for activity_type, _ in Activity.ACTIVITY_TYPES:
-        count = monthly_activities.filter(activity_type=activity_type).count()
-        if count > 0:
-            activities_by_type[activity_type] = count
-    
+    # Tabs and retries asking at once share one computation
+    return Response(singleflight.run(
+        singleflight.request_key('activity-stats', request), lambda: rollups.compare(user, period, periods)
+    ))
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@replica_reads
+def activity_history(request, pk):
+    """Full status history of an activity, including logs moved to the archive"""
+    activity = get_object_or_404(activities_for(request.user), pk=pk)
+    archived = archived_history([activity.pk], using=activity._state.db)[activity.pk]
+    # Newest first, like the logs inlined in activity responses
     return Response({
-        'monthly_stats': {
-            'total_activities': total_activities,
-            'completed_activities': completed_activities,
-            'planned_activities': planned_activities,
-            'in_progress_activities': in_progress_activities,
-            'completion_rate': round((completed_activities / total_activities * 100) if total_activities > 0 else 0, 2)
-        },
-        'totals': {
-            'calories_burned': total_calories_burned,
-            'calories_consumed': total_calories_consumed,
-            'steps': total_steps,
-            'duration_minutes': total_duration
-        },
-        'activities_by_type': activities_by_type
+        'id': activity.pk,
+        'logs': ActivityLogSerializer(activity.logs.all(), many=True).data,
+        'archived_logs': archived['logs'][::-1],
+        'archived_summaries': archived['summaries'][::-1],
     })
 
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotent
 def bulk_update_status(request):
     """Bulk update status for multiple activities"""
     activity_ids = request.data.get('activity_ids', [])
@@ -124,17 +217,15 @@ def bulk_update_status(request):
         )
     
     # Update activities
-    activities = Activity.objects.filter(
-        id__in=activity_ids, 
-        user=request.user
+    activities = activities_for(request.user, for_write=True).filter(
+        id__in=activity_ids
     )
     
     updated_count = 0
     for activity in activities:
         old_status = activity.status
         if old_status != new_status:
-            ActivityLog.objects.create(
-                activity=activity,
+            activity.logs.create(
                 old_status=old_status,
                 new_status=new_status,
                 notes=f"Bulk status update from {old_status} to {new_status}"
@@ -149,8 +240,83 @@ def bulk_update_status(request):
     })
 
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@idempotent
+def bulk_delete(request):
+    """Hide activities at once and delete them in a background job"""
+    activity_ids = request.data.get('activity_ids', [])
+    if not activity_ids or not isinstance(activity_ids, list):
+        return Response({'error': 'activity_ids is required'}, status=status.HTTP_400_BAD_REQUEST)
+    if not all(isinstance(activity_id, int) for activity_id in activity_ids):
+        return Response({'error': 'activity_ids must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+    max_ids = settings.ACTIVITY_BULK_DELETE_MAX_IDS
+    if len(activity_ids) > max_ids:
+        return Response(
+            {'error': f'At most {max_ids} activities can be deleted at once'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    activities = activities_for(request.user, for_write=True)
+    batch_size = settings.DELETION_BATCH_SIZE
+    tombstoned = []
+    # Flagging rows is a cheap update; the cascading deletes happen in the job
+    now = timezone.now()
+    with transaction.atomic(using=activities.db):
+        for start in range(0, len(activity_ids), batch_size):
+            chunk = list(activities.filter(id__in=activity_ids[start:start + batch_size]).only(
+                'id', 'user_id', 'version', 'created_at'
+            ))
+            ids = [activity.id for activity in chunk]
+            activities.filter(id__in=ids).update(deleted=True, updated_at=now)
+            history.record_deletions(chunk, at=now)
+            tombstoned.extend(ids)
+        if not tombstoned:
+            return Response({'error': 'No matching activities'}, status=status.HTTP_404_NOT_FOUND)
+        job = enqueue('activities.bulk_delete', {'activity_ids': tombstoned}, user=request.user)
+    
+    return Response(
+        {'deleted_count': len(tombstoned), 'job': JobSerializer(job).data},
+        status=status.HTTP_202_ACCEPTED,
+        headers={'Location': reverse('job-detail', args=[job.pk])}
+    )
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@idempotent
+def export_activities(request):
+    """Queue an export of all the user's activities; poll the returned job for progress"""
+    job = enqueue('activities.export', user=request.user)
+    return Response(
+        JobSerializer(job).data,
+        status=status.HTTP_202_ACCEPTED,
+        headers={'Location': reverse('job-detail', args=[job.pk])}
+    )
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+def download_export(request, job_id):
+    """Download the file written by a finished export job"""
+    job = get_object_or_404(Job, pk=job_id, user=request.user, job_type='activities.export')
+    if job.status != Job.SUCCEEDED:
+        return Response(
+            {'error': f'Export is {job.status}', 'job': JobSerializer(job).data},
+            status=status.HTTP_409_CONFLICT
+        )
+    try:
+        export = open(export_path(job.pk), 'rb')
+    except FileNotFoundError:
+        return Response({'error': 'Export file no longer exists'}, status=status.HTTP_410_GONE)
+    return FileResponse(
+        export, as_attachment=True, filename=job.result['file'], content_type='application/x-ndjson'
+    )
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@replica_reads
 def recent_activities(request):
     """Get recent activities for the authenticated user"""
     limit = request.GET.get('limit', 10)
@@ -159,9 +325,127 @@ def recent_activities(request):
     except ValueError:
         limit = 10
     
-    activities = Activity.objects.filter(
-        user=request.user
+    selection = FieldSelection.from_request(request)
+    activities = selection.apply(
+        activities_for(request.user)
     ).order_by('-updated_at')[:limit]
     
-    serializer = ActivitySerializer(activities, many=True)
-    return Response(serializer.data)
\ No newline at end of file
+    serializer = ActivitySerializer(activities, many=True, context={'field_selection': selection})
+    return Response(serializer.data)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@replica_reads
+def batch_activities(request):
+    """Get many activities by id in one query, keeping the requested order"""
+    raw_ids = request.GET.get('ids', '')
+    try:
+        ids = list(dict.fromkeys(int(part) for part in raw_ids.split(',') if part.strip()))
+    except ValueError:
+        ids = None
+    # Ids past the primary key range overflow in the database driver
+    if ids is None or not all(1 <= activity_id <= MAX_ACTIVITY_ID for activity_id in ids):
+        return Response(
+            {'error': 'ids must be a comma-separated list of positive integers'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    max_ids = settings.ACTIVITY_BATCH_MAX_IDS
+    if not ids:
+        return Response({'error': 'ids is required'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(ids) > max_ids:
+        return Response(
+            {'error': f'At most {max_ids} ids can be requested at once'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    selection = FieldSelection.from_request(request)
+    activities = selection.apply(
+        activities_for(request.user).filter(id__in=ids)
+    ).order_by()
+    by_id = {activity.id: activity for activity in activities}
+    
+    # Tell apart ids owned by someone else from ids that don't exist
+    missing = [activity_id for activity_id in ids if activity_id not in by_id]
+    forbidden = set()
+    if missing:
+        forbidden = existing_activity_ids(missing)
+    
+    serializer = ActivitySerializer(
+        [by_id[activity_id] for activity_id in ids if activity_id in by_id],
+        many=True,
+        context={'field_selection': selection}
+    )
+    return Response({
+        'results': serializer.data,
+        'not_found': [activity_id for activity_id in missing if activity_id not in forbidden],
+        'forbidden': [activity_id for activity_id in missing if activity_id in forbidden],
+    })
+
+
+def _authenticate_stream_request(request):
+    """Authenticate an event stream request with a JWT access token.
+
+    Browsers' ``EventSource`` cannot send headers, so the token may also be
+    passed as the ``access_token`` query parameter.
+    """
+    authenticator = JWTAuthentication()
+    try:
+        result = authenticator.authenticate(request)
+        if result is None:
+            raw_token = request.GET.get('access_token')
+            if not raw_token:
+                return None
+            validated_token = authenticator.get_validated_token(raw_token)
+            return authenticator.get_user(validated_token)
+        return result[0]
+    except (AuthenticationFailed, InvalidToken, TokenError):
+        return None
+
+
+async def _event_stream(broker, subscription):
+    heartbeat = events.get_setting('HEARTBEAT_SECONDS')
+    try:
+        yield f"retry: {events.get_setting('RETRY_MILLISECONDS')}\n\n"
+        while True:
+            event = await subscription.get(timeout=heartbeat)
+            if subscription.dropped:
+                # The client fell behind and lost events; have it refetch
+                subscription.dropped = 0
+                yield events.format_sse({'type': 'resync'})
+            if event is None:
+                yield ': keepalive\n\n'
+            else:
+                yield events.format_sse(event)
+    finally:
+        broker.unsubscribe(subscription)
+
+
+async def activity_events(request):
+    """Stream activity changes for the authenticated user as Server-Sent Events"""
+    if request.method != 'GET':
+        return JsonResponse({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+    if not isinstance(request, ASGIRequest):
+        # A WSGI worker would be held by the stream for as long as it stays open
+        return JsonResponse(
+            {'detail': 'Event streams are only served by the ASGI application.'},
+            status=status.HTTP_501_NOT_IMPLEMENTED
+        )
+
+    user = await sync_to_async(_authenticate_stream_request)(request)
+    if user is None or not user.is_active:
+        return JsonResponse(
+            {'detail': 'Authentication credentials were not provided.'},
+            status=status.HTTP_401_UNAUTHORIZED
+        )
+
+    broker = events.get_broker()
+    subscription = broker.subscribe(user.pk)
+    response = StreamingHttpResponse(
+        _event_stream(broker, subscription),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -8,6 +8,15 @@ class CustomUserAdmin(UserAdmin):
     list_filter = ('is_staff', 'is_superuser', 'is_active', 'date_joined')
     search_fields = ('username', 'first_name', 'last_name', 'email')
     ordering = ('-date_joined',)
+    actions = ['delete_in_background']
+
+    @admin.action(description='Deactivate and delete selected users in the background')
+    def delete_in_background(self, request, queryset):
+        # Deleting here would cascade through every activity in one transaction
+        from .jobs import schedule_account_deletion
+        for user in queryset:
+            schedule_account_deletion(user)
+        self.message_user(request, f'Queued deletion of {len(queryset)} users')
 
 # Unregister the default User admin and register our custom one
 admin.site.unregister(User)
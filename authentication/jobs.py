@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from activities import history, rollups
+from activities.sharding import activities_for, delete_in_batches
+from jobs.queue import enqueue, job
+
+
+def schedule_account_deletion(user):
+    """Deactivate ``user`` at once and queue the deletion of their data.
+
+    ``is_active = False`` is the tombstone: from this point the account can't
+    log in and its tokens are rejected, while the rows go in the background.
+    """
+    with transaction.atomic():
+        User.objects.filter(pk=user.pk).update(is_active=False)
+        return enqueue('authentication.delete_account', {'user_id': user.pk}, user=user)
+
+
+@job('authentication.delete_account', max_attempts=10)
+def delete_account(job):
+    """Delete a deactivated account's activities and history in small transactions, then the user."""
+    user = User.objects.filter(pk=job.payload['user_id']).first()
+    if user is None:
+        return {'activities_deleted': job.progress_total or 0}
+    activities = activities_for(user, for_write=True, include_deleted=True)
+    remaining = activities.count()
+    # A retry resumes: batches committed by the earlier attempt are gone
+    total = job.progress_total or remaining
+    start = total - remaining
+    job.report_progress(start, total, 'Deleting activities')
+    # No history for these: it is purged along with the user
+    with history.paused():
+        delete_in_batches(
+            activities, settings.DELETION_BATCH_SIZE, on_batch=lambda count: job.report_progress(start + count)
+        )
+    # History and rollups outlive activities; purging them here keeps them out
+    # of the user's deletion transaction too
+    batch_size = settings.DELETION_BATCH_SIZE
+    job.report_progress(total, message='Deleting activity history')
+    history.purge_user(user.pk, activities.db, batch_size, on_batch=lambda count: job.report_progress(total))
+    rollups.purge_user(user.pk, activities.db, batch_size)
+    # Only a few rows (shard assignment, idempotency keys) still go with the user
+    job.report_progress(total, message='Deleting account')
+    user.delete()
+    return {'activities_deleted': total}
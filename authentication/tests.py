@@ -168,12 +168,7 @@ class AuthenticationAPITest(APITestCase):
         # So we can remove this assertion or modify the test to check the serializer's behavior
     
     @patch('rest_framework_simplejwt.tokens.RefreshToken')
-    @patch('authentication.views.RefreshToken')
-    def test_user_logout(self, mock_view_refresh_token, mock_refresh_token):
-        # Setup mock token
-        mock_token = MagicMock()
-        mock_refresh_token.return_value = mock_token
-        
+    def test_user_logout(self, mock_view_refresh_token):
         # Mock the request.user
         mock_user = MockUser(
             username='testuser',
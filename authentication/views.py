@@ -3,7 +3,8 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from django.contrib.auth.models import User
-from rest_framework_simplejwt.tokens import RefreshToken
+from fitness_tracker_backend import singleflight
+from fitness_tracker_backend.db_routers import replica_reads
 from .serializers import (
     UserRegistrationSerializer, 
     UserLoginSerializer, 
@@ -12,6 +13,17 @@ from .serializers import (
 )
 
 
+def _token_pair(user):
+    """Refresh and access tokens for ``user``"""
+    # Imported here so cold starts don't load the token classes up front
+    from rest_framework_simplejwt.tokens import RefreshToken
+    refresh = RefreshToken.for_user(user)
+    return {
+        'refresh': str(refresh),
+        'access': str(refresh.access_token),
+    }
+
+
 class UserRegistrationView(generics.CreateAPIView):
     """Register a new user"""
     queryset = User.objects.all()
@@ -24,14 +36,9 @@ class UserRegistrationView(generics.CreateAPIView):
         user = serializer.save()
         
         # Generate tokens for the new user
-        refresh = RefreshToken.for_user(user)
-        
         return Response({
             'user': UserSerializer(user).data,
-            'tokens': {
-                'refresh': str(refresh),
-                'access': str(refresh.access_token),
-            },
+            'tokens': _token_pair(user),
             'message': 'User registered successfully'
         }, status=status.HTTP_201_CREATED)
 
@@ -43,14 +50,10 @@ def login_view(request):
     serializer = UserLoginSerializer(data=request.data)
     if serializer.is_valid():
         user = serializer.validated_data['user']
-        refresh = RefreshToken.for_user(user)
         
         return Response({
             'user': UserSerializer(user).data,
-            'tokens': {
-                'refresh': str(refresh),
-                'access': str(refresh.access_token),
-            },
+            'tokens': _token_pair(user),
             'message': 'Login successful'
         }, status=status.HTTP_200_OK)
     
@@ -72,13 +75,20 @@ def login_view(request):
     }, status=status.HTTP_400_BAD_REQUEST)
 
 
-class UserProfileView(generics.RetrieveUpdateAPIView):
-    """Get or update user profile"""
+class UserProfileView(generics.RetrieveUpdateDestroyAPIView):
+    """Get, update or delete user profile"""
     serializer_class = UserProfileSerializer
     permission_classes = [IsAuthenticated]
     
     def get_object(self):
         return self.request.user
+    
+    def destroy(self, request, *args, **kwargs):
+        # The account is deactivated now; its data is deleted in the background
+        from jobs.serializers import JobSerializer
+        from .jobs import schedule_account_deletion
+        job = schedule_account_deletion(request.user)
+        return Response(JobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
 
 
 @api_view(['POST'])
@@ -88,6 +98,7 @@ def logout_view(request):
     try:
         refresh_token = request.data.get('refresh_token')
         if refresh_token:
+            from rest_framework_simplejwt.tokens import RefreshToken
             token = RefreshToken(refresh_token)
             token.blacklist()
             return Response({'message': 'Logout successful'}, status=status.HTTP_200_OK)
@@ -99,23 +110,36 @@ def logout_view(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@replica_reads
 def user_dashboard(request):
     """Get user dashboard data"""
+    from activities.fieldsets import FieldSelection
+    selection = FieldSelection.from_request(request)
     user = request.user
-    
+    # Tabs and retries asking at once share one computation
+    return Response(singleflight.run(
+        singleflight.request_key('user-dashboard', request), lambda: _dashboard(user, selection)
+    ))
+
+
+def _dashboard(user, selection):
     # Get user's recent activities count
-    from activities.models import Activity
-    total_activities = Activity.objects.filter(user=user).count()
-    recent_activities = Activity.objects.filter(user=user).order_by('-created_at')[:5]
+    from activities.sharding import activities_for
+    total_activities = activities_for(user).count()
+    recent_activities = list(
+        selection.apply(activities_for(user)).order_by('-created_at')[:5]
+    )
     
     from activities.serializers import ActivitySerializer
-    activities_serializer = ActivitySerializer(recent_activities, many=True)
+    activities_serializer = ActivitySerializer(
+        recent_activities, many=True, context={'field_selection': selection}
+    )
     
-    return Response({
+    return {
         'user': UserSerializer(user).data,
         'stats': {
             'total_activities': total_activities,
-            'recent_activities_count': recent_activities.count()
+            'recent_activities_count': len(recent_activities)
         },
         'recent_activities': activities_serializer.data
-    })
\ No newline at end of file
+    }
\ No newline at end of file
@@ -0,0 +1,7 @@
+"""
+Standalone benchmark scripts.
+
+Run them from the project root, e.g. ``python -m benchmarks.filter_indexes``.
+Unless told otherwise they use a throwaway SQLite database so they never touch
+the configured development or production database.
+"""
@@ -0,0 +1,95 @@
+"""
+Cold-start cost of the full and API-only settings profiles.
+
+Each run starts a fresh interpreter that loads the WSGI application and
+serves two authenticated requests, recording the time to import and set up
+Django, the first request (URLconf, views and serializers are imported
+lazily) and a warm second request. The process wall time includes
+interpreter start-up.
+
+    python -m benchmarks.cold_start --runs 10
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks.common import BASE_DIR, setup_django, summarize
+
+
+PROFILES = {
+    'full': 'fitness_tracker_backend.settings',
+    'api-only': 'fitness_tracker_backend.settings_api',
+}
+
+
+def child(settings_module, db_path, token, path):
+    start = time.perf_counter()
+    os.environ['DJANGO_SETTINGS_MODULE'] = settings_module
+    from django.conf import settings
+    settings.DATABASES['default']['NAME'] = db_path
+    from django.core.wsgi import get_wsgi_application
+    application = get_wsgi_application()
+    imported = time.perf_counter()
+
+    from django.test import RequestFactory
+    factory = RequestFactory()
+    timings = []
+    for _ in range(2):
+        request_start = time.perf_counter()
+        response = application.get_response(factory.get(path, HTTP_AUTHORIZATION=f'Bearer {token}'))
+        if response.status_code != 200:
+            raise SystemExit(f'{path} returned {response.status_code}')
+        timings.append(time.perf_counter() - request_start)
+
+    print(json.dumps({
+        'import': imported - start,
+        'first_request': timings[0],
+        'warm_request': timings[1],
+        'modules': len(sys.modules),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--path', default='/api/auth/dashboard/')
+    parser.add_argument('--child', nargs=3, metavar=('SETTINGS', 'DB', 'TOKEN'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(*args.child, args.path)
+        return
+
+    db_path = setup_django()
+    from django.contrib.auth.models import User
+    from rest_framework_simplejwt.tokens import AccessToken
+    user = User.objects.create_user(username='cold-start', password='cold-start')
+    token = str(AccessToken.for_user(user))
+
+    env = {**os.environ, 'DB_ENGINE': 'sqlite', 'DEBUG': 'False'}
+    env.pop('DJANGO_SETTINGS_MODULE', None)
+    for label, settings_module in PROFILES.items():
+        results = {'process': [], 'import': [], 'first_request': [], 'warm_request': []}
+        modules = 0
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            output = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.cold_start', '--path', args.path,
+                 '--child', settings_module, db_path, token],
+                cwd=BASE_DIR, env=env, capture_output=True, text=True, check=True,
+            ).stdout
+            results['process'].append(time.perf_counter() - start)
+            run = json.loads(output.strip().splitlines()[-1])
+            modules = run.pop('modules')
+            for key, value in run.items():
+                results[key].append(value)
+        print(f'{label} ({settings_module}, {modules} modules loaded)')
+        for key, samples in results.items():
+            print(f'  {key:<14} {summarize(samples)}')
+
+
+if __name__ == '__main__':
+    main()
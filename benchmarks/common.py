@@ -0,0 +1,75 @@
+"""
+Shared helpers for the benchmark scripts.
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def setup_django(db_path=None, settings_module='fitness_tracker_backend.settings', migrate=True):
+    """Configure Django against a scratch SQLite database and create the schema.
+
+    Returns the database path so callers can hand it to subprocesses.
+    """
+    if str(BASE_DIR) not in sys.path:
+        sys.path.insert(0, str(BASE_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    os.environ['DB_ENGINE'] = 'sqlite'
+    if db_path is None:
+        db_path = os.path.join(tempfile.mkdtemp(prefix='fitness-bench-'), 'bench.sqlite3')
+
+    from django.conf import settings
+    settings.DATABASES['default']['NAME'] = str(db_path)
+    settings.DEBUG = False
+    settings.PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+    settings.ACTIVITY_EXPORT_DIR = os.path.join(os.path.dirname(db_path), 'exports')
+    # Benchmarks send far more requests than the rates allow: keep the
+    # throttles' cost, not their limits, and keep scratch users' buckets apart
+    settings.REST_FRAMEWORK = {
+        **settings.REST_FRAMEWORK,
+        'DEFAULT_THROTTLE_RATES': {scope: '1000000/s' for scope in settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']},
+    }
+    settings.THROTTLING = {**settings.THROTTLING, 'PATH': os.path.join(os.path.dirname(db_path), 'throttle.bin')}
+
+    import django
+    django.setup()
+    if migrate:
+        from django.core.management import call_command
+        call_command('migrate', verbosity=0)
+    return str(db_path)
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of ``samples`` (``pct`` in 0..100)."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples):
+    """Latency summary in milliseconds for a list of durations in seconds."""
+    millis = [sample * 1000 for sample in samples]
+    return {
+        'count': len(millis),
+        'mean_ms': round(statistics.fmean(millis), 3) if millis else 0.0,
+        'p50_ms': round(percentile(millis, 50), 3),
+        'p95_ms': round(percentile(millis, 95), 3),
+        'p99_ms': round(percentile(millis, 99), 3),
+    }
+
+
+def timed(func, repeat):
+    """Call ``func`` ``repeat`` times and return the individual durations."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
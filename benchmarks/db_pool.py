@@ -0,0 +1,103 @@
+"""
+Per-request latency with and without persistent database connections.
+
+Serves authenticated requests through the real WSGI handler (so connections
+are closed or kept exactly as under gunicorn) first with CONN_MAX_AGE=0, then
+with persistent connections, and prints latency plus the connection counters
+from ``monitoring.db_pool``.
+
+SQLite connects in microseconds, so ``--connect-latency-ms`` adds a delay to
+every new connection to stand in for a PostgreSQL/MySQL handshake. Pass
+``--use-settings`` to run against the database configured in the environment
+instead (it must already be migrated).
+
+    python -m benchmarks.db_pool --requests 300 --connect-latency-ms 5
+"""
+import argparse
+import io
+import os
+import time
+from wsgiref.util import setup_testing_defaults
+
+from benchmarks.common import BASE_DIR, setup_django, summarize
+
+
+def _setup(use_settings):
+    if not use_settings:
+        setup_django()
+        return
+    import sys
+    import django
+    if str(BASE_DIR) not in sys.path:
+        sys.path.insert(0, str(BASE_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fitness_tracker_backend.settings')
+    django.setup()
+
+
+def _environ(path, token):
+    environ = {
+        'PATH_INFO': path,
+        'REQUEST_METHOD': 'GET',
+        'HTTP_AUTHORIZATION': f'Bearer {token}',
+        'wsgi.input': io.BytesIO(),
+    }
+    setup_testing_defaults(environ)
+    return environ
+
+
+def run(application, path, token, requests):
+    samples = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = application(_environ(path, token), lambda status, headers: None)
+        b''.join(response)
+        response.close()  # fires request_finished, like a WSGI server
+        samples.append(time.perf_counter() - start)
+        status = getattr(response, 'status_code', 200)
+        if status != 200:
+            raise SystemExit(f'{path} returned {status}')
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--path', default='/api/activities/stats/')
+    parser.add_argument('--max-age', type=int, default=60, help='CONN_MAX_AGE for the pooled run')
+    parser.add_argument('--connect-latency-ms', type=float, default=0.0)
+    parser.add_argument('--use-settings', action='store_true')
+    args = parser.parse_args()
+
+    _setup(args.use_settings)
+
+    from django.contrib.auth.models import User
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.db import connections
+    from django.db.backends.signals import connection_created
+    from rest_framework_simplejwt.tokens import RefreshToken
+    from monitoring import db_pool
+
+    if args.connect_latency_ms:
+        def simulate_handshake(**kwargs):
+            time.sleep(args.connect_latency_ms / 1000)
+        connection_created.connect(simulate_handshake, weak=False)
+
+    user, _ = User.objects.get_or_create(username='db-pool-bench')
+    token = str(RefreshToken.for_user(user).access_token)
+    application = WSGIHandler()
+
+    for label, max_age in (('no reuse (CONN_MAX_AGE=0)', 0), (f'persistent (CONN_MAX_AGE={args.max_age})', args.max_age)):
+        connections['default'].close()
+        connections['default'].settings_dict['CONN_MAX_AGE'] = max_age
+        run(application, args.path, token, 5)  # warm up imports and caches
+        db_pool.stats.reset()
+        samples = run(application, args.path, token, args.requests)
+        print(label)
+        print(f'  latency:     {summarize(samples)}')
+        print(f'  connections: {db_pool.stats.snapshot().get("default", {})}')
+
+    user.delete()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Check that every ActivityFilter lookup is served by an index.
+
+Seeds a scratch SQLite database, runs ANALYZE, then prints the query plan and
+latency of the activity list query for each supported filter. Exits non-zero
+if any plan falls back to a full table scan.
+
+    python -m benchmarks.filter_indexes --users 20 --activities 5000
+"""
+import argparse
+import random
+import sys
+from datetime import timedelta
+
+from benchmarks.common import setup_django, summarize, timed
+
+
+FILTERS = [
+    {},
+    {'activity_type': 'workout'},
+    {'status': 'completed,in_progress'},
+    {'planned_date__gte': 'DAYS_AGO_30'},
+    {'completed_date__gte': 'DAYS_AGO_30', 'completed_date__lte': 'NOW'},
+    {'created_at__gte': 'DAYS_AGO_7'},
+    {'duration_minutes__gte': '60'},
+    {'calories_burned__gte': '500', 'calories_burned__lte': '800'},
+    {'steps_count__gte': '10000'},
+    {'status': 'completed', 'planned_date__gte': 'DAYS_AGO_30'},
+    {'activity_type': 'meal', 'planned_date__lte': 'NOW'},
+]
+
+
+def seed(users, per_user):
+    from django.contrib.auth.models import User
+    from django.utils import timezone
+    from activities.models import Activity
+
+    rng = random.Random(1234)
+    now = timezone.now()
+    types = [choice for choice, _ in Activity.ACTIVITY_TYPES]
+    statuses = [choice for choice, _ in Activity.STATUS_CHOICES]
+    owners = User.objects.bulk_create([User(username=f'bench{i}') for i in range(users)])
+    rows = []
+    for owner in owners:
+        for _ in range(per_user):
+            status = rng.choice(statuses)
+            planned = now - timedelta(days=rng.uniform(-30, 365))
+            rows.append(Activity(
+                user=owner,
+                title='Benchmark activity',
+                activity_type=rng.choice(types),
+                status=status,
+                planned_date=planned,
+                completed_date=planned + timedelta(hours=1) if status == 'completed' else None,
+                duration_minutes=rng.randint(5, 120),
+                calories_burned=rng.randint(0, 1000),
+                steps_count=rng.randint(0, 20000),
+            ))
+    Activity.objects.bulk_create(rows, batch_size=2000)
+    return owners[0]
+
+
+def resolve(params):
+    from django.utils import timezone
+    now = timezone.now()
+    values = {
+        'NOW': now,
+        'DAYS_AGO_7': now - timedelta(days=7),
+        'DAYS_AGO_30': now - timedelta(days=30),
+    }
+    return {key: values[value].isoformat() if value in values else value for key, value in params.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--activities', type=int, default=5000, help='activities per user')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db import connection
+    from django.http import QueryDict
+    from activities.filters import ActivityFilter
+    from activities.models import Activity
+
+    user = seed(args.users, args.activities)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+    failures = 0
+    for params in FILTERS:
+        data = QueryDict(mutable=True)
+        data.update(resolve(params))
+        queryset = ActivityFilter(data, queryset=Activity.objects.filter(user=user)).qs
+        page = queryset.order_by('-created_at')[:20]
+        plan = page.explain()
+        full_scan = any(
+            line.strip().startswith('SCAN') and 'INDEX' not in line
+            for line in plan.splitlines()
+        )
+        failures += full_scan
+        stats = summarize(timed(lambda: list(page.all()), args.repeat))
+        label = '&'.join(f'{k}={v}' for k, v in params.items()) or '(no filter)'
+        print(f"{'FULL SCAN' if full_scan else 'index    '}  p50={stats['p50_ms']:>7}ms  {label}")
+        for line in plan.splitlines():
+            print(f'             {line}')
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+Middleware overhead per request, full stack vs RouteMiddleware.
+
+Serves a view that does nothing through Django's handler, once with every
+middleware in MIDDLEWARE (the stack before RouteMiddleware) and once with the
+current settings, for an API path and an admin path.
+
+    python -m benchmarks.middleware_overhead --requests 20000
+"""
+import argparse
+
+from django.http import HttpResponse
+from django.urls import path
+
+from benchmarks.common import setup_django, summarize, timed
+
+
+FULL_STACK = [
+    'corsheaders.middleware.CorsMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+]
+
+
+def ping(request):
+    return HttpResponse('pong')
+
+
+urlpatterns = [
+    path('api/ping/', ping),
+    path('admin/ping/', ping),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--requests', type=int, default=20000)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.core.handlers.base import BaseHandler
+    from django.test import RequestFactory, override_settings
+
+    factory = RequestFactory()
+    stacks = {'full MIDDLEWARE': FULL_STACK, 'RouteMiddleware': settings.MIDDLEWARE}
+    for label, middleware in stacks.items():
+        with override_settings(MIDDLEWARE=middleware, ROOT_URLCONF=__name__):
+            handler = BaseHandler()
+            handler.load_middleware()
+            for url in ('/api/ping/', '/admin/ping/'):
+                handler.get_response(factory.get(url))  # warm up
+                samples = timed(lambda: handler.get_response(factory.get(url)), args.requests)
+                stats = summarize(samples)
+                print(f'{label:<16} {url:<13} mean {stats["mean_ms"] * 1000:7.1f} us  p99 {stats["p99_ms"] * 1000:7.1f} us')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""
+Behaviour under synthetic overload, with and without load shedding.
+
+Two stand-in views share a backend that can work on ``--capacity`` requests
+at once: a cheap one routed as ``recent-activities`` and an expensive one
+routed as ``activity-stats``, so they get the priorities configured in
+``LOAD_SHEDDING``. Requests arrive open-loop at ``--rate`` per second on
+``--threads`` server threads, like a gunicorn gthread worker, and clients give
+up after ``--timeout-ms``. The run is repeated without and with
+``LoadSheddingMiddleware``, printing per route how many requests succeeded in
+time, were shed with 503 or timed out, and the latency of the successful ones.
+
+    python -m benchmarks.overload --rate 400 --seconds 5 --capacity 4
+"""
+import argparse
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.http import HttpResponse
+from django.urls import path
+
+from benchmarks.common import setup_django, summarize
+from fitness_tracker_backend.load_shedding import LoadSheddingMiddleware
+
+
+_backend = None
+_work_seconds = {}
+
+
+def _work(name):
+    with _backend:
+        time.sleep(_work_seconds[name])
+    return HttpResponse('ok')
+
+
+def cheap(request):
+    return _work('recent-activities')
+
+
+def expensive(request):
+    return _work('activity-stats')
+
+
+urlpatterns = [
+    path('api/activities/recent/', cheap, name='recent-activities'),
+    path('api/activities/stats/', expensive, name='activity-stats'),
+]
+
+_limiters = []
+
+
+class RecordingLoadShedding(LoadSheddingMiddleware):
+    """Keeps its limiter around to report the final limit."""
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        _limiters.append(self.limiter)
+
+
+PATHS = {'recent-activities': '/api/activities/recent/', 'activity-stats': '/api/activities/stats/'}
+
+
+def drive(handler, factory, args):
+    """Send the open-loop request mix; return per-route outcomes."""
+    rng = random.Random(args.seed)
+    outcomes = defaultdict(lambda: {'ok': [], 'shed': 0, 'timed_out': 0})
+    lock = threading.Lock()
+    timeout = args.timeout_ms / 1000
+
+    def call(name, arrival):
+        response = handler.get_response(factory.get(PATHS[name]))
+        elapsed = time.perf_counter() - arrival
+        with lock:
+            outcome = outcomes[name]
+            if elapsed > timeout:
+                outcome['timed_out'] += 1
+            elif response.status_code == 503:
+                outcome['shed'] += 1
+            else:
+                outcome['ok'].append(elapsed)
+
+    total = int(args.rate * args.seconds)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.threads) as pool:
+        for index in range(total):
+            arrival = start + index / args.rate
+            delay = arrival - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            name = 'activity-stats' if rng.random() < args.expensive_share else 'recent-activities'
+            # Latency counts from the arrival, including time queued for a thread
+            pool.submit(call, name, arrival)
+    return outcomes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rate', type=float, default=400, help='requests per second offered')
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--threads', type=int, default=64, help='server threads')
+    parser.add_argument('--capacity', type=int, default=4, help='requests the backend works on at once')
+    parser.add_argument('--cheap-ms', type=float, default=5)
+    parser.add_argument('--expensive-ms', type=float, default=50)
+    parser.add_argument('--expensive-share', type=float, default=0.3)
+    parser.add_argument('--timeout-ms', type=float, default=2000, help='clients give up after this')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.core.handlers.base import BaseHandler
+    from django.test import RequestFactory, override_settings
+
+    global _backend
+    _work_seconds.update({'recent-activities': args.cheap_ms / 1000, 'activity-stats': args.expensive_ms / 1000})
+    capacity_rps = args.capacity / (
+        args.expensive_share * args.expensive_ms + (1 - args.expensive_share) * args.cheap_ms
+    ) * 1000
+    print(f'offered {args.rate:.0f} req/s, backend capacity about {capacity_rps:.0f} req/s\n')
+
+    shedding = 'fitness_tracker_backend.load_shedding.LoadSheddingMiddleware'
+    without = [middleware for middleware in settings.MIDDLEWARE if middleware != shedding]
+    recording = [f'{__name__}.RecordingLoadShedding' if middleware == shedding else middleware
+                 for middleware in settings.MIDDLEWARE]
+    runs = (('without load shedding', without, False), ('with load shedding', recording, True))
+    factory = RequestFactory()
+    for label, middleware, enabled in runs:
+        _backend = threading.BoundedSemaphore(args.capacity)
+        load_shedding = {**settings.LOAD_SHEDDING, 'ENABLED': enabled}
+        with override_settings(MIDDLEWARE=middleware, ROOT_URLCONF=__name__, LOAD_SHEDDING=load_shedding):
+            handler = BaseHandler()
+            handler.load_middleware()
+            outcomes = drive(handler, factory, args)
+
+        print(label)
+        good = 0
+        for name in PATHS:
+            outcome = outcomes[name]
+            stats = summarize(outcome['ok'])
+            good += len(outcome['ok'])
+            print(
+                f'  {name:<18} ok {len(outcome["ok"]):>5}  shed {outcome["shed"]:>5}  '
+                f'timed out {outcome["timed_out"]:>5}  p50 {stats["p50_ms"]:8.1f} ms  p99 {stats["p99_ms"]:8.1f} ms'
+            )
+        print(f'  goodput {good / args.seconds:.0f} req/s')
+        if enabled:
+            print(f'  final concurrency limit {_limiters[-1].limit.value:.1f}')
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Concurrent writers against one SQLite file, stock vs tuned backend.
+
+Starts ``--workers`` processes that each create ``--writes`` activities, each
+in a transaction that reads before it writes (like the API's create and bulk
+update paths). Runs once with Django's stock SQLite settings
+(``SQLITE_TUNING=False``) and once with the tuned profile, on fresh database
+files, and prints throughput, "database is locked" failures and latency.
+
+    python -m benchmarks.sqlite_writers --workers 4 --writes 200
+"""
+import argparse
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import time
+
+from benchmarks.common import summarize
+
+
+def _setup(db_path, tuned, migrate=False):
+    os.environ['SQLITE_TUNING'] = 'True' if tuned else 'False'
+    from benchmarks.common import setup_django
+    setup_django(db_path, migrate=migrate)
+
+
+def _prepare(db_path, tuned, users):
+    _setup(db_path, tuned, migrate=True)
+    from django.contrib.auth.models import User
+    User.objects.bulk_create([User(username=f'writer-{index}') for index in range(users)])
+
+
+def _write(args):
+    db_path, tuned, worker, writes = args
+    _setup(db_path, tuned)
+    from django.contrib.auth.models import User
+    from django.db import OperationalError, transaction
+    from django.utils import timezone
+    from activities.models import Activity
+    from fitness_tracker_backend.sqlite_backend import write_transactions
+
+    user = User.objects.get(username=f'writer-{worker}')
+    samples, locked = [], 0
+    for index in range(writes):
+        start = time.perf_counter()
+        try:
+            with write_transactions(), transaction.atomic():
+                position = Activity.objects.filter(user=user).count()
+                activity = Activity.objects.create(
+                    user=user, title=f'Run {position}', activity_type='workout', planned_date=timezone.now()
+                )
+                activity.logs.create(new_status='planned', notes='benchmark')
+        except OperationalError as exc:
+            if 'locked' not in str(exc):
+                raise
+            locked += 1
+            continue
+        samples.append(time.perf_counter() - start)
+    return samples, locked
+
+
+def run(tuned, workers, writes):
+    db_path = os.path.join(tempfile.mkdtemp(prefix='fitness-sqlite-'), 'bench.sqlite3')
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(1) as pool:
+        pool.apply(_prepare, (db_path, tuned, workers))
+
+    start = time.perf_counter()
+    with context.Pool(workers) as pool:
+        results = pool.map(_write, [(db_path, tuned, worker, writes) for worker in range(workers)])
+    elapsed = time.perf_counter() - start
+
+    samples = [sample for worker_samples, _ in results for sample in worker_samples]
+    locked = sum(worker_locked for _, worker_locked in results)
+    journal_mode = sqlite3.connect(db_path).execute('PRAGMA journal_mode').fetchone()[0]
+    return {
+        'journal_mode': journal_mode,
+        'committed': len(samples),
+        'locked_errors': locked,
+        'writes_per_second': round(len(samples) / elapsed, 1),
+        **summarize(samples),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--writes', type=int, default=200, help='transactions per worker')
+    args = parser.parse_args()
+
+    for label, tuned in (('stock sqlite3 backend', False), ('tuned sqlite backend', True)):
+        print(f'{label}: {run(tuned, args.workers, args.writes)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,420 @@
+"""
+Benchmark every activities and authentication endpoint.
+
+Seeds a scratch SQLite database with ``--users`` users, each with
+``--activities`` activities carrying ``--logs`` status logs (the same
+``--seed`` gives the same data), then drives each route of
+``activities/urls.py`` and ``authentication/urls.py`` either in-process
+through the WSGI handler or over HTTP against a local threaded server.
+
+Results (throughput and p50/p95/p99 latency per scenario) are printed and
+written as JSON. With ``--baseline`` the run is compared to an earlier result
+file and exits non-zero if any scenario's p95 latency or throughput got worse
+by more than ``--threshold``.
+
+    python -m benchmarks.suite --users 50 --activities 200 --logs 2 --requests 200
+    python -m benchmarks.suite --mode http --concurrency 4 --baseline benchmarks/results/base.json
+"""
+import argparse
+import http.client
+import io
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+from wsgiref.util import setup_testing_defaults
+
+from benchmarks.common import BASE_DIR, setup_django, summarize
+
+
+PASSWORD = 'bench-password-1'
+RESULTS_DIR = BASE_DIR / 'benchmarks' / 'results'
+BULK_DELETE_SIZE = 10
+
+# Run parameters that have to match for a baseline comparison to mean much
+COMPARABLE = ('mode', 'users', 'activities_per_user', 'logs_per_activity', 'requests', 'concurrency')
+
+# Routes that can't be driven request/response style
+SKIPPED = {
+    'activity-events': 'Server-Sent Events stream, needs ASGI and never completes',
+}
+
+
+class Scenario:
+    """One route and method, with a factory building each request's path and body."""
+
+    def __init__(self, name, url_name, method, build, expect=(200,)):
+        self.name = name
+        self.url_name = url_name
+        self.method = method
+        self.build = build
+        self.expect = expect
+
+
+def seed(users, activities, logs, seed_value):
+    """Create the dataset; return the benchmark user (the first one)."""
+    from django.contrib.auth.models import User
+    from django.db.models import F, Value
+    from django.db.models.functions import Least
+    from django.utils import timezone
+    from activities import rollups
+    from activities.models import Activity, ActivityLog
+
+    rng = random.Random(seed_value)
+    now = timezone.now()
+    types = [choice for choice, _ in Activity.ACTIVITY_TYPES]
+    statuses = [choice for choice, _ in Activity.STATUS_CHOICES]
+
+    owners = User.objects.bulk_create([User(username=f'bench{index}') for index in range(users)])
+    owners[0].set_password(PASSWORD)
+    owners[0].save(update_fields=['password'])
+
+    rows = []
+    for owner in owners:
+        for index in range(activities):
+            status = rng.choice(statuses)
+            planned = now - timedelta(days=rng.uniform(-30, 365))
+            rows.append(Activity(
+                user=owner,
+                title=f'Benchmark activity {index}',
+                activity_type=rng.choice(types),
+                status=status,
+                planned_date=planned,
+                completed_date=planned + timedelta(hours=1) if status == 'completed' else None,
+                duration_minutes=rng.randint(5, 120),
+                calories_burned=rng.randint(0, 1000),
+                steps_count=rng.randint(0, 20000),
+            ))
+    Activity.objects.bulk_create(rows, batch_size=2000)
+
+    log_rows = [
+        ActivityLog(activity=activity, old_status='planned', new_status=rng.choice(statuses), notes='seeded')
+        for activity in rows
+        for _ in range(logs)
+    ]
+    ActivityLog.objects.bulk_create(log_rows, batch_size=2000)
+    # Spread creation over the past year too, so stats span many periods
+    Activity.objects.update(created_at=Least(F('planned_date'), Value(now)))
+    rollups.refresh(full=True)
+    return owners[0]
+
+
+def build_scenarios(user, requests):
+    """Scenarios for every route, keyed to ``user``'s seeded data."""
+    from django.utils import timezone
+    from rest_framework_simplejwt.tokens import RefreshToken
+    from activities.models import Activity
+    from jobs.queue import enqueue
+    from jobs.worker import Worker
+
+    ids = list(Activity.objects.filter(user=user).order_by('id').values_list('id', flat=True))
+    read_ids = itertools.cycle(ids[:max(1, len(ids) // 2)])
+    # Each delete (and its warm-up) needs its own row; create them up front, outside the timings
+    deletable = iter(Activity.objects.bulk_create([
+        Activity(user=user, title='To delete', activity_type='other', planned_date=timezone.now())
+        for _ in range(requests + 1 + (requests + 1) * BULK_DELETE_SIZE)
+    ]))
+    # Downloads read the file of one export run here, not timed
+    export = enqueue('activities.export', user=user)
+    Worker('bench').run_once()
+    counter = itertools.count()
+    planned = timezone.now().isoformat()
+    # The end of today: the updates below leave events to replay
+    since = timezone.now().date().isoformat()
+
+    def refresh_token():
+        return {'refresh_token': str(RefreshToken.for_user(user))}
+
+    return [
+        Scenario('activities list', 'activity-list-create', 'GET', lambda: ('/api/activities/', None)),
+        Scenario('activities list filtered', 'activity-list-create', 'GET',
+                 lambda: ('/api/activities/?status=completed,in_progress&calories_burned__gte=300', None)),
+        Scenario('activities list as of', 'activity-list-create', 'GET',
+                 lambda: (f'/api/activities/?as_of={since}', None)),
+        Scenario('activities create', 'activity-list-create', 'POST', lambda: ('/api/activities/', {
+            'title': f'Run {next(counter)}', 'activity_type': 'workout', 'planned_date': planned,
+            'duration_minutes': 30,
+        }), expect=(201,)),
+        Scenario('activity detail', 'activity-detail', 'GET',
+                 lambda: (f'/api/activities/{next(read_ids)}/', None)),
+        Scenario('activity detail as of', 'activity-detail', 'GET',
+                 lambda: (f'/api/activities/{next(read_ids)}/?as_of={since}', None)),
+        Scenario('activity history', 'activity-history', 'GET',
+                 lambda: (f'/api/activities/{next(read_ids)}/history/', None)),
+        Scenario('activity update', 'activity-detail', 'PATCH',
+                 lambda: (f'/api/activities/{next(read_ids)}/', {'notes': f'edit {next(counter)}'})),
+        Scenario('activity delete', 'activity-detail', 'DELETE',
+                 lambda: (f'/api/activities/{next(deletable).id}/', None), expect=(204,)),
+        Scenario('activity stats', 'activity-stats', 'GET', lambda: ('/api/activities/stats/', None)),
+        Scenario('activity stats by week', 'activity-stats', 'GET',
+                 lambda: ('/api/activities/stats/?period=week', None)),
+        # A year of weeks: 52 rollup rows, however many activities
+        Scenario('activity stats for a year', 'activity-stats', 'GET',
+                 lambda: ('/api/activities/stats/?period=week&periods=52', None)),
+        Scenario('bulk status update', 'bulk-update-status', 'POST', lambda: ('/api/activities/bulk-update/', {
+            'activity_ids': [next(read_ids) for _ in range(10)], 'status': 'in_progress',
+        })),
+        # Flags the rows and queues the job; the deletes themselves aren't timed
+        Scenario('bulk delete', 'bulk-delete', 'POST', lambda: ('/api/activities/bulk-delete/', {
+            'activity_ids': [next(deletable).id for _ in range(BULK_DELETE_SIZE)],
+        }), expect=(202,)),
+        Scenario('recent activities', 'recent-activities', 'GET', lambda: ('/api/activities/recent/', None)),
+        Scenario('activity batch', 'activity-batch', 'GET', lambda: (
+            '/api/activities/batch/?ids=' + ','.join(str(next(read_ids)) for _ in range(20)), None
+        )),
+        # Queues the job only; its worker isn't part of the timing
+        Scenario('export activities', 'activity-export', 'POST',
+                 lambda: ('/api/activities/export/', None), expect=(202,)),
+        Scenario('export download', 'activity-export-download', 'GET',
+                 lambda: (f'/api/activities/export/{export.pk}/', None)),
+        Scenario('register', 'user-register', 'POST', lambda: ('/api/auth/register/', {
+            'username': f'new-user-{next(counter)}', 'email': f'new{next(counter)}@example.com',
+            'password': PASSWORD, 'password_confirm': PASSWORD,
+        }), expect=(201,)),
+        Scenario('login', 'user-login', 'POST', lambda: ('/api/auth/login/', {
+            'username': user.username, 'password': PASSWORD,
+        })),
+        # 400 is expected while the simplejwt token_blacklist app isn't installed
+        Scenario('logout', 'user-logout', 'POST', lambda: ('/api/auth/logout/', refresh_token()), expect=(200, 400)),
+        Scenario('profile', 'user-profile', 'GET', lambda: ('/api/auth/profile/', None)),
+        Scenario('profile update', 'user-profile', 'PATCH',
+                 lambda: ('/api/auth/profile/', {'first_name': f'Bench {next(counter)}'})),
+        Scenario('dashboard', 'user-dashboard', 'GET', lambda: ('/api/auth/dashboard/', None)),
+    ]
+
+
+def check_coverage(scenarios):
+    """Fail when a route in the benchmarked URLconfs has no scenario."""
+    from django.urls import URLPattern
+    from activities import urls as activity_urls
+    from authentication import urls as auth_urls
+
+    covered = {scenario.url_name for scenario in scenarios} | set(SKIPPED)
+    missing = [
+        pattern.name
+        for module in (activity_urls, auth_urls)
+        for pattern in module.urlpatterns
+        if isinstance(pattern, URLPattern) and pattern.name not in covered
+    ]
+    if missing:
+        raise SystemExit(f'No benchmark scenario for: {", ".join(missing)}')
+
+
+class InProcessClient:
+    """Calls the WSGI application directly, as a WSGI server would."""
+
+    def __init__(self, application, token):
+        self.application = application
+        self.token = token
+
+    def request(self, method, path, body):
+        payload = json.dumps(body).encode() if body is not None else b''
+        path_info, _, query = path.partition('?')
+        environ = {
+            'REQUEST_METHOD': method,
+            'PATH_INFO': path_info,
+            'QUERY_STRING': query,
+            'CONTENT_TYPE': 'application/json',
+            'CONTENT_LENGTH': str(len(payload)),
+            'HTTP_AUTHORIZATION': f'Bearer {self.token}',
+            'wsgi.input': io.BytesIO(payload),
+        }
+        setup_testing_defaults(environ)
+        status_holder = []
+        response = self.application(environ, lambda status, headers: status_holder.append(status))
+        try:
+            b"".join(response)
+        finally:
+            response.close()
+        return int(status_holder[0].split()[0])
+
+
+class HTTPClient:
+    """Sends real HTTP requests, one connection per thread."""
+
+    def __init__(self, host, port, token):
+        self.host = host
+        self.port = port
+        self.token = token
+
+    def request(self, method, path, body):
+        payload = json.dumps(body) if body is not None else None
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        try:
+            connection.request(method, path, body=payload, headers={
+                'Authorization': f'Bearer {self.token}', 'Content-Type': 'application/json',
+            })
+            response = connection.getresponse()
+            response.read()
+            return response.status
+        finally:
+            connection.close()
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def start_server(application):
+    server = make_server('127.0.0.1', 0, application, server_class=ThreadingWSGIServer, handler_class=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_scenario(client, scenario, requests, concurrency):
+    # Build requests up front so factories (and their queries) stay out of the timings
+    calls = [scenario.build() for _ in range(requests)]
+    lock = threading.Lock()
+    samples, errors = [], 0
+
+    def call(request):
+        nonlocal errors
+        path, body = request
+        start = time.perf_counter()
+        status = client.request(scenario.method, path, body)
+        elapsed = time.perf_counter() - start
+        with lock:
+            samples.append(elapsed)
+            if status not in scenario.expect:
+                errors += 1
+
+    start = time.perf_counter()
+    if concurrency == 1:
+        for request in calls:
+            call(request)
+    else:
+        with ThreadPoolExecutor(concurrency) as pool:
+            list(pool.map(call, calls))
+    wall = time.perf_counter() - start
+    return {
+        'route': scenario.url_name,
+        'method': scenario.method,
+        'errors': errors,
+        'throughput_rps': round(len(samples) / wall, 1),
+        **summarize(samples),
+    }
+
+
+def compare(results, baseline, threshold):
+    """Regressions of p95 latency or throughput beyond ``threshold`` (a fraction)."""
+    regressions = []
+    for name, current in results['scenarios'].items():
+        previous = baseline['scenarios'].get(name)
+        if not previous:
+            continue
+        if previous['p95_ms'] and current['p95_ms'] > previous['p95_ms'] * (1 + threshold):
+            regressions.append(f'{name}: p95 {previous["p95_ms"]} -> {current["p95_ms"]} ms')
+        if previous['throughput_rps'] and current['throughput_rps'] < previous['throughput_rps'] * (1 - threshold):
+            regressions.append(
+                f'{name}: throughput {previous["throughput_rps"]} -> {current["throughput_rps"]} req/s'
+            )
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--activities', type=int, default=100, help='activities per user')
+    parser.add_argument('--logs', type=int, default=2, help='status logs per activity')
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--requests', type=int, default=100, help='requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--mode', choices=('inprocess', 'http'), default='inprocess')
+    parser.add_argument('--only', help='comma-separated scenario names to run')
+    parser.add_argument('--output', help='result file (default benchmarks/results/<time>-<mode>.json)')
+    parser.add_argument('--baseline', help='earlier result file to compare with')
+    parser.add_argument('--threshold', type=float, default=0.10, help='allowed regression, e.g. 0.10 for 10%%')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.core.handlers.wsgi import WSGIHandler
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    user = seed(args.users, args.activities, args.logs, args.seed)
+    scenarios = build_scenarios(user, args.requests)
+    check_coverage(scenarios)
+    if args.only:
+        wanted = {name.strip() for name in args.only.split(',')}
+        scenarios = [scenario for scenario in scenarios if scenario.name in wanted]
+
+    token = str(AccessToken.for_user(user))
+    application = WSGIHandler()
+    server = None
+    if args.mode == 'http':
+        server = start_server(application)
+        client = HTTPClient(*server.server_address[:2], token)
+    else:
+        client = InProcessClient(application, token)
+
+    results = {
+        'meta': {
+            'mode': args.mode,
+            'users': args.users,
+            'activities_per_user': args.activities,
+            'logs_per_activity': args.logs,
+            'seed': args.seed,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'skipped': SKIPPED,
+        'scenarios': {},
+    }
+    print(f'{"scenario":<26} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"errors":>6}')
+    for scenario in scenarios:
+        client.request(scenario.method, *scenario.build())  # warm up
+        result = run_scenario(client, scenario, args.requests, args.concurrency)
+        results['scenarios'][scenario.name] = result
+        print(f'{scenario.name:<26} {result["throughput_rps"]:>8} {result["p50_ms"]:>8} '
+              f'{result["p95_ms"]:>8} {result["p99_ms"]:>8} {result["errors"]:>6}')
+    if server is not None:
+        server.shutdown()
+
+    output = args.output or RESULTS_DIR / f'{time.strftime("%Y%m%d-%H%M%S")}-{args.mode}.json'
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as result_file:
+        json.dump(results, result_file, indent=2)
+    print(f'\nResults written to {output}')
+
+    failed = any(result['errors'] for result in results['scenarios'].values())
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        differing = [key for key in COMPARABLE if baseline['meta'].get(key) != results['meta'][key]]
+        if differing:
+            print(f'Note: baseline was run with different {", ".join(differing)}')
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        failed = failed or bool(regressions)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
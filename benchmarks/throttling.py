@@ -0,0 +1,67 @@
+"""
+Cost of a throttle check, token buckets vs DRF's request history throttle.
+
+Times ``allow_request`` for ``--clients`` users taking turns, with DRF's
+``UserRateThrottle`` (a list of request times per client in the local memory
+cache, trimmed on every check) and with ``throttling.UserRateThrottle`` on the
+per-process and the shared memory-mapped store. The rate is ``--rate`` so no
+request is refused and DRF's history grows to its full length.
+
+    python -m benchmarks.throttling --checks 20000 --rate 1000/min
+"""
+import argparse
+import os
+
+from benchmarks.common import setup_django, summarize, timed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--checks', type=int, default=20000)
+    parser.add_argument('--clients', type=int, default=10)
+    parser.add_argument('--rate', default='1000/min')
+    args = parser.parse_args()
+
+    db_path = setup_django(migrate=False)
+    from django.conf import settings
+    from django.contrib.auth.models import User
+    from django.test import RequestFactory, override_settings
+    from rest_framework import throttling as drf_throttling
+    from rest_framework.request import Request
+
+    from fitness_tracker_backend import throttling
+
+    factory = RequestFactory()
+    requests = []
+    for pk in range(1, args.clients + 1):
+        request = Request(factory.get('/api/activities/recent/'))
+        request.user = User(pk=pk, username=f'client{pk}')
+        requests.append(request)
+
+    rest_framework = {**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {'user': args.rate, 'anon': args.rate}}
+    caches = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'throttling'}}
+    path = os.path.join(os.path.dirname(db_path), 'throttle-bench.bin')
+    runs = [
+        ('DRF cache history', drf_throttling.UserRateThrottle, {}),
+        ('token bucket, local', throttling.UserRateThrottle, {'STORE': 'local'}),
+        ('token bucket, shared', throttling.UserRateThrottle, {'STORE': 'shared', 'PATH': path}),
+    ]
+    for label, throttle_class, store in runs:
+        with override_settings(REST_FRAMEWORK=rest_framework, CACHES=caches, THROTTLING=store):
+            throttling.reset_store()
+            # DRF reads its rates when the class is defined
+            throttle_class.THROTTLE_RATES = rest_framework['DEFAULT_THROTTLE_RATES']
+            turn = iter(range(args.checks * 2))
+
+            def check():
+                request = requests[next(turn) % len(requests)]
+                throttle_class().allow_request(request, None)
+
+            timed(check, args.checks)  # fills DRF's history
+            stats = summarize(timed(check, args.checks))
+        print(f'{label:<22} mean {stats["mean_ms"] * 1000:7.1f} us  p99 {stats["p99_ms"] * 1000:7.1f} us')
+    throttling.reset_store()
+
+
+if __name__ == '__main__':
+    main()
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fitness_tracker_backend.settings')
+# Connections opened by async views are not reused across requests
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
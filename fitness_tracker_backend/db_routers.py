@@ -0,0 +1,162 @@
+"""
+Database routers.
+
+``PrimaryReplicaRouter`` sends reads made inside a ``replica_reads`` view to
+one of ``settings.DATABASE_REPLICAS``; everything else stays on ``default``.
+Writes pin the owning user to the primary for ``READ_YOUR_WRITES_SECONDS`` so
+replication lag never hides a user's own changes from them:
+``ReadYourWritesMiddleware`` pins the user of every unsafe request, queryset
+``update()``/``delete()`` included, and saves outside requests pin the owner
+of the saved row. Pins live in the cache named by ``READ_YOUR_WRITES_CACHE``,
+which must be shared between workers; ``check_pin_cache`` refuses
+per-process caches while replicas are configured.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import checks
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+_read_from_replica = ContextVar('read_from_replica', default=False)
+# Users to pin when the current write request is done
+_pending_pins = ContextVar('pending_pins', default=None)
+
+PIN_KEY = 'db-primary-pin:{}'
+
+# Each process has its own copy: a pin set by one worker is invisible to the rest
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def _pin_cache():
+    return caches[getattr(settings, 'READ_YOUR_WRITES_CACHE', 'default')]
+
+
+def get_replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def _pin_seconds():
+    return getattr(settings, 'READ_YOUR_WRITES_SECONDS', 5)
+
+
+def pin_to_primary(user_id):
+    """Serve ``user_id``'s reads from the primary for the read-your-writes window."""
+    if user_id is None or not get_replicas():
+        return
+    pending = _pending_pins.get()
+    if pending is not None:
+        pending.add(user_id)
+        return
+    _pin_cache().set(PIN_KEY.format(user_id), True, _pin_seconds())
+
+
+@contextmanager
+def deferred_pins():
+    """Collect the pins of the writes made inside and set them once, on exit.
+
+    Yields the set of user ids to pin, which callers may add to.
+    """
+    pending = set()
+    token = _pending_pins.set(pending)
+    try:
+        yield pending
+    finally:
+        _pending_pins.reset(token)
+        pending.discard(None)
+        if pending:
+            _pin_cache().set_many({PIN_KEY.format(user_id): True for user_id in pending}, _pin_seconds())
+
+
+def is_pinned(user_id):
+    return bool(_pin_cache().get(PIN_KEY.format(user_id)))
+
+
+def replica_reads(view_func):
+    """Let the reads of a read-only view go to a replica unless the user just wrote."""
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if not get_replicas() or is_pinned(request.user.pk):
+            return view_func(request, *args, **kwargs)
+        token = _read_from_replica.set(True)
+        try:
+            return view_func(request, *args, **kwargs)
+        finally:
+            _read_from_replica.reset(token)
+    return wrapper
+
+
+def check_pin_cache(app_configs, **kwargs):
+    """System check: with replicas, pins must live in a cache every worker shares."""
+    if not get_replicas():
+        return []
+    alias = getattr(settings, 'READ_YOUR_WRITES_CACHE', 'default')
+    if alias not in settings.CACHES:
+        return [checks.Error(
+            f"READ_YOUR_WRITES_CACHE names the undefined cache '{alias}'.",
+            id='db_routers.E001',
+        )]
+    backend = settings.CACHES[alias]['BACKEND']
+    if backend in PROCESS_LOCAL_CACHES:
+        return [checks.Error(
+            f"READ_YOUR_WRITES_CACHE '{alias}' uses {backend}, which is not shared between worker processes.",
+            hint='Use a shared cache such as DatabaseCache or Redis so every worker sees the primary pins.',
+            id='db_routers.E002',
+        )]
+    return []
+
+
+def owner_id(instance):
+    """Id of the user owning ``instance``, using only already-loaded values.
+
+    Routers are consulted while instances are still being constructed, so
+    attribute access could trigger deferred-field queries.
+    """
+    if isinstance(instance, get_user_model()):
+        return instance.__dict__.get('id')
+    user_id = instance.__dict__.get('user_id')
+    if user_id is None:
+        activity = instance._state.fields_cache.get('activity')
+        if activity is not None:
+            user_id = activity.__dict__.get('user_id')
+    return user_id
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = get_replicas()
+        if not replicas or not _read_from_replica.get():
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            # Reads inside a transaction must see its own writes
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        if not get_replicas():
+            return None
+        instance = hints.get('instance')
+        if instance is not None:
+            pin_to_primary(owner_id(instance))
+        # Rows read from a replica are still saved to the primary
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        databases = {DEFAULT_DB_ALIAS, *get_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in get_replicas():
+            return False
+        return None
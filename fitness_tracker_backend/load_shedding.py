@@ -0,0 +1,202 @@
+"""
+Adaptive concurrency limiting and load shedding.
+
+``LoadSheddingMiddleware`` caps how many API requests a worker process
+handles at once. Past the cap requests wait, cheap ones first, and a request
+that would wait longer than its priority's ``QUEUE_BUDGET_MS`` gets an
+immediate ``503`` with ``Retry-After`` instead of timing out in the queue.
+
+The cap adapts to observed latency (AIMD): while the worker is busy, each
+response whose view is running at its usual latency raises the limit by
+``1 / limit`` (about one per limit's worth of requests), and views slowing
+to ``LATENCY_TOLERANCE`` times their usual latency cut it by ``BACKOFF``, at
+most once per slow response time. Each view's usual latency is the lowest
+recent moving average, drifting up slowly so lasting changes are learnt.
+
+``PRIORITIES`` maps URL names, optionally prefixed with a method
+(``'GET activity-detail'``), to ``high``, ``normal`` (the default) or
+``low``. A priority may only fill ``SHARES[priority]`` of the limit, so
+expensive low priority requests can never take the slots cheap ones need.
+
+Limits are per process and only apply under threaded WSGI workers (gunicorn
+``--threads``), where the threads of one worker share one limit. The
+middleware is synchronous: under ASGI Django runs it in a single thread, so
+at most one request is ever in flight and the limit is never reached.
+It is off unless ``ENABLED`` is set, which only pays off together with
+threaded workers.
+"""
+import itertools
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import JsonResponse
+from django.urls import Resolver404, resolve
+
+from monitoring import metrics
+
+
+HIGH = 'high'
+NORMAL = 'normal'
+LOW = 'low'
+RANKS = {HIGH: 0, NORMAL: 1, LOW: 2}
+
+DEFAULTS = {
+    'ENABLED': False,
+    'PATHS': ['/api/'],
+    'INITIAL_LIMIT': 20,
+    'MIN_LIMIT': 2,
+    'MAX_LIMIT': 200,
+    'LATENCY_TOLERANCE': 2.0,
+    'BACKOFF': 0.9,
+    'SHARES': {HIGH: 1.0, NORMAL: 0.8, LOW: 0.5},
+    'QUEUE_BUDGET_MS': {HIGH: 1000, NORMAL: 500, LOW: 200},
+    'RETRY_AFTER_SECONDS': 1,
+    'PRIORITIES': {},
+    'EXEMPT': [],
+}
+
+# Weight of the newest response in a view's moving average latency
+SMOOTHING = 0.3
+# Share of the gap a view's usual latency moves up per slower response
+DRIFT = 0.01
+
+
+def get_setting(name):
+    return getattr(settings, 'LOAD_SHEDDING', {}).get(name, DEFAULTS[name])
+
+
+class AIMDLimit:
+    """Concurrency limit raised additively while latency holds, cut on slowdowns.
+
+    Not thread-safe: ``ConcurrencyLimiter`` calls it under its lock.
+    """
+
+    def __init__(self, initial, minimum, maximum, tolerance, backoff):
+        self.value = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.tolerance = tolerance
+        self.backoff = backoff
+        # view -> [moving average, usual latency]
+        self._latencies = {}
+        self._next_decrease = 0.0
+
+    def update(self, key, latency, in_flight, now=None):
+        """Account for a response of view ``key`` that took ``latency`` seconds."""
+        now = time.monotonic() if now is None else now
+        latencies = self._latencies.get(key)
+        if latencies is None:
+            latencies = self._latencies[key] = [latency, latency]
+        average = latencies[0] = latencies[0] + (latency - latencies[0]) * SMOOTHING
+        usual = latencies[1] = min(average, latencies[1] + (average - latencies[1]) * DRIFT)
+
+        # An idle worker's latency says nothing about its limit
+        if in_flight * 2 < self.value:
+            return
+        if average > usual * self.tolerance:
+            if now >= self._next_decrease:
+                self.value = max(self.minimum, self.value * self.backoff)
+                self._next_decrease = now + latency
+        else:
+            self.value = min(self.maximum, self.value + 1 / self.value)
+
+
+class ConcurrencyLimiter:
+    """Admits requests while fewer than ``limit.value`` run, highest priority first."""
+
+    def __init__(self, limit, shares):
+        self.limit = limit
+        self.shares = shares
+        self.in_flight = 0
+        self._condition = threading.Condition()
+        self._waiting = set()
+        self._sequence = itertools.count()
+
+    def _may_run(self, priority, ticket):
+        if self.in_flight >= max(1, self.limit.value * self.shares[priority]):
+            return False
+        return all(other > ticket for other in self._waiting if other != ticket)
+
+    def acquire(self, priority, timeout):
+        """Wait up to ``timeout`` seconds for a slot; ``False`` if none came free."""
+        with self._condition:
+            # Higher priority first, then first come first served
+            ticket = (RANKS[priority], next(self._sequence))
+            if self._may_run(priority, ticket):
+                self.in_flight += 1
+                return True
+            deadline = time.monotonic() + timeout
+            self._waiting.add(ticket)
+            try:
+                while not self._may_run(priority, ticket):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    self._condition.wait(remaining)
+                self.in_flight += 1
+                return True
+            finally:
+                self._waiting.discard(ticket)
+                # Whoever is next in line may be able to run now
+                self._condition.notify_all()
+
+    def release(self, key, latency):
+        with self._condition:
+            self.limit.update(key, latency, self.in_flight)
+            self.in_flight -= 1
+            self._condition.notify_all()
+            return self.limit.value
+
+
+class LoadSheddingMiddleware:
+    """Limits concurrent API requests per worker and sheds the excess with 503."""
+
+    def __init__(self, get_response):
+        if not get_setting('ENABLED'):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.paths = tuple(get_setting('PATHS'))
+        self.priorities = get_setting('PRIORITIES')
+        self.exempt = frozenset(get_setting('EXEMPT'))
+        self.budgets = {priority: ms / 1000 for priority, ms in get_setting('QUEUE_BUDGET_MS').items()}
+        self.limiter = ConcurrencyLimiter(
+            AIMDLimit(
+                get_setting('INITIAL_LIMIT'), get_setting('MIN_LIMIT'), get_setting('MAX_LIMIT'),
+                get_setting('LATENCY_TOLERANCE'), get_setting('BACKOFF'),
+            ),
+            get_setting('SHARES'),
+        )
+        metrics.set_concurrency_limit(self.limiter.limit.value)
+
+    def classify(self, request):
+        """URL name and priority of ``request``."""
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return None, NORMAL
+        # Lets metrics label shed requests with their view
+        request.resolver_match = match
+        name = match.url_name
+        return name, self.priorities.get(f'{request.method} {name}') or self.priorities.get(name, NORMAL)
+
+    def __call__(self, request):
+        if not request.path_info.startswith(self.paths):
+            return self.get_response(request)
+        name, priority = self.classify(request)
+        if name in self.exempt:
+            return self.get_response(request)
+
+        if not self.limiter.acquire(priority, self.budgets[priority]):
+            metrics.record_shed(name or 'unresolved', priority)
+            response = JsonResponse(
+                {'error': 'The server is busy, please retry shortly'}, status=503
+            )
+            response['Retry-After'] = str(get_setting('RETRY_AFTER_SECONDS'))
+            return response
+        start = time.perf_counter()
+        try:
+            return self.get_response(request)
+        finally:
+            metrics.set_concurrency_limit(self.limiter.release(name, time.perf_counter() - start))
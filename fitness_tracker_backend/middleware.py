@@ -0,0 +1,158 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.core.handlers.base import BaseHandler
+from django.core.handlers.exception import convert_exception_to_response
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils.module_loading import import_string
+
+from .db_routers import deferred_pins, get_replicas
+from .sqlite_backend import write_transactions
+
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+
+class WriteTransactionMiddleware:
+    """Run write requests in one transaction opened with ``BEGIN IMMEDIATE`` on SQLite.
+
+    Most views write in autocommit mode, where ``write_transactions()`` alone
+    never comes into play. Wrapping the request makes its writes wait for the
+    write lock up front instead of failing on a lock upgrade. Server error
+    responses roll the request back, as the exception behind them would have.
+    """
+
+    using = DEFAULT_DB_ALIAS
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.method in SAFE_METHODS:
+            return self.get_response(request)
+        with write_transactions(), transaction.atomic(using=self.using):
+            response = self.get_response(request)
+            if response.status_code >= 500:
+                transaction.set_rollback(True, using=self.using)
+        return response
+
+
+class ReadYourWritesMiddleware:
+    """Pin the user of every write request to the primary once it is done.
+
+    Owners of rows saved during the request are pinned along with them, in
+    one cache write. Runs after the view so the JWT user DRF authenticated is
+    known.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.method in SAFE_METHODS or not get_replicas():
+            return self.get_response(request)
+        with deferred_pins() as pending:
+            response = self.get_response(request)
+            user = getattr(request, 'user', None)
+            if user is not None and user.is_authenticated:
+                pending.add(user.pk)
+        return response
+
+
+class RouteMiddleware:
+    """Run ``settings.BROWSER_MIDDLEWARE`` for every path except the lean ones.
+
+    JWT-authenticated API requests don't need sessions, CSRF, messages or
+    clickjacking protection, so paths starting with one of
+    ``LEAN_MIDDLEWARE_PREFIXES`` skip straight to the view. Everything else,
+    such as the admin, goes through the browser middleware as if it were
+    listed in ``MIDDLEWARE`` in place of this class, including their
+    ``process_view``/``process_exception``/``process_template_response`` hooks.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        self.lean_prefixes = tuple(getattr(settings, 'LEAN_MIDDLEWARE_PREFIXES', ()))
+        self._view_middleware = []
+        self._template_response_middleware = []
+        self._exception_middleware = []
+        self.browser_chain = self._load(getattr(settings, 'BROWSER_MIDDLEWARE', []))
+
+    def _load(self, middleware_paths):
+        """Build a chain around ``get_response`` the way ``BaseHandler.load_middleware`` does."""
+        adapter = BaseHandler()
+        handler = self.get_response
+        handler_is_async = self.async_mode
+        for middleware_path in reversed(middleware_paths):
+            middleware = import_string(middleware_path)
+            if not handler_is_async and getattr(middleware, 'sync_capable', True):
+                middleware_is_async = False
+            else:
+                middleware_is_async = getattr(middleware, 'async_capable', False)
+            adapted_handler = adapter.adapt_method_mode(middleware_is_async, handler, handler_is_async)
+            try:
+                instance = middleware(adapted_handler)
+            except MiddlewareNotUsed:
+                continue
+            if instance is None:
+                raise ImproperlyConfigured(f'Middleware factory {middleware_path} returned None.')
+
+            # Hooks are called synchronously by this class, so adapt them that way
+            if hasattr(instance, 'process_view'):
+                self._view_middleware.insert(0, adapter.adapt_method_mode(False, instance.process_view))
+            if hasattr(instance, 'process_template_response'):
+                self._template_response_middleware.append(
+                    adapter.adapt_method_mode(False, instance.process_template_response)
+                )
+            if hasattr(instance, 'process_exception'):
+                self._exception_middleware.append(adapter.adapt_method_mode(False, instance.process_exception))
+
+            handler = convert_exception_to_response(instance)
+            handler_is_async = middleware_is_async
+        return adapter.adapt_method_mode(self.async_mode, handler, handler_is_async)
+
+    def is_lean(self, request):
+        return request.path_info.startswith(self.lean_prefixes)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if self.is_lean(request):
+            return self.get_response(request)
+        return self.browser_chain(request)
+
+    async def __acall__(self, request):
+        if self.is_lean(request):
+            return await self.get_response(request)
+        return await self.browser_chain(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if self.is_lean(request):
+            return None
+        for method in self._view_middleware:
+            response = method(request, view_func, view_args, view_kwargs)
+            if response is not None:
+                return response
+        return None
+
+    def process_template_response(self, request, response):
+        if self.is_lean(request):
+            return response
+        for method in self._template_response_middleware:
+            response = method(request, response)
+        return response
+
+    def process_exception(self, request, exception):
+        if self.is_lean(request):
+            return None
+        for method in self._exception_middleware:
+            response = method(request, exception)
+            if response is not None:
+                return response
+        return None
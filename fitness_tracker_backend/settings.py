@@ -12,7 +12,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
-from decouple import config
+import tempfile
+from decouple import Csv, config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -45,18 +46,34 @@ INSTALLED_APPS = [
     'django_filters',
     'authentication',
     'activities',
+    'monitoring',
+    'jobs',
 ]
 
 MIDDLEWARE = [
+    'monitoring.metrics.MetricsMiddleware',
+    'monitoring.profiling.ProfilingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
+    'fitness_tracker_backend.load_shedding.LoadSheddingMiddleware',
+    'fitness_tracker_backend.middleware.ReadYourWritesMiddleware',
+    'fitness_tracker_backend.middleware.RouteMiddleware',
+]
+
+# Run by RouteMiddleware for the admin and other browser-facing pages. API
+# requests authenticate with JWT and skip them.
+BROWSER_MIDDLEWARE = [
+    'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
+LEAN_MIDDLEWARE_PREFIXES = ['/api/']
+# The admin's middleware checks only look at MIDDLEWARE; it gets them through
+# BROWSER_MIDDLEWARE.
+SILENCED_SYSTEM_CHECKS = ['admin.E408', 'admin.E409', 'admin.E410']
 
 ROOT_URLCONF = 'fitness_tracker_backend.urls'
 
@@ -122,6 +139,83 @@ else:
             'NAME': BASE_DIR / 'db.sqlite3',
         }
     }
+    # Tuned for several gunicorn workers on one node: WAL lets readers run
+    # alongside a writer, writers wait for the lock instead of failing, and
+    # write requests take the lock when their transaction starts.
+    if config('SQLITE_TUNING', default=True, cast=bool):
+        DATABASES['default']['ENGINE'] = 'fitness_tracker_backend.sqlite_backend'
+        DATABASES['default']['OPTIONS'] = {
+            'timeout': config('SQLITE_BUSY_TIMEOUT', default=20, cast=int),
+            'pragmas': {
+                'journal_mode': 'WAL',
+                'synchronous': config('SQLITE_SYNCHRONOUS', default='NORMAL'),
+                'mmap_size': config('SQLITE_MMAP_SIZE', default=256 * 1024 * 1024, cast=int),
+                'cache_size': -config('SQLITE_CACHE_SIZE_KB', default=64 * 1024, cast=int),
+                'temp_store': 'MEMORY',
+            },
+        }
+        MIDDLEWARE.append('fitness_tracker_backend.middleware.WriteTransactionMiddleware')
+
+# Persistent connections: each worker thread keeps its connection open for
+# DB_CONN_MAX_AGE seconds (0 closes it after every request, None never
+# recycles it) and checks it is still alive before reusing it. asgi.py sets
+# the default to 0 because async requests don't reuse a thread's connection.
+DATABASES['default']['CONN_MAX_AGE'] = config('DB_CONN_MAX_AGE', default=60, cast=int)
+DATABASES['default']['CONN_HEALTH_CHECKS'] = config('DB_CONN_HEALTH_CHECKS', default=True, cast=bool)
+
+# Read replicas: comma-separated hosts (PostgreSQL/MySQL) or file paths (SQLite).
+# Each replica copies the primary's settings with HOST or NAME swapped. Reads
+# from views marked with db_routers.replica_reads go to a random replica,
+# except for users who wrote within READ_YOUR_WRITES_SECONDS.
+_sqlite_files = DB_ENGINE not in ('postgresql', 'mysql')
+DATABASE_REPLICAS = []
+for _index, _replica in enumerate(
+    config('DB_REPLICA_NAMES' if _sqlite_files else 'DB_REPLICA_HOSTS', default='', cast=Csv()),
+    start=1
+):
+    DATABASES[f'replica_{_index}'] = {
+        **DATABASES['default'],
+        'NAME' if _sqlite_files else 'HOST': _replica,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica_{_index}')
+
+# Activity shards: comma-separated hosts (PostgreSQL/MySQL) or file paths
+# (SQLite), added as shard_1..shard_N. Each user's activities live on one shard,
+# picked by consistent hashing (see activities/sharding.py). Set
+# ACTIVITY_SHARDS_INCLUDE_DEFAULT to keep using the default database as a shard.
+ACTIVITY_SHARDS = ['default'] if config('ACTIVITY_SHARDS_INCLUDE_DEFAULT', default=False, cast=bool) else []
+for _index, _shard in enumerate(
+    config('DB_SHARD_NAMES' if _sqlite_files else 'DB_SHARD_HOSTS', default='', cast=Csv()),
+    start=1
+):
+    DATABASES[f'shard_{_index}'] = {
+        **DATABASES['default'],
+        'NAME' if _sqlite_files else 'HOST': _shard,
+    }
+    ACTIVITY_SHARDS.append(f'shard_{_index}')
+if ACTIVITY_SHARDS == ['default']:
+    ACTIVITY_SHARDS = []
+
+DATABASE_ROUTERS = [
+    'activities.sharding.ShardRouter',
+    'fitness_tracker_backend.db_routers.PrimaryReplicaRouter',
+]
+READ_YOUR_WRITES_SECONDS = config('READ_YOUR_WRITES_SECONDS', default=5, cast=int)
+# Pins must be seen by every worker, so they go to a database cache on the
+# primary (python manage.py createcachetable) unless READ_YOUR_WRITES_CACHE
+# names another shared cache. Per-process caches fail the system checks.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'read_your_writes': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'read_your_writes_pins',
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+}
+READ_YOUR_WRITES_CACHE = config('READ_YOUR_WRITES_CACHE', default='read_your_writes')
 
 
 # Password validation
@@ -177,7 +271,39 @@ REST_FRAMEWORK = {
         'rest_framework.renderers.JSONRenderer',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
-    'PAGE_SIZE': 20
+    'PAGE_SIZE': 20,
+    # Token buckets shared by the workers on a host, see
+    # fitness_tracker_backend/throttling.py
+    'DEFAULT_THROTTLE_CLASSES': [
+        'fitness_tracker_backend.throttling.UserRateThrottle',
+        'fitness_tracker_backend.throttling.ScopedRateThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'user': config('THROTTLE_RATE_USER', default='1200/min'),
+        'anon': config('THROTTLE_RATE_ANON', default='120/min'),
+        'auth': '20/min',
+        'stats': '60/min',
+        'bulk': '30/min',
+        'export': '10/hour',
+    },
+}
+
+# Endpoint classes for ScopedRateThrottle, by URL name. STORE 'shared' keeps
+# the buckets in a memory-mapped file at PATH that all workers on the host use;
+# 'local' keeps them per process.
+THROTTLING = {
+    'STORE': config('THROTTLE_STORE', default='shared'),
+    'PATH': config('THROTTLE_STORE_PATH', default=os.path.join(tempfile.gettempdir(), 'fitness-tracker-throttle.bin')),
+    'SLOTS': 65536,
+    'SCOPES': {
+        'user-login': 'auth',
+        'user-register': 'auth',
+        'activity-stats': 'stats',
+        'user-dashboard': 'stats',
+        'bulk-update-status': 'bulk',
+        'bulk-delete': 'bulk',
+        'activity-export': 'export',
+    },
 }
 
 # JWT Configuration
@@ -210,6 +336,146 @@ SIMPLE_JWT = {
     'SLIDING_TOKEN_REFRESH_LIFETIME': timedelta(days=1),
 }
 
+# Activity change events (Server-Sent Events, served under ASGI). SocketBroker
+# passes events between the processes of one host through Unix sockets in
+# SOCKET_DIR, so streams see writes made by any worker.
+ACTIVITY_EVENTS = {
+    'BROKER': config('ACTIVITY_EVENTS_BROKER', default='activities.events.SocketBroker'),
+    'QUEUE_SIZE': 100,
+    'HEARTBEAT_SECONDS': 15,
+    'RETRY_MILLISECONDS': 5000,
+    'SOCKET_DIR': config(
+        'ACTIVITY_EVENTS_SOCKET_DIR', default=os.path.join(tempfile.gettempdir(), 'fitness-tracker-events')
+    ),
+}
+
+# How long Idempotency-Key responses are replayed before eviction
+IDEMPOTENCY_KEY_TTL_HOURS = config('IDEMPOTENCY_KEY_TTL_HOURS', default=24, cast=int)
+# An unfinished request's claim on a key is taken over by retries after this
+# long (a few of gunicorn's default 30 second timeouts)
+IDEMPOTENCY_KEY_LEASE_SECONDS = config('IDEMPOTENCY_KEY_LEASE_SECONDS', default=120, cast=int)
+
+# Maximum number of ids accepted by GET /api/activities/batch/
+ACTIVITY_BATCH_MAX_IDS = 100
+
+# Prometheus metrics served at /metrics (see monitoring/metrics.py). Scrapes
+# send "Authorization: Bearer <METRICS_TOKEN>"; without a token only DEBUG
+# serves them.
+METRICS_ENABLED = config('METRICS_ENABLED', default=True, cast=bool)
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
+# Statements slower than THRESHOLD_MS are logged to LOG_FILE (rotated) with
+# their EXPLAIN plan and aggregated in the admin under Monitoring > Slow queries
+SLOW_QUERY_LOG = {
+    'ENABLED': config('SLOW_QUERY_LOG', default=False, cast=bool),
+    'THRESHOLD_MS': config('SLOW_QUERY_THRESHOLD_MS', default=200, cast=int),
+    'EXPLAIN': True,
+    'LOG_FILE': config('SLOW_QUERY_LOG_FILE', default=str(BASE_DIR / 'logs' / 'slow_queries.log')),
+    'LOG_MAX_BYTES': 10 * 1024 * 1024,
+    'LOG_BACKUP_COUNT': 5,
+}
+
+# Background job queue (see jobs/queue.py), run with `manage.py run_workers`.
+# CONCURRENCY overrides the per job type limits given to @job().
+JOBS = {
+    'POLL_INTERVAL': config('JOBS_POLL_INTERVAL', default=1.0, cast=float),
+    'LEASE_SECONDS': config('JOBS_LEASE_SECONDS', default=300, cast=int),
+    'BACKOFF_BASE_SECONDS': 10,
+    'BACKOFF_MAX_SECONDS': 3600,
+    'MAX_ATTEMPTS': config('JOBS_MAX_ATTEMPTS', default=5, cast=int),
+    'CONCURRENCY': {},
+}
+
+# Where activity export jobs write their files
+ACTIVITY_EXPORT_DIR = config('ACTIVITY_EXPORT_DIR', default=str(BASE_DIR / 'exports'))
+
+# Account and bulk activity deletions run as background jobs that delete this
+# many activities per transaction
+DELETION_BATCH_SIZE = config('DELETION_BATCH_SIZE', default=500, cast=int)
+
+# Maximum number of ids accepted by POST /api/activities/bulk-delete/
+ACTIVITY_BULK_DELETE_MAX_IDS = 10000
+
+# `manage.py archive_activity_logs` moves status logs older than DAYS out of
+# ActivityLog, BATCH_SIZE per transaction. POLICY 'archive' keeps them
+# compressed; 'summarize' keeps only per-activity transition counts.
+ACTIVITY_LOG_RETENTION = {
+    'DAYS': config('ACTIVITY_LOG_RETENTION_DAYS', default=90, cast=int),
+    'POLICY': config('ACTIVITY_LOG_RETENTION_POLICY', default='archive'),
+    'BATCH_SIZE': 500,
+}
+
+# Every save of an activity records the changed fields as an event; every
+# SNAPSHOT_EVERY versions also the whole row, so ?as_of= reads replay at most
+# that many events per activity
+ACTIVITY_HISTORY = {
+    'SNAPSHOT_EVERY': config('ACTIVITY_HISTORY_SNAPSHOT_EVERY', default=20, cast=int),
+}
+
+# Weekly and monthly totals per user behind /api/activities/stats/, kept up to
+# date by refresh_activity_rollups from the activity events; see
+# activities/rollups.py. ?periods= asks for at most MAX_PERIODS periods.
+ACTIVITY_ROLLUPS = {
+    'OVERLAP_SECONDS': 300,
+    'MAX_PERIODS': 53,
+    'BATCH_SIZE': 500,
+}
+
+# Concurrent identical requests to the stats and dashboard endpoints share one
+# computation, see fitness_tracker_backend/singleflight.py. Set
+# SINGLE_FLIGHT_CACHE to a cache shared between workers to coalesce across
+# them too; with STALE_SECONDS waiting requests take a result up to that old
+# instead of waiting for the one being computed.
+SINGLE_FLIGHT = {
+    'CACHE': config('SINGLE_FLIGHT_CACHE', default='') or None,
+    'WAIT_SECONDS': 10,
+    'LOCK_SECONDS': 30,
+    'STALE_SECONDS': config('SINGLE_FLIGHT_STALE_SECONDS', default=0, cast=int),
+}
+
+# Per-worker adaptive cap on concurrent API requests, see
+# fitness_tracker_backend/load_shedding.py. Requests over the cap wait up to
+# their priority's QUEUE_BUDGET_MS, then get 503 with Retry-After. Off by
+# default: it only limits anything with threaded workers, so enable it
+# together with gunicorn --threads.
+LOAD_SHEDDING = {
+    'ENABLED': config('LOAD_SHEDDING', default=False, cast=bool),
+    'PATHS': ['/api/'],
+    'INITIAL_LIMIT': config('LOAD_SHEDDING_INITIAL_LIMIT', default=20, cast=int),
+    'MIN_LIMIT': 2,
+    'MAX_LIMIT': config('LOAD_SHEDDING_MAX_LIMIT', default=200, cast=int),
+    'QUEUE_BUDGET_MS': {'high': 1000, 'normal': 500, 'low': 200},
+    'RETRY_AFTER_SECONDS': 1,
+    'PRIORITIES': {
+        'recent-activities': 'high',
+        'GET activity-detail': 'high',
+        'GET activity-batch': 'high',
+        'activity-stats': 'low',
+        'user-dashboard': 'low',
+        'activity-export': 'low',
+        'activity-export-download': 'low',
+        'activity-history': 'low',
+    },
+    # Server-Sent Event streams stay open for as long as the client listens
+    'EXEMPT': ['activity-events'],
+}
+
+# Opt-in request profiling (Server-Timing header, query budgets, profiles of
+# slow requests), see monitoring/profiling.py. QUERY_BUDGETS maps URL names to
+# the number of queries a request may issue.
+REQUEST_PROFILING = {
+    'ENABLED': config('REQUEST_PROFILING', default=False, cast=bool),
+    'PATHS': ['/api/activities/', '/api/auth/'],
+    'DEFAULT_QUERY_BUDGET': 10,
+    'QUERY_BUDGETS': {
+        'activity-stats': 8,
+        'user-dashboard': 6,
+    },
+    'SLOW_REQUEST_MS': config('PROFILE_SLOW_REQUEST_MS', default=500, cast=int),
+    'PROFILE_DIR': config('PROFILE_DIR', default='') or None,
+    'PROFILER': config('PROFILER', default='cprofile'),
+}
+
 # CORS Configuration
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
@@ -0,0 +1,30 @@
+"""
+API-only settings for serverless deployments.
+
+The JWT API needs none of the admin, sessions, messages, static files or
+templates, so this profile drops them and the middleware that serves them.
+Cold starts then import and initialise less. Use it with
+``DJANGO_SETTINGS_MODULE=fitness_tracker_backend.settings_api``; run the admin
+from a deployment using the full settings.
+"""
+from .settings import *  # noqa: F401,F403
+
+
+INSTALLED_APPS = [
+    app for app in INSTALLED_APPS
+    if app not in (
+        'django.contrib.admin',
+        'django.contrib.sessions',
+        'django.contrib.messages',
+        'django.contrib.staticfiles',
+    )
+]
+
+MIDDLEWARE = [
+    middleware for middleware in MIDDLEWARE
+    if middleware != 'fitness_tracker_backend.middleware.RouteMiddleware'
+]
+BROWSER_MIDDLEWARE = []
+
+# Responses are JSON only; error pages fall back to Django's built-in ones
+TEMPLATES = []
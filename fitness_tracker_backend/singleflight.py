@@ -0,0 +1,146 @@
+"""
+Single-flight coalescing of expensive read-only computations.
+
+``run(key, compute)`` makes concurrent calls with the same key share one
+computation: the first caller (the leader) runs ``compute`` and the others
+wait for its result instead of running it again. Within a process the
+followers are other threads. When ``SINGLE_FLIGHT['CACHE']`` names a cache
+shared between workers (Redis, database cache), the leader also holds a lock
+there and publishes its result there, so followers in other workers wait for
+it too.
+
+With ``STALE_SECONDS`` followers don't wait when a result at most that old is
+available: they get it while the leader recomputes (stale-while-revalidate).
+A caller arriving while nothing is being computed always computes, so stale
+results are only ever served alongside a refresh.
+"""
+import hashlib
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+
+
+DEFAULTS = {
+    'CACHE': None,
+    'WAIT_SECONDS': 10,
+    'LOCK_SECONDS': 30,
+    'POLL_SECONDS': 0.05,
+    'STALE_SECONDS': 0,
+}
+
+KEY_PREFIX = 'single-flight:'
+
+_flights = {}
+_flights_lock = threading.Lock()
+# Results for stale-while-revalidate when there is no shared cache
+_local_results = LocMemCache('single-flight', {'TIMEOUT': None, 'OPTIONS': {'MAX_ENTRIES': 1000}})
+
+
+def get_setting(name):
+    return getattr(settings, 'SINGLE_FLIGHT', {}).get(name, DEFAULTS[name])
+
+
+def _shared_cache():
+    alias = get_setting('CACHE')
+    return caches[alias] if alias else None
+
+
+def request_key(name, request):
+    """Key of a request to the view ``name``: its user and query parameters."""
+    params = '&'.join(f'{key}={value}' for key, value in sorted(request.GET.lists()))
+    digest = hashlib.sha1(params.encode('utf-8')).hexdigest()[:16]
+    return f'{name}:{request.user.pk}:{digest}'
+
+
+class _Flight:
+    """A computation running in this process, which other threads can wait for."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+def _fresh_enough(result, since, stale_seconds):
+    # Finished after the caller arrived, or within the stale window
+    return result is not None and (result[0] >= since or result[0] >= time.time() - stale_seconds)
+
+
+def run(key, compute, stale_seconds=None):
+    """Return ``compute()``, sharing one call among concurrent callers with ``key``.
+
+    ``key`` must be a valid cache key. Exceptions reach every caller waiting
+    on the failed computation in this process; followers in other workers
+    compute themselves instead.
+    """
+    stale_seconds = get_setting('STALE_SECONDS') if stale_seconds is None else stale_seconds
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+
+    if not leader:
+        store = _shared_cache() or _local_results
+        result = store.get(KEY_PREFIX + key) if stale_seconds else None
+        if _fresh_enough(result, time.time(), stale_seconds):
+            return result[1]
+        if not flight.done.wait(get_setting('WAIT_SECONDS')):
+            # The leader is stuck; don't hold this request hostage
+            return compute()
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    try:
+        flight.value = _lead(key, compute, stale_seconds)
+        return flight.value
+    except BaseException as error:
+        flight.error = error
+        raise
+    finally:
+        with _flights_lock:
+            del _flights[key]
+        flight.done.set()
+
+
+def _lead(key, compute, stale_seconds):
+    """Compute for this process, coalescing with the other workers if configured."""
+    cache = _shared_cache()
+    result_key = KEY_PREFIX + key
+    if cache is None:
+        value = compute()
+        if stale_seconds:
+            _local_results.set(result_key, (time.time(), value), stale_seconds)
+        return value
+
+    lock_key = f'{KEY_PREFIX}lock:{key}'
+    token = uuid.uuid4().hex
+    since = time.time()
+    deadline = time.monotonic() + get_setting('WAIT_SECONDS')
+    acquired = cache.add(lock_key, token, get_setting('LOCK_SECONDS'))
+    waited = not acquired
+    while not acquired and time.monotonic() < deadline:
+        # Another worker is computing: wait for what it publishes
+        result = cache.get(result_key)
+        if _fresh_enough(result, since, stale_seconds):
+            return result[1]
+        time.sleep(get_setting('POLL_SECONDS'))
+        acquired = cache.add(lock_key, token, get_setting('LOCK_SECONDS'))
+
+    try:
+        result = cache.get(result_key) if waited else None
+        if result is not None and result[0] >= since:
+            # Published just before the lock we then took was released
+            return result[1]
+        value = compute()
+        cache.set(result_key, (time.time(), value), max(stale_seconds, get_setting('LOCK_SECONDS')))
+        return value
+    finally:
+        # Unless the lock expired mid-computation and another worker took it
+        if acquired and cache.get(lock_key) == token:
+            cache.delete(lock_key)
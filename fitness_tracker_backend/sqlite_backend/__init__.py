@@ -0,0 +1,35 @@
+"""
+SQLite backend tuned for several worker processes writing to one file.
+
+On top of Django's SQLite backend it accepts two extra ``OPTIONS``:
+
+* ``pragmas`` - run on every new connection, e.g. ``{'journal_mode': 'WAL'}``
+* ``transaction_mode`` - ``DEFERRED`` (SQLite's default), ``IMMEDIATE`` or
+  ``EXCLUSIVE``, used for every ``transaction.atomic`` block
+
+A deferred transaction that reads and then writes fails straight away with
+"database is locked" when another process got the write lock first, because
+SQLite can't wait on a lock upgrade. Inside ``write_transactions()``
+transactions start with ``BEGIN IMMEDIATE`` instead, so they wait up to the
+busy timeout for the write lock up front. ``WriteTransactionMiddleware`` runs
+unsafe HTTP methods in one such transaction.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+
+_write_intent = ContextVar('sqlite_write_intent', default=False)
+
+
+@contextmanager
+def write_transactions():
+    """Start transactions opened in this block with ``BEGIN IMMEDIATE``."""
+    token = _write_intent.set(True)
+    try:
+        yield
+    finally:
+        _write_intent.reset(token)
+
+
+def has_write_intent():
+    return _write_intent.get()
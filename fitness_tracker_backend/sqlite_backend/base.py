@@ -0,0 +1,38 @@
+import re
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+from . import has_write_intent
+
+
+TRANSACTION_MODES = ('DEFERRED', 'IMMEDIATE', 'EXCLUSIVE')
+PRAGMA_VALUE = re.compile(r'^-?\w+$')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        # OPTIONS are passed to sqlite3.connect(); take ours out first
+        params = super().get_connection_params()
+        pragmas = params.pop('pragmas', None)
+        mode = params.pop('transaction_mode', 'DEFERRED').upper()
+        if mode not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(
+                f"SQLite transaction_mode must be one of {', '.join(TRANSACTION_MODES)}, not {mode!r}."
+            )
+        self.transaction_mode = mode
+        self.pragmas = dict(pragmas or {})
+        for name, value in self.pragmas.items():
+            if not name.isidentifier() or not PRAGMA_VALUE.match(str(value)):
+                raise ImproperlyConfigured(f'Invalid SQLite pragma {name} = {value!r}.')
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        mode = 'IMMEDIATE' if has_write_intent() and self.transaction_mode == 'DEFERRED' else self.transaction_mode
+        self.cursor().execute(f'BEGIN {mode}')
@@ -1,151 +1,153 @@
 """
-Custom test runner that uses SQLite in-memory database for testing.
+Custom test runner that uses SQLite in-memory databases for testing.
+
+Every configured database alias is switched to an in-memory SQLite database
+whose schema is created straight from the models (no migrations), together
+with ``TEST_SNAPSHOT_FIXTURES`` if set. That happens once, in the main
+process, and each database is then saved to a snapshot file with the SQLite
+backup API.
+
+With ``--parallel N`` every worker process restores the snapshots into its
+own private in-memory databases when it starts, so workers share nothing
+and nothing is rebuilt per worker. This works with both the ``fork`` and
+``spawn`` start methods.
+
+    python manage.py test --testrunner fitness_tracker_backend.test_runner.FastTestRunner --parallel 4
 """
+import multiprocessing
 import os
-import sys
-import time
-from unittest import TestSuite
-from django.test.runner import DiscoverRunner
+import shutil
+import sqlite3
+import tempfile
+
+import django
 from django.conf import settings
-from django.db import connections, DEFAULT_DB_ALIAS
-from django.db.backends.base.base import BaseDatabaseWrapper
-from django.db.backends.signals import connection_created
+from django.core.management import call_command
+from django.db import connections
+from django.test import runner as django_runner
+from django.test.runner import DiscoverRunner, ParallelTestSuite
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases
+
+
+SNAPSHOT_DIR_ENV = 'TEST_DB_SNAPSHOT_DIR'
+DEFAULT_TEST_LABELS = ['activities', 'authentication', 'monitoring', 'jobs']
+
+
+def snapshot_path(snapshot_dir, alias):
+    return os.path.join(snapshot_dir, f'{alias}.sqlite3')
+
+
+def restore_snapshot(connection, snapshot_dir, worker_id):
+    """Point ``connection`` at a private in-memory copy of its snapshot."""
+    if connection.connection is not None:
+        # Inherited from the parent by fork; never use it from this process
+        connection.connection.close()
+        connection.connection = None
+    path = snapshot_path(snapshot_dir, connection.alias)
+    if not os.path.exists(path):
+        # A test mirror: it shares its primary's settings dict and reconnects to its copy
+        return
+    connection.settings_dict['NAME'] = f'file:memorydb_{connection.alias}_{worker_id}?mode=memory&cache=shared'
+    connection.ensure_connection()
+    source = sqlite3.connect(path)
+    try:
+        source.backup(connection.connection)
+    finally:
+        source.close()
+
+
+def _init_worker(counter, initial_settings=None, serialized_contents=None, process_setup=None,
+                 process_setup_args=None, debug_mode=None):
+    """Django's worker initializer, with databases restored from the snapshots."""
+    with counter.get_lock():
+        counter.value += 1
+        django_runner._worker_id = worker_id = counter.value
+
+    spawned = multiprocessing.get_start_method() == 'spawn'
+    if spawned:
+        if callable(process_setup):
+            process_setup(*(process_setup_args or ()))
+        django.setup()
+        setup_test_environment(debug=debug_mode)
+
+    snapshot_dir = os.environ[SNAPSHOT_DIR_ENV]
+    for alias in connections:
+        connection = connections[alias]
+        if spawned:
+            connection.settings_dict.update(initial_settings[alias])
+            if serialized_contents and serialized_contents.get(alias):
+                connection._test_serialized_contents = serialized_contents[alias]
+        restore_snapshot(connection, snapshot_dir, worker_id)
+
+
+class SnapshotParallelTestSuite(ParallelTestSuite):
+    init_worker = _init_worker
+
 
 class FastTestRunner(DiscoverRunner):
-    """A test runner that uses SQLite in-memory database for faster testing."""
+    """A test runner that uses SQLite in-memory databases for faster testing."""
 
-    def __init__(self, *args, **kwargs):
-        # Keep __init__ small; real forcing happens in setup_databases before Django creates test DBs
-        super().__init__(*args, **kwargs)
+    parallel_test_suite = SnapshotParallelTestSuite
 
     def _force_sqlite_settings(self):
-        """Modify settings and existing connection objects to use SQLite in-memory DB.
-        This must be done before Django creates test databases (i.e. before calling
-        super().setup_databases()).
+        """Switch every alias to in-memory SQLite without migrations.
+
+        Must run before the test databases are created.
         """
-        # Force debug to False to prevent debug-specific behavior
         settings.DEBUG = False
-        # Disable logging during tests
         settings.LOGGING = {}
-
-        # Ensure we're using SQLite for testing (shared in-memory DB)
-        sqlite_conf = {
-            'ENGINE': 'django.db.backends.sqlite3',
-            'NAME': 'file:testdb?mode=memory&cache=shared',
-            'TEST': {
-                'NAME': 'file:testdb?mode=memory&cache=shared',
-                'MIRROR': False,
-            }
-        }
-        settings.DATABASES = {'default': sqlite_conf}
-
-        # Update any already-created connection objects so they pick up the SQLite config
-        for alias in list(connections):
-            try:
-                conn = connections[alias]
-                conn.settings_dict.update(sqlite_conf)
-            except Exception:
-                # ignore any connection that isn't ready yet
-                pass
-
-        # Set test mode flag
         settings.TESTING = True
 
-        # Register signal to ensure SQLite PRAGMA for foreign keys
-        def _enable_foreign_keys(connection, **kwargs):
-            if getattr(connection, 'vendor', None) == 'sqlite':
-                try:
-                    cursor = connection.cursor()
-                    cursor.execute('PRAGMA foreign_keys = ON;')
-                except Exception:
-                    pass
-
-        connection_created.connect(_enable_foreign_keys)
-
-        # Disable migrations by patching MigrationExecutor.migration_plan
-        try:
-            from django.db.migrations.executor import MigrationExecutor
-            def no_migrations(self, plan, *args, **kwargs):
-                # Return an empty plan so Django thinks there is nothing to migrate
-                return []
-            MigrationExecutor.migration_plan = no_migrations
-        except Exception:
-            # If migrations API differs, ignore and let migrations run
-            pass
+        databases = {}
+        for alias, original in settings.DATABASES.items():
+            test = {'MIGRATE': False}
+            if original.get('TEST', {}).get('MIRROR'):
+                test['MIRROR'] = original['TEST']['MIRROR']
+            databases[alias] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:', 'TEST': test}
+        settings.DATABASES = databases
+
+        # Connection objects created before this keep their own settings dict
+        configured = connections.configure_settings(databases)
+        for alias in connections:
+            connection = connections[alias]
+            connection.settings_dict.clear()
+            connection.settings_dict.update(configured[alias])
 
     def setup_databases(self, **kwargs):
-        """Set up the test databases using in-memory SQLite for speed."""
-        # Make sure settings and connection objects are configured for SQLite before Django creates test DBs
+        """Create the test databases once and snapshot them for parallel workers."""
         self._force_sqlite_settings()
-
-        try:
-            old_config = super().setup_databases(**kwargs)
-            return old_config
-        except Exception as e:
-            # If setup failed, try a safe teardown and re-raise
-            try:
-                self.teardown_databases({})
-            except Exception:
-                pass
-            raise
-
-    def run_tests(self, test_labels=None, extra_tests=None, **kwargs):
-        """Run tests with optimized settings and proper cleanup."""
-        # Setup test environment
-        self.setup_test_environment()
-
-        # Default to running app tests if none specified
-        if test_labels is None:
-            test_labels = ['activities', 'authentication']
-
-        old_config = None
-        try:
-            # Setup databases (this will use our forced SQLite settings)
-            old_config = self.setup_databases()
-
-            # Build test suite
-            suite = self.build_suite(test_labels, extra_tests)
-
-            # Run the test suite
-            result = self.run_suite(suite)
-
-            # Return number of failures (Django expects an int)
-            return self.suite_result(suite, result)
-
-        except Exception as e:
-            import traceback
-            traceback.print_exc()
-            raise
-
-        finally:
-            # Ensure cleanup happens even if tests fail
-            try:
-                if old_config is not None:
-                    self.teardown_databases(old_config)
-                self.teardown_test_environment()
-            except Exception as e:
-                print("Error during test teardown:", str(e))
-
-    def build_suite(self, test_labels=None, extra_tests=None, **kwargs):
-        """Build and sort the test suite."""
-        # Get the test suite from the parent class
-        suite = super().build_suite(test_labels, extra_tests, **kwargs)
-
-        # If suite is already a TestSuite, try to flatten it
-        test_cases = {}
-        for test in suite:
-            if hasattr(test, 'id'):
-                test_class = test.__class__
-                test_cases.setdefault(test_class, []).append(test)
-
-        # Create a new test suite with sorted tests
-        new_suite = TestSuite()
-        for test_class in sorted(test_cases.keys(), key=lambda x: x.__name__):
-            tests = sorted(test_cases[test_class], key=lambda x: x._testMethodName)
-            for test in tests:
-                new_suite.addTest(test)
-
-        # If no reordering happened, return original suite
-        return new_suite if len(new_suite) > 0 else suite
-
-
+        # parallel=0: workers restore the snapshots instead of Django's per-worker clones
+        old_config = setup_databases(
+            self.verbosity, self.interactive, time_keeper=self.time_keeper, keepdb=self.keepdb,
+            debug_sql=self.debug_sql, parallel=0, **kwargs
+        )
+        fixtures = getattr(settings, 'TEST_SNAPSHOT_FIXTURES', [])
+        aliases = kwargs.get('aliases') or list(connections)
+        for alias in aliases:
+            if fixtures and not connections[alias].settings_dict['TEST'].get('MIRROR'):
+                call_command('loaddata', *fixtures, database=alias, verbosity=0)
+
+        if self.parallel > 1:
+            self.snapshot_dir = tempfile.mkdtemp(prefix='test-db-snapshots-')
+            os.environ[SNAPSHOT_DIR_ENV] = self.snapshot_dir
+            for alias in aliases:
+                connection = connections[alias]
+                if connection.settings_dict['TEST'].get('MIRROR'):
+                    continue
+                connection.ensure_connection()
+                target = sqlite3.connect(snapshot_path(self.snapshot_dir, alias))
+                try:
+                    connection.connection.backup(target)
+                finally:
+                    target.close()
+        return old_config
+
+    def teardown_databases(self, old_config, **kwargs):
+        teardown_databases(old_config, verbosity=self.verbosity, parallel=0, keepdb=self.keepdb)
+        snapshot_dir = getattr(self, 'snapshot_dir', None)
+        if snapshot_dir:
+            shutil.rmtree(snapshot_dir, ignore_errors=True)
+            os.environ.pop(SNAPSHOT_DIR_ENV, None)
+
+    def build_suite(self, test_labels=None, *args, **kwargs):
+        return super().build_suite(test_labels or DEFAULT_TEST_LABELS, *args, **kwargs)
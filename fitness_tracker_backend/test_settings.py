@@ -5,8 +5,9 @@ import sys
 # Test mode
 TESTING = True
 
-# Use the standard test runner
-TEST_RUNNER = 'django.test.runner.DiscoverRunner'
+# In-memory SQLite built once and snapshotted, so --parallel N workers each
+# restore their own copy instead of rebuilding the schema
+TEST_RUNNER = 'fitness_tracker_backend.test_runner.FastTestRunner'
 
 # Use SQLite database for testing
 DATABASES = {
@@ -16,6 +17,14 @@ DATABASES = {
     }
 }
 
+# Replicas and shards configured in the environment don't exist in the test
+# database. Sharding tests enable ACTIVITY_SHARDS themselves using these two
+# in-memory databases.
+DATABASE_REPLICAS = []
+ACTIVITY_SHARDS = []
+DATABASES['shard_1'] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}
+DATABASES['shard_2'] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}
+
 # Disable password hashing for faster tests
 PASSWORD_HASHERS = [
     'django.contrib.auth.hashers.MD5PasswordHasher',
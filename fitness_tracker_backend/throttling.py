@@ -0,0 +1,237 @@
+"""
+Token bucket throttles with a store shared by all workers on a host.
+
+``UserRateThrottle`` limits every request per user (``user`` rate, ``anon``
+per client IP). ``ScopedRateThrottle`` adds a rate per endpoint class: the
+view's ``throttle_scope``, or the scope ``THROTTLING['SCOPES']`` gives its URL
+name (optionally prefixed with a method, ``'POST activity-list-create'``).
+Rates come from ``REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']`` as usual, e.g.
+``'60/min'``: a bucket of 60 tokens refilled at one per second, so short
+bursts up to the full rate pass and sustained traffic is held to it.
+
+Unlike DRF's throttles, which keep a list of request times per client in the
+cache, a bucket is two numbers, so a check is O(1) whatever the rate. With
+``THROTTLING['STORE'] = 'shared'`` buckets live in a memory-mapped file
+(``PATH``) of ``SLOTS`` fixed-size slots that every worker process maps, so
+limits hold across gunicorn workers without Redis; a check is a lock, a hash
+probe and two float writes, a few microseconds. ``'local'`` keeps buckets
+per process, and is used where ``fcntl`` is unavailable (Windows).
+"""
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+DEFAULTS = {
+    'STORE': 'shared',
+    'PATH': os.path.join(tempfile.gettempdir(), 'fitness-tracker-throttle.bin'),
+    'SLOTS': 65536,
+    'SCOPES': {},
+}
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def get_setting(name):
+    return getattr(settings, 'THROTTLING', {}).get(name, DEFAULTS[name])
+
+
+def parse_rate(rate):
+    """``'60/min'`` as ``(capacity, tokens per second)``; ``None`` for no limit."""
+    if rate is None:
+        return None
+    num, period = rate.split('/')
+    num = int(num)
+    return num, num / PERIODS[period[0]]
+
+
+def _refill(tokens, updated, capacity, refill_rate, now):
+    """Take a token if there is one; return ``(tokens left, seconds to wait)``."""
+    tokens = min(capacity, tokens + max(0.0, now - updated) * refill_rate)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / refill_rate
+
+
+class LocalBucketStore:
+    """Buckets in this process's memory."""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def consume(self, key, capacity, refill_rate, now=None):
+        """Take a token from ``key``'s bucket; return ``(allowed, seconds to wait)``."""
+        now = time.time() if now is None else now
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens, wait = _refill(tokens, updated, capacity, refill_rate, now)
+            if len(self._buckets) >= self.max_keys and key not in self._buckets:
+                # Forgetting buckets only ever lets clients through early
+                self._buckets.clear()
+            self._buckets[key] = (tokens, now)
+        return wait == 0.0, wait
+
+    def reset(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class SharedBucketStore:
+    """Buckets in a memory-mapped file shared by every process on the host.
+
+    Each slot holds a 64-bit key hash, the tokens left and when they were
+    counted. A key lives in one of ``PROBES`` slots from the one its hash
+    points at; when they are all taken by other keys the least recently used
+    one is reused, which only ever resets that key to a full bucket. Writers
+    take an ``flock`` on the file (other processes) and a thread lock (this
+    one) for the few microseconds a check takes.
+    """
+    SLOT = struct.Struct('<Qdd')
+    PROBES = 8
+
+    def __init__(self, path, slots):
+        self.path = path
+        self.slots = slots
+        self._lock = threading.Lock()
+        self._pid = None
+        self._fd = None
+        self._map = None
+
+    def _open(self):
+        # flock locks belong to the open file, so forked workers need their own
+        if self._pid == os.getpid():
+            return
+        size = self.slots * self.SLOT.size
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        self._fd, self._map, self._pid = fd, mmap.mmap(fd, size), os.getpid()
+
+    def _find_slot(self, key_hash):
+        """Offset of ``key_hash``'s slot and what it holds (``None`` if it's new)."""
+        home = key_hash % self.slots
+        reusable = None
+        for probe in range(self.PROBES):
+            offset = (home + probe) % self.slots * self.SLOT.size
+            stored_hash, tokens, updated = self.SLOT.unpack_from(self._map, offset)
+            if stored_hash == key_hash:
+                return offset, (tokens, updated)
+            if stored_hash == 0:
+                return offset, None
+            if reusable is None or updated < reusable[1]:
+                reusable = (offset, updated)
+        return reusable[0], None
+
+    def consume(self, key, capacity, refill_rate, now=None):
+        """Take a token from ``key``'s bucket; return ``(allowed, seconds to wait)``."""
+        now = time.time() if now is None else now
+        # Zero marks an empty slot
+        key_hash = int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little') or 1
+        with self._lock:
+            self._open()
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                offset, bucket = self._find_slot(key_hash)
+                tokens, updated = bucket or (capacity, now)
+                tokens, wait = _refill(tokens, updated, capacity, refill_rate, now)
+                self.SLOT.pack_into(self._map, offset, key_hash, tokens, now)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        return wait == 0.0, wait
+
+    def reset(self):
+        with self._lock:
+            self._open()
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                self._map[:] = bytes(len(self._map))
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """The bucket store configured by ``THROTTLING``, created on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            if get_setting('STORE') == 'shared' and fcntl is not None:
+                _store = SharedBucketStore(get_setting('PATH'), get_setting('SLOTS'))
+            else:
+                _store = LocalBucketStore()
+        return _store
+
+
+def reset_store():
+    """Forget the store (tests and settings changes)."""
+    global _store
+    with _store_lock:
+        _store = None
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Allow requests while their scope's bucket for the client has tokens."""
+
+    def get_scope(self, request, view):
+        raise NotImplementedError
+
+    def get_ident(self, request):
+        if request.user and request.user.is_authenticated:
+            return f'user:{request.user.pk}'
+        return f'ip:{super().get_ident(request)}'
+
+    def allow_request(self, request, view):
+        self.wait_seconds = None
+        scope = self.get_scope(request, view)
+        rate = parse_rate(api_settings.DEFAULT_THROTTLE_RATES.get(scope)) if scope else None
+        if rate is None:
+            return True
+        capacity, refill_rate = rate
+        allowed, self.wait_seconds = get_store().consume(
+            f'{scope}:{self.get_ident(request)}', capacity, refill_rate
+        )
+        return allowed
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class UserRateThrottle(TokenBucketThrottle):
+    """Every request, per user (``user`` rate) or per client IP (``anon``)."""
+
+    def get_scope(self, request, view):
+        return 'user' if request.user and request.user.is_authenticated else 'anon'
+
+
+class ScopedRateThrottle(TokenBucketThrottle):
+    """Requests to one class of endpoints, per user or client IP."""
+
+    def get_scope(self, request, view):
+        scope = getattr(view, 'throttle_scope', None)
+        match = request.resolver_match
+        if scope is None and match is not None:
+            scopes = get_setting('SCOPES')
+            scope = scopes.get(f'{request.method} {match.url_name}') or scopes.get(match.url_name)
+        return scope
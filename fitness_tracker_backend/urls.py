@@ -14,13 +14,21 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.contrib import admin
+from django.apps import apps
 from django.urls import path, include
 from rest_framework_simplejwt.views import TokenRefreshView
+from monitoring.views import prometheus_metrics
 
 urlpatterns = [
-    path('admin/', admin.site.urls),
     path('api/auth/', include('authentication.urls')),
     path('api/activities/', include('activities.urls')),
+    path('api/monitoring/', include('monitoring.urls')),
+    path('api/jobs/', include('jobs.urls')),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('metrics', prometheus_metrics, name='metrics'),
 ]
+
+# settings_api leaves the admin out; don't import it there
+if apps.is_installed('django.contrib.admin'):
+    from django.contrib import admin
+    urlpatterns.insert(0, path('admin/', admin.site.urls))
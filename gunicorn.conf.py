@@ -0,0 +1,24 @@
+"""
+Gunicorn settings, loaded automatically from the working directory.
+
+Workers write Prometheus metrics to PROMETHEUS_MULTIPROC_DIR so that /metrics
+can add up every worker's values (see monitoring/metrics.py).
+"""
+import os
+import shutil
+import tempfile
+
+metrics_dir = os.environ.setdefault(
+    'PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'fitness-tracker-metrics')
+)
+
+
+def on_starting(server):
+    # Files left by a previous run would be added to this run's values
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
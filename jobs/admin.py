@@ -0,0 +1,30 @@
+from django.contrib import admin
+from django.utils import timezone
+
+from .models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'job_type', 'status', 'priority', 'attempts', 'progress_display', 'user', 'run_at',
+                    'created_at', 'finished_at']
+    list_filter = ['status', 'job_type']
+    search_fields = ['job_type', 'user__username', 'locked_by']
+    ordering = ['-created_at']
+    readonly_fields = [field.name for field in Job._meta.fields]
+    actions = ['retry_now']
+    
+    @admin.display(description='Progress')
+    def progress_display(self, obj):
+        percent = obj.progress_percent
+        return f'{percent}%' if percent is not None else obj.progress_done
+    
+    @admin.action(description='Queue selected failed jobs to run again now')
+    def retry_now(self, request, queryset):
+        count = queryset.filter(status=Job.FAILED).update(
+            status=Job.QUEUED, attempts=0, run_at=timezone.now(), finished_at=None
+        )
+        self.message_user(request, f'Queued {count} jobs')
+    
+    def has_add_permission(self, request):
+        return False
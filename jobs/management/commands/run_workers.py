@@ -0,0 +1,51 @@
+import signal
+import threading
+
+from django.core.management.base import BaseCommand, CommandError
+
+from jobs import queue
+from jobs.worker import Worker, worker_name
+
+
+class Command(BaseCommand):
+    help = (
+        'Run background job workers. Start one process per core for CPU-heavy '
+        'jobs; --threads suits jobs that mostly wait on the database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=1, help='worker threads in this process')
+        parser.add_argument('--types', help='comma-separated job types to run (default: all)')
+        parser.add_argument('--poll-interval', type=float, help='seconds to wait when no job is due')
+        parser.add_argument('--burst', action='store_true', help='exit once no job is due')
+
+    def handle(self, *args, **options):
+        job_types = [name.strip() for name in options['types'].split(',')] if options['types'] else None
+        unknown = set(job_types or ()) - set(queue.registered_types())
+        if unknown:
+            raise CommandError(f'Unknown job types: {", ".join(sorted(unknown))}')
+
+        stop = threading.Event()
+
+        def shutdown(signum, frame):
+            self.stdout.write('Stopping after the current jobs...')
+            stop.set()
+
+        signal.signal(signal.SIGTERM, shutdown)
+        signal.signal(signal.SIGINT, shutdown)
+
+        workers = [
+            Worker(worker_name(index), job_types, options['poll_interval'])
+            for index in range(options['threads'])
+        ]
+        threads = [
+            threading.Thread(target=worker.run, args=(stop, options['burst']), name=worker.name)
+            for worker in workers
+        ]
+        self.stdout.write(f'Running {len(threads)} worker(s) for {", ".join(job_types or queue.registered_types())}')
+        for thread in threads:
+            thread.start()
+        # join() with a timeout so the main thread still handles signals
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(timeout=0.5)
@@ -0,0 +1,72 @@
+from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+from django.utils import timezone
+
+
+class Job(models.Model):
+    """A unit of background work, run by ``manage.py run_workers``"""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+
+    job_type = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder)
+    # Kept when the user is deleted, e.g. by an account deletion job
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True, related_name='+')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=QUEUED)
+    priority = models.SmallIntegerField(default=0, help_text='Higher runs first')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=200, blank=True)
+    locked_at = models.DateTimeField(blank=True, null=True)
+    # Renewed by progress reports; running jobs that go quiet are requeued
+    heartbeat_at = models.DateTimeField(blank=True, null=True)
+    progress_done = models.PositiveIntegerField(default=0)
+    progress_total = models.PositiveIntegerField(blank=True, null=True)
+    progress_message = models.CharField(max_length=200, blank=True)
+    result = models.JSONField(blank=True, null=True, encoder=DjangoJSONEncoder)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # Claim order: queued jobs by priority, then due time
+            models.Index(fields=['status', '-priority', 'run_at'], name='job_claim_idx'),
+            models.Index(fields=['job_type', 'status'], name='job_type_status_idx'),
+            models.Index(fields=['user', '-created_at'], name='job_user_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.job_type} #{self.pk} ({self.status})"
+
+    @property
+    def is_finished(self):
+        return self.status in (self.SUCCEEDED, self.FAILED)
+
+    @property
+    def progress_percent(self):
+        if not self.progress_total:
+            return 100.0 if self.status == self.SUCCEEDED else None
+        return round(min(self.progress_done, self.progress_total) * 100 / self.progress_total, 1)
+
+    def report_progress(self, done, total=None, message=None):
+        """Record how far the job got; also renews the worker's lease on it."""
+        self.progress_done = done
+        changes = {'progress_done': done, 'heartbeat_at': timezone.now()}
+        if total is not None:
+            self.progress_total = changes['progress_total'] = total
+        if message is not None:
+            self.progress_message = changes['progress_message'] = message[:200]
+        Job.objects.filter(pk=self.pk, locked_by=self.locked_by, locked_at=self.locked_at).update(**changes)
@@ -0,0 +1,244 @@
+"""
+Database-backed job queue.
+
+Job types are plain functions registered with ``@job('name')`` in an app's
+``jobs.py`` module, which ``JobsConfig`` imports at startup. ``enqueue()``
+inserts a ``Job`` row and returns at once; ``manage.py run_workers`` claims
+and runs queued jobs in priority order::
+
+    @job('activities.export', concurrency=2)
+    def export_activities(job):
+        ...
+        job.report_progress(done, total)
+        return {'file': name}          # stored as job.result
+
+    enqueue('activities.export', {'format': 'jsonl'}, user=request.user)
+
+Claiming uses ``SELECT ... FOR UPDATE SKIP LOCKED`` where the database has it
+(PostgreSQL, MySQL 8), so workers never wait on each other's rows. On SQLite,
+which serializes writers anyway, a worker claims a job with a conditional
+``UPDATE ... WHERE status = 'queued'`` and moves on to the next candidate when
+another worker got there first.
+
+A job that raises is retried with exponential backoff until ``max_attempts``;
+raising ``PermanentJobError`` fails it at once. A job type's ``concurrency``
+caps how many of its jobs run at the same time across all workers. While a
+job runs, the worker renews its lease from a heartbeat thread every third of
+``LEASE_SECONDS``; jobs whose worker died are requeued once the lease runs
+out. A run only records its progress and outcome while its claim still holds
+the job, so a run whose job was requeued meanwhile can't overwrite the next.
+"""
+import logging
+import random
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from fitness_tracker_backend.sqlite_backend import write_transactions
+from .models import Job
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'POLL_INTERVAL': 1.0,
+    'LEASE_SECONDS': 300,
+    'BACKOFF_BASE_SECONDS': 10,
+    'BACKOFF_MAX_SECONDS': 3600,
+    'MAX_ATTEMPTS': 5,
+    # Per job type overrides of the concurrency given to @job()
+    'CONCURRENCY': {},
+}
+
+# Queued jobs looked at per claim attempt on databases without SKIP LOCKED
+CLAIM_CANDIDATES = 10
+
+_registry = {}
+
+
+def get_setting(name):
+    return getattr(settings, 'JOBS', {}).get(name, DEFAULTS[name])
+
+
+class PermanentJobError(Exception):
+    """Raised by a job to fail without further retries."""
+
+
+class JobType:
+    def __init__(self, name, func, concurrency=None, max_attempts=None, priority=0):
+        self.name = name
+        self.func = func
+        self._concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.priority = priority
+
+    @property
+    def concurrency(self):
+        return get_setting('CONCURRENCY').get(self.name, self._concurrency)
+
+
+def job(name, concurrency=None, max_attempts=None, priority=0):
+    """Register the decorated function as the handler of job type ``name``.
+
+    ``concurrency`` limits how many jobs of this type run at once (``None``
+    for no limit); ``priority`` is the default for ``enqueue()``.
+    """
+    def decorator(func):
+        _registry[name] = JobType(name, func, concurrency, max_attempts, priority)
+        return func
+    return decorator
+
+
+def get_job_type(name):
+    return _registry.get(name)
+
+
+def registered_types():
+    return list(_registry)
+
+
+def enqueue(job_type, payload=None, user=None, priority=None, run_at=None, max_attempts=None):
+    """Queue a job and return it; raises ``ValueError`` for unknown job types."""
+    registered = get_job_type(job_type)
+    if registered is None:
+        raise ValueError(f'Unknown job type: {job_type}')
+    return Job.objects.create(
+        job_type=job_type,
+        payload=payload or {},
+        user=user,
+        priority=registered.priority if priority is None else priority,
+        run_at=run_at or timezone.now(),
+        max_attempts=max_attempts or registered.max_attempts or get_setting('MAX_ATTEMPTS'),
+    )
+
+
+def backoff(attempts):
+    """Delay before retry number ``attempts``: doubling from the base, capped, with 20% jitter."""
+    delay = min(get_setting('BACKOFF_MAX_SECONDS'), get_setting('BACKOFF_BASE_SECONDS') * 2 ** (attempts - 1))
+    return timedelta(seconds=delay * random.uniform(0.8, 1.0))
+
+
+def _saturated_types():
+    """Job types already running as many jobs as their concurrency allows."""
+    saturated = []
+    for name, registered in _registry.items():
+        limit = registered.concurrency
+        if limit is not None and Job.objects.filter(job_type=name, status=Job.RUNNING).count() >= limit:
+            saturated.append(name)
+    return saturated
+
+
+def _within_concurrency(claimed):
+    """Whether ``claimed`` is among the first claims of its type that fit the limit.
+
+    Two workers can both see a free slot and claim; the later claim loses.
+    """
+    registered = get_job_type(claimed.job_type)
+    limit = registered.concurrency if registered else None
+    if limit is None:
+        return True
+    first = Job.objects.filter(job_type=claimed.job_type, status=Job.RUNNING).order_by('locked_at', 'id')
+    return claimed.pk in set(first.values_list('id', flat=True)[:limit])
+
+
+def claim(worker_id, job_types=None):
+    """Mark the next due job as running for ``worker_id`` and return it, or ``None``."""
+    now = timezone.now()
+    candidates = Job.objects.filter(status=Job.QUEUED, run_at__lte=now)
+    if job_types:
+        candidates = candidates.filter(job_type__in=job_types)
+    saturated = _saturated_types()
+    if saturated:
+        candidates = candidates.exclude(job_type__in=saturated)
+    candidates = candidates.order_by('-priority', 'run_at', 'id')
+    running = {
+        'status': Job.RUNNING,
+        'locked_by': worker_id,
+        'locked_at': now,
+        'heartbeat_at': now,
+        'started_at': now,
+        'attempts': F('attempts') + 1,
+    }
+
+    alias = router.db_for_write(Job)
+    claimed = None
+    if connections[alias].features.has_select_for_update_skip_locked:
+        with transaction.atomic(using=alias):
+            row = candidates.select_for_update(skip_locked=True).values_list('id', flat=True).first()
+            if row is not None:
+                Job.objects.filter(pk=row).update(**running)
+                claimed = row
+    else:
+        for row in candidates.values_list('id', flat=True)[:CLAIM_CANDIDATES]:
+            if Job.objects.filter(pk=row, status=Job.QUEUED).update(**running):
+                claimed = row
+                break
+    if claimed is None:
+        return None
+
+    claimed_job = Job.objects.get(pk=claimed)
+    if not _within_concurrency(claimed_job):
+        Job.objects.filter(pk=claimed, locked_by=worker_id).update(
+            status=Job.QUEUED, locked_by='', locked_at=None, heartbeat_at=None, attempts=F('attempts') - 1
+        )
+        return None
+    return claimed_job
+
+
+def recover_stale_jobs():
+    """Requeue (or fail, when out of attempts) running jobs whose lease ran out."""
+    cutoff = timezone.now() - timedelta(seconds=get_setting('LEASE_SECONDS'))
+    stale = Job.objects.filter(status=Job.RUNNING, heartbeat_at__lt=cutoff)
+    message = 'Worker stopped renewing its lease; lease expired'
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.FAILED, locked_by='', last_error=message, finished_at=timezone.now()
+    )
+    requeued = stale.update(status=Job.QUEUED, locked_by='', locked_at=None, heartbeat_at=None, last_error=message)
+    if failed or requeued:
+        logger.warning('Recovered stale jobs: %d requeued, %d failed', requeued, failed)
+    return requeued + failed
+
+
+def _owned(claimed_job):
+    """``claimed_job``'s row while this claim of it still holds the lease."""
+    return Job.objects.filter(pk=claimed_job.pk, locked_by=claimed_job.locked_by, locked_at=claimed_job.locked_at)
+
+
+def renew_lease(claimed_job):
+    """Extend the lease on a running job; ``False`` once the claim has lost it."""
+    return bool(_owned(claimed_job).update(heartbeat_at=timezone.now()))
+
+
+def heartbeat_interval():
+    return get_setting('LEASE_SECONDS') / 3
+
+
+def run(claimed_job):
+    """Run a claimed job and record its outcome; returns the final or retry status."""
+    registered = get_job_type(claimed_job.job_type)
+    owned = _owned(claimed_job)
+    try:
+        if registered is None:
+            raise PermanentJobError(f'No handler registered for {claimed_job.job_type}')
+        # Take SQLite's write lock up front in the job's transactions, as for write requests
+        with write_transactions():
+            result = registered.func(claimed_job)
+    except Exception as exc:
+        error = traceback.format_exc()[-4000:]
+        if isinstance(exc, PermanentJobError) or claimed_job.attempts >= claimed_job.max_attempts:
+            owned.update(status=Job.FAILED, locked_by='', last_error=error, finished_at=timezone.now())
+            logger.error('Job %s failed after %d attempts', claimed_job, claimed_job.attempts)
+            return Job.FAILED
+        owned.update(
+            status=Job.QUEUED, locked_by='', locked_at=None, heartbeat_at=None, last_error=error,
+            run_at=timezone.now() + backoff(claimed_job.attempts),
+        )
+        logger.warning('Job %s failed (attempt %d), will retry', claimed_job, claimed_job.attempts)
+        return Job.QUEUED
+
+    owned.update(status=Job.SUCCEEDED, locked_by='', result=result, finished_at=timezone.now())
+    return Job.SUCCEEDED
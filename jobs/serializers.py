@@ -0,0 +1,29 @@
+from rest_framework import serializers
+
+from .models import Job
+
+
+class JobSerializer(serializers.ModelSerializer):
+    progress = serializers.SerializerMethodField()
+    error = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Job
+        fields = [
+            'id', 'job_type', 'status', 'priority', 'attempts', 'max_attempts', 'progress', 'result',
+            'error', 'run_at', 'created_at', 'started_at', 'finished_at'
+        ]
+        read_only_fields = fields
+
+    def get_progress(self, obj):
+        return {
+            'done': obj.progress_done,
+            'total': obj.progress_total,
+            'percent': obj.progress_percent,
+            'message': obj.progress_message,
+        }
+
+    def get_error(self, obj):
+        # Only the exception line; tracebacks stay in the admin
+        lines = obj.last_error.strip().splitlines()
+        return lines[-1] if lines else None
@@ -0,0 +1,229 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from activities.models import Activity
+from jobs import queue
+from jobs.models import Job
+from jobs.queue import PermanentJobError, job
+from jobs.worker import Worker
+
+User = get_user_model()
+
+calls = []
+
+
+@job('tests.echo')
+def echo(job):
+    calls.append(job.pk)
+    job.report_progress(1, 2, 'halfway')
+    return {'echo': job.payload}
+
+
+@job('tests.flaky', max_attempts=2)
+def flaky(job):
+    raise RuntimeError('database went away')
+
+
+@job('tests.invalid')
+def invalid(job):
+    raise PermanentJobError('bad payload')
+
+
+@job('tests.limited', concurrency=1)
+def limited(job):
+    return None
+
+
+renewed = threading.Event()
+
+
+@job('tests.slow')
+def slow(job):
+    # Runs past several heartbeats without reporting progress
+    if not renewed.wait(5):
+        raise PermanentJobError('lease was never renewed')
+
+
+class JobQueueTest(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_job_runs_and_stores_result(self):
+        queued = queue.enqueue('tests.echo', {'n': 1})
+        self.assertTrue(Worker('w1').run_once())
+
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, Job.SUCCEEDED)
+        self.assertEqual(queued.result, {'echo': {'n': 1}})
+        self.assertEqual(queued.attempts, 1)
+        self.assertEqual((queued.progress_done, queued.progress_total), (1, 2))
+        self.assertEqual(queued.progress_message, 'halfway')
+        self.assertFalse(Worker('w1').run_once())
+
+    def test_unknown_job_type_is_rejected(self):
+        with self.assertRaises(ValueError):
+            queue.enqueue('tests.missing')
+
+    def test_failures_retry_with_backoff_then_fail(self):
+        queued = queue.enqueue('tests.flaky')
+        with self.assertLogs('jobs.queue', 'WARNING'):
+            Worker('w1').run_once()
+
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, Job.QUEUED)
+        self.assertGreater(queued.run_at, timezone.now())
+        self.assertIn('database went away', queued.last_error)
+        # Not due yet
+        self.assertFalse(Worker('w1').run_once())
+
+        Job.objects.filter(pk=queued.pk).update(run_at=timezone.now())
+        with self.assertLogs('jobs.queue', 'ERROR'):
+            Worker('w1').run_once()
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, Job.FAILED)
+        self.assertEqual(queued.attempts, 2)
+
+    def test_permanent_error_fails_at_once(self):
+        queued = queue.enqueue('tests.invalid')
+        with self.assertLogs('jobs.queue', 'ERROR'):
+            Worker('w1').run_once()
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, Job.FAILED)
+        self.assertEqual(queued.attempts, 1)
+
+    def test_backoff_doubles_up_to_the_cap(self):
+        with override_settings(JOBS={'BACKOFF_BASE_SECONDS': 10, 'BACKOFF_MAX_SECONDS': 60}):
+            self.assertLessEqual(queue.backoff(1), timedelta(seconds=10))
+            self.assertGreater(queue.backoff(2), timedelta(seconds=10))
+            self.assertLessEqual(queue.backoff(10), timedelta(seconds=60))
+
+    def test_higher_priority_runs_first(self):
+        low = queue.enqueue('tests.echo')
+        high = queue.enqueue('tests.echo', priority=5)
+        Worker('w1').run_once()
+        Worker('w1').run_once()
+        self.assertEqual(calls, [high.pk, low.pk])
+
+    def test_concurrency_limit_per_job_type(self):
+        queue.enqueue('tests.limited')
+        queue.enqueue('tests.limited')
+        other = queue.enqueue('tests.echo')
+
+        first = queue.claim('w1')
+        self.assertEqual(first.job_type, 'tests.limited')
+        # The second limited job waits; other job types still run
+        self.assertEqual(queue.claim('w2').pk, other.pk)
+        self.assertIsNone(queue.claim('w3'))
+
+        queue.run(first)
+        self.assertEqual(queue.claim('w3').job_type, 'tests.limited')
+
+    def test_claim_with_skip_locked(self):
+        queued = queue.enqueue('tests.echo')
+        with mock.patch.object(connection.features, 'has_select_for_update_skip_locked', True):
+            claimed = queue.claim('w1')
+        self.assertEqual(claimed.pk, queued.pk)
+        self.assertEqual((claimed.status, claimed.locked_by), (Job.RUNNING, 'w1'))
+
+    def test_stale_jobs_are_requeued(self):
+        queued = queue.enqueue('tests.echo')
+        claimed = queue.claim('crashed')
+        Job.objects.filter(pk=claimed.pk).update(heartbeat_at=timezone.now() - timedelta(hours=1))
+
+        with self.assertLogs('jobs.queue', 'WARNING'):
+            self.assertEqual(queue.recover_stale_jobs(), 1)
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.locked_by), (Job.QUEUED, ''))
+
+        # The crashed worker can no longer record an outcome
+        queue.run(claimed)
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, Job.QUEUED)
+
+
+    def test_running_jobs_keep_their_lease_without_reporting_progress(self):
+        queued = queue.enqueue('tests.slow')
+        renewed.clear()
+        with override_settings(JOBS={'LEASE_SECONDS': 0.03}), \
+                mock.patch.object(queue, 'renew_lease', side_effect=lambda claimed: renewed.set() or True) as renew:
+            self.assertTrue(Worker('w1').run_once())
+        self.assertEqual(renew.call_args[0][0].pk, queued.pk)
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, Job.SUCCEEDED)
+
+    def test_lease_is_fenced_on_the_claim(self):
+        queued = queue.enqueue('tests.echo')
+        first = queue.claim('w1')
+        Job.objects.filter(pk=first.pk).update(heartbeat_at=timezone.now() - timedelta(hours=1))
+        with self.assertLogs('jobs.queue', 'WARNING'):
+            queue.recover_stale_jobs()
+        # Claimed again by a worker with the same name
+        second = queue.claim('w1')
+
+        self.assertFalse(queue.renew_lease(first))
+        queue.run(first)
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.locked_at), (Job.RUNNING, second.locked_at))
+        self.assertTrue(queue.renew_lease(second))
+
+
+class JobApiTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='waiter', password='testpass123')
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}'
+        )
+        self.export_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.export_dir)
+        override = override_settings(ACTIVITY_EXPORT_DIR=self.export_dir)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_only_own_jobs_are_visible(self):
+        other = User.objects.create_user(username='other', password='testpass123')
+        mine = queue.enqueue('tests.echo', user=self.user)
+        theirs = queue.enqueue('tests.echo', user=other)
+
+        response = self.client.get('/api/jobs/')
+        self.assertEqual([row['id'] for row in response.data], [mine.pk])
+        self.assertEqual(self.client.get(f'/api/jobs/{theirs.pk}/').status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_export_runs_in_the_background(self):
+        for index in range(3):
+            activity = Activity.objects.create(
+                user=self.user, title=f'Run {index}', activity_type='workout', planned_date=timezone.now()
+            )
+        activity.logs.create(old_status='planned', new_status='completed')
+
+        response = self.client.post('/api/activities/export/')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response['Location'], f'/api/jobs/{response.data["id"]}/')
+        download = f'/api/activities/export/{response.data["id"]}/'
+        self.assertEqual(self.client.get(download).status_code, status.HTTP_409_CONFLICT)
+
+        Worker('w1').run_once()
+        detail = self.client.get(response['Location']).data
+        self.assertEqual(detail['status'], Job.SUCCEEDED)
+        self.assertEqual(detail['progress']['percent'], 100.0)
+
+        exported = self.client.get(download)
+        self.assertEqual(exported.status_code, status.HTTP_200_OK)
+        rows = [json.loads(line) for line in b''.join(exported.streaming_content).splitlines()]
+        exported.close()
+        self.assertEqual([row['title'] for row in rows], ['Run 0', 'Run 1', 'Run 2'])
+        self.assertEqual(rows[-1]['logs'][0]['new_status'], 'completed')
+        self.assertFalse(any(name.endswith('.partial') for name in os.listdir(self.export_dir)))
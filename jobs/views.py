@@ -0,0 +1,28 @@
+from django.shortcuts import get_object_or_404
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from .models import Job
+from .serializers import JobSerializer
+
+
+JOB_LIST_LIMIT = 50
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def job_list(request):
+    """The authenticated user's most recent background jobs, optionally filtered by ?status="""
+    jobs = Job.objects.filter(user=request.user)
+    if request.GET.get('status'):
+        jobs = jobs.filter(status=request.GET['status'])
+    return Response(JobSerializer(jobs[:JOB_LIST_LIMIT], many=True).data)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def job_detail(request, pk):
+    """Status, progress and result of one of the user's jobs"""
+    job = get_object_or_404(Job, pk=pk, user=request.user)
+    return Response(JobSerializer(job).data)
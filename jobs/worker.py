@@ -0,0 +1,85 @@
+import logging
+import os
+import socket
+import threading
+
+from django.db import close_old_connections, connections
+
+from . import queue
+
+
+logger = logging.getLogger(__name__)
+
+
+def worker_name(index=0):
+    return f'{socket.gethostname()}:{os.getpid()}:{index}'
+
+
+class Heartbeat(threading.Thread):
+    """Renews the lease on a running job until stopped, so long jobs aren't requeued."""
+
+    def __init__(self, claimed, interval=None):
+        super().__init__(name=f'heartbeat-{claimed.pk}', daemon=True)
+        self.claimed = claimed
+        self.interval = queue.heartbeat_interval() if interval is None else interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(self.interval):
+                try:
+                    if not queue.renew_lease(self.claimed):
+                        logger.warning('Lost the lease on %s', self.claimed)
+                        return
+                except Exception:
+                    # E.g. SQLite busy while the job holds the write lock; try again next beat
+                    logger.exception('Could not renew the lease on %s', self.claimed)
+        finally:
+            connections.close_all()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+class Worker:
+    """Claims and runs jobs until ``stop`` is set."""
+
+    def __init__(self, name=None, job_types=None, poll_interval=None):
+        self.name = name or worker_name()
+        self.job_types = job_types
+        self.poll_interval = queue.get_setting('POLL_INTERVAL') if poll_interval is None else poll_interval
+
+    def run_once(self):
+        """Run one due job if there is one; return whether a job ran."""
+        close_old_connections()
+        queue.recover_stale_jobs()
+        claimed = queue.claim(self.name, self.job_types)
+        if claimed is None:
+            return False
+        logger.info('%s running %s', self.name, claimed)
+        heartbeat = Heartbeat(claimed)
+        heartbeat.start()
+        try:
+            queue.run(claimed)
+        finally:
+            heartbeat.stop()
+        return True
+
+    def run(self, stop=None, burst=False):
+        """Loop until ``stop`` is set or, with ``burst``, until no job is due."""
+        stop = stop or threading.Event()
+        try:
+            while not stop.is_set():
+                try:
+                    ran = self.run_once()
+                except Exception:
+                    # Database hiccups shouldn't kill the worker; back off and retry
+                    logger.exception('%s could not claim a job', self.name)
+                    ran = False
+                if not ran:
+                    if burst:
+                        return
+                    stop.wait(self.poll_interval)
+        finally:
+            connections.close_all()
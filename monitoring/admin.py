@@ -0,0 +1,40 @@
+from django.contrib import admin
+from .models import SlowQuery
+
+
+@admin.register(SlowQuery)
+class SlowQueryAdmin(admin.ModelAdmin):
+    list_display = ['short_sql', 'alias', 'count', 'mean_ms_display', 'max_ms', 'last_view', 'last_seen']
+    list_filter = ['alias', 'last_view']
+    search_fields = ['normalized_sql', 'last_view', 'last_location']
+    ordering = ['-total_ms']
+    readonly_fields = [field.name for field in SlowQuery._meta.fields] + ['mean_ms_display']
+    
+    fieldsets = (
+        ('Query', {
+            'fields': ('normalized_sql', 'sample_sql', 'params_fingerprint', 'alias', 'fingerprint')
+        }),
+        ('Timings (ms)', {
+            'fields': ('count', 'total_ms', 'mean_ms_display', 'max_ms', 'last_ms')
+        }),
+        ('Origin', {
+            'fields': ('last_view', 'last_location', 'first_seen', 'last_seen')
+        }),
+        ('Query plan', {
+            'fields': ('explain',)
+        }),
+    )
+    
+    @admin.display(description='SQL')
+    def short_sql(self, obj):
+        return obj.normalized_sql[:120]
+    
+    @admin.display(description='Mean ms', ordering='total_ms')
+    def mean_ms_display(self, obj):
+        return round(obj.mean_ms, 1)
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
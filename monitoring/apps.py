@@ -0,0 +1,15 @@
+from django.apps import AppConfig
+
+
+class MonitoringConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'monitoring'
+
+    def ready(self):
+        from django.core import checks
+
+        from . import db_pool, metrics, slow_queries
+        checks.register(metrics.check_metrics_token, checks.Tags.security, deploy=True)
+        db_pool.install()
+        if slow_queries.get_setting('ENABLED'):
+            slow_queries.install()
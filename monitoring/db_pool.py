@@ -0,0 +1,145 @@
+"""
+Connection reuse metrics.
+
+Django keeps one connection per thread and alias and reuses it across
+requests for ``CONN_MAX_AGE`` seconds, health-checking it first when
+``CONN_HEALTH_CHECKS`` is on. This module instruments that lifecycle so the
+effect of the settings is visible:
+
+* ``checkouts`` - requests (or other units of work) that used a connection
+* ``creates``   - new connections opened, and ``connect_seconds`` spent opening them
+* ``reuses``    - checkouts served by an already-open connection
+* ``recycled``  - connections closed for exceeding their max age or erroring
+* ``health_check_failures`` - reused connections found dead before use
+
+``snapshot()`` covers the current process; the same events are also exported
+across all workers through ``monitoring.metrics``.
+"""
+import threading
+import time
+from collections import defaultdict
+
+from django.core.signals import request_finished
+from django.db import connections
+from django.db.backends.base.base import BaseDatabaseWrapper
+
+from . import metrics
+
+
+COUNTERS = ('checkouts', 'creates', 'reuses', 'recycled', 'health_check_failures')
+
+
+class PoolStats:
+    """Per-alias connection counters shared by all threads of the process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._counters = defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+            self._connect_seconds = defaultdict(float)
+            self._max_connect_seconds = defaultdict(float)
+
+    def incr(self, alias, name):
+        with self._lock:
+            self._counters[alias][name] += 1
+        metrics.record_connection_event(alias, name)
+
+    def record_connect(self, alias, seconds):
+        with self._lock:
+            self._counters[alias]['creates'] += 1
+            self._connect_seconds[alias] += seconds
+            self._max_connect_seconds[alias] = max(self._max_connect_seconds[alias], seconds)
+        metrics.record_connection_event(alias, 'creates')
+
+    def snapshot(self):
+        with self._lock:
+            result = {}
+            for alias, counters in self._counters.items():
+                creates = counters['creates']
+                result[alias] = {
+                    **counters,
+                    'connect_seconds_total': round(self._connect_seconds[alias], 6),
+                    'connect_seconds_avg': round(self._connect_seconds[alias] / creates, 6) if creates else 0.0,
+                    'connect_seconds_max': round(self._max_connect_seconds[alias], 6),
+                }
+            return result
+
+
+stats = PoolStats()
+_installed = False
+
+
+def _wrap_connect(original):
+    def connect(self):
+        start = time.perf_counter()
+        original(self)
+        stats.record_connect(self.alias, time.perf_counter() - start)
+        metrics.connection_opened(self.alias)
+    return connect
+
+
+def _wrap_close(original):
+    def close(self):
+        was_open = self.connection is not None
+        try:
+            original(self)
+        finally:
+            if was_open and self.connection is None:
+                metrics.connection_closed(self.alias)
+    return close
+
+
+def _wrap_ensure_connection(original):
+    def ensure_connection(self):
+        if not self.__dict__.get('_pool_checked_out'):
+            self._pool_checked_out = True
+            stats.incr(self.alias, 'checkouts')
+            if self.connection is not None:
+                stats.incr(self.alias, 'reuses')
+        original(self)
+    return ensure_connection
+
+
+def _wrap_close_if_unusable_or_obsolete(original):
+    def close_if_unusable_or_obsolete(self):
+        was_open = self.connection is not None
+        original(self)
+        if was_open and self.connection is None:
+            stats.incr(self.alias, 'recycled')
+    return close_if_unusable_or_obsolete
+
+
+def _wrap_close_if_health_check_failed(original):
+    def close_if_health_check_failed(self):
+        was_open = self.connection is not None
+        original(self)
+        if was_open and self.connection is None:
+            stats.incr(self.alias, 'health_check_failures')
+    return close_if_health_check_failed
+
+
+def end_checkouts(**kwargs):
+    """Mark this thread's connections as returned at the end of a request."""
+    for connection in connections.all(initialized_only=True):
+        connection._pool_checked_out = False
+
+
+def install():
+    """Instrument the database wrapper once per process."""
+    global _installed
+    if _installed:
+        return
+    _installed = True
+    BaseDatabaseWrapper.connect = _wrap_connect(BaseDatabaseWrapper.connect)
+    BaseDatabaseWrapper.ensure_connection = _wrap_ensure_connection(BaseDatabaseWrapper.ensure_connection)
+    BaseDatabaseWrapper.close = _wrap_close(BaseDatabaseWrapper.close)
+    BaseDatabaseWrapper.close_if_unusable_or_obsolete = _wrap_close_if_unusable_or_obsolete(
+        BaseDatabaseWrapper.close_if_unusable_or_obsolete
+    )
+    BaseDatabaseWrapper.close_if_health_check_failed = _wrap_close_if_health_check_failed(
+        BaseDatabaseWrapper.close_if_health_check_failed
+    )
+    request_finished.connect(end_checkouts, dispatch_uid='monitoring.db_pool.end_checkouts')
@@ -0,0 +1,236 @@
+"""
+Prometheus metrics.
+
+``MetricsMiddleware`` records, per URL name (``activity-stats``,
+``user-login`` ...), request counts, latency, response size and the number of
+database queries each request ran. Cache hit rates and open database
+connections are recorded by wrapping the cache backends and
+``monitoring.db_pool``. ``GET /metrics`` serves them in the Prometheus text
+format.
+
+Under gunicorn each worker is a separate process. When
+``PROMETHEUS_MULTIPROC_DIR`` is set (``gunicorn.conf.py`` does this), every
+process writes its values to memory-mapped files in that directory and
+``/metrics`` adds them up, so any worker can answer a scrape. Recording a
+value is an in-memory update either way, a few microseconds per request.
+
+Outside DEBUG scrapes must send ``Authorization: Bearer <METRICS_TOKEN>``;
+without a token the endpoint refuses them and ``check --deploy`` fails.
+"""
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.core import checks
+from django.core.exceptions import MiddlewareNotUsed
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess,
+)
+from prometheus_client.values import ValueClass
+
+
+def check_metrics_token(app_configs, **kwargs):
+    """Deploy check: /metrics exposes traffic and database details, so it needs a token."""
+    if getattr(settings, 'METRICS_ENABLED', True) and not getattr(settings, 'METRICS_TOKEN', ''):
+        return [checks.Error(
+            'METRICS_TOKEN is not set, so /metrics refuses every scrape outside DEBUG.',
+            hint='Set METRICS_TOKEN and have Prometheus send it as a bearer token.',
+            id='monitoring.E001',
+        )]
+    return []
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+REQUESTS = Counter(
+    'http_requests_total', 'HTTP requests by view, method and status.', ['view', 'method', 'status']
+)
+LATENCY = Histogram(
+    'http_request_duration_seconds', 'Time to produce a response.', ['view', 'method'], buckets=LATENCY_BUCKETS
+)
+RESPONSE_SIZE = Histogram(
+    'http_response_size_bytes', 'Size of non-streaming response bodies.', ['view'], buckets=SIZE_BUCKETS
+)
+QUERIES = Histogram(
+    'http_request_db_queries', 'Database queries run per request.', ['view'], buckets=QUERY_BUCKETS
+)
+IN_PROGRESS = Gauge(
+    'http_requests_in_progress', 'Requests being handled.', multiprocess_mode='livesum'
+)
+CACHE_REQUESTS = Counter(
+    'cache_requests_total', 'Cache lookups by backend and result (hit or miss).', ['backend', 'result']
+)
+DB_CONNECTIONS = Gauge(
+    'db_connections_open', 'Open database connections by alias.', ['alias'], multiprocess_mode='livesum'
+)
+DB_CONNECTION_EVENTS = Counter(
+    'db_connection_events_total', 'Connection checkouts, reuses, creates and recycles by alias.', ['alias', 'event']
+)
+SHED_REQUESTS = Counter(
+    'http_requests_shed_total', 'Requests refused with 503 by load shedding, by view and priority.',
+    ['view', 'priority']
+)
+CONCURRENCY_LIMIT = Gauge(
+    'http_concurrency_limit', 'Adaptive limit on requests handled at once, summed over workers.',
+    multiprocess_mode='livesum'
+)
+
+_request = ContextVar('metrics_request', default=None)
+_installed = False
+_MISS = object()
+# Labelled children per (view, method[, status]); .labels() alone costs
+# about as much as recording the values
+_view_series = {}
+_request_counters = {}
+
+
+def is_multiprocess():
+    return getattr(ValueClass, '_multiprocess', False)
+
+
+def registry():
+    """Registry to export: all workers' files in multiprocess mode, else this process."""
+    if not is_multiprocess():
+        return REGISTRY
+    collector_registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(collector_registry)
+    return collector_registry
+
+
+def render():
+    return generate_latest(registry()), CONTENT_TYPE_LATEST
+
+
+def record_connection_event(alias, event):
+    DB_CONNECTION_EVENTS.labels(alias, event).inc()
+
+
+def connection_opened(alias):
+    DB_CONNECTIONS.labels(alias).inc()
+
+
+def connection_closed(alias):
+    DB_CONNECTIONS.labels(alias).dec()
+
+
+def record_shed(view, priority):
+    SHED_REQUESTS.labels(view, priority).inc()
+
+
+def set_concurrency_limit(value):
+    CONCURRENCY_LIMIT.set(value)
+
+
+class RequestState:
+    """The request being handled by this thread or task, and its query count."""
+    __slots__ = ('request', 'queries')
+
+    def __init__(self, request):
+        self.request = request
+        self.queries = 0
+
+
+def _count_queries(original):
+    @wraps(original)
+    def _execute_with_wrappers(self, sql, params, many, executor):
+        state = _request.get()
+        if state is not None:
+            state.queries += 1
+        return original(self, sql, params, many, executor)
+    return _execute_with_wrappers
+
+
+def _cache_get(original, backend):
+    hits = CACHE_REQUESTS.labels(backend, 'hit')
+    misses = CACHE_REQUESTS.labels(backend, 'miss')
+
+    @wraps(original)
+    def get(self, key, default=None, version=None):
+        value = original(self, key, _MISS, version)
+        if value is _MISS:
+            misses.inc()
+            return default
+        hits.inc()
+        return value
+    return get
+
+
+def install():
+    """Count queries and cache hits once per process."""
+    global _installed
+    if _installed:
+        return
+    _installed = True
+    from django.core.cache import caches
+    from django.db.backends.utils import CursorWrapper
+
+    CursorWrapper._execute_with_wrappers = _count_queries(CursorWrapper._execute_with_wrappers)
+    wrapped = set()
+    for alias in settings.CACHES:
+        backend_class = type(caches[alias])
+        if backend_class not in wrapped:
+            backend_class.get = _cache_get(backend_class.get, backend_class.__name__)
+            wrapped.add(backend_class)
+
+
+def _series(view, method):
+    series = _view_series.get((view, method))
+    if series is None:
+        series = _view_series[view, method] = (
+            LATENCY.labels(view, method), QUERIES.labels(view), RESPONSE_SIZE.labels(view)
+        )
+    return series
+
+
+def _request_counter(view, method, status):
+    counter = _request_counters.get((view, method, status))
+    if counter is None:
+        counter = _request_counters[view, method, status] = REQUESTS.labels(view, method, status)
+    return counter
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    return match.view_name or match._func_path
+
+
+def current_view():
+    """URL name of the request being handled, or ``None`` outside requests."""
+    state = _request.get()
+    return view_name(state.request) if state is not None else None
+
+
+class MetricsMiddleware:
+    """Records request metrics; list it first in ``MIDDLEWARE`` to time the whole stack."""
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICS_ENABLED', True):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        install()
+
+    def __call__(self, request):
+        state = RequestState(request)
+        token = _request.set(state)
+        IN_PROGRESS.inc()
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            elapsed = time.perf_counter() - start
+            IN_PROGRESS.dec()
+            _request.reset(token)
+
+        view = view_name(request)
+        latency, queries, size = _series(view, request.method)
+        _request_counter(view, request.method, response.status_code).inc()
+        latency.observe(elapsed)
+        queries.observe(state.queries)
+        if not response.streaming:
+            size.observe(len(response.content))
+        return response
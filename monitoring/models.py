@@ -0,0 +1,32 @@
+from django.db import models
+
+
+class SlowQuery(models.Model):
+    """Statements slower than SLOW_QUERY_LOG['THRESHOLD_MS'], grouped by normalized SQL"""
+    fingerprint = models.CharField(max_length=64)
+    alias = models.CharField(max_length=100)
+    normalized_sql = models.TextField()
+    sample_sql = models.TextField()
+    params_fingerprint = models.CharField(max_length=16, blank=True)
+    count = models.PositiveIntegerField(default=0)
+    total_ms = models.FloatField(default=0)
+    max_ms = models.FloatField(default=0)
+    last_ms = models.FloatField(default=0)
+    last_view = models.CharField(max_length=200, blank=True)
+    last_location = models.CharField(max_length=500, blank=True)
+    explain = models.TextField(blank=True)
+    first_seen = models.DateTimeField(auto_now_add=True)
+    last_seen = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name_plural = 'slow queries'
+        constraints = [
+            models.UniqueConstraint(fields=['fingerprint', 'alias'], name='unique_slow_query_per_alias'),
+        ]
+    
+    def __str__(self):
+        return self.normalized_sql[:80]
+    
+    @property
+    def mean_ms(self):
+        return self.total_ms / self.count if self.count else 0
@@ -0,0 +1,223 @@
+"""
+Opt-in per-request profiling.
+
+``ProfilingMiddleware`` times each request under ``REQUEST_PROFILING['PATHS']``
+and breaks it down into database queries, DRF authentication, serializer
+``.data`` and rendering. The numbers are returned in a ``Server-Timing``
+header (visible in the browser's network panel), and requests issuing more
+queries than their view's budget are logged and flagged with an
+``X-Query-Budget`` header.
+
+With ``PROFILE_DIR`` set, requests slower than ``SLOW_REQUEST_MS`` also leave a
+profile there: a cProfile ``.prof`` file (open with ``snakeviz`` or
+``pstats``), or with ``PROFILER = 'sampling'`` a ``.folded`` stack file for
+flame graph tools, which costs far less than cProfile on fast requests.
+
+The middleware removes itself (``MiddlewareNotUsed``) unless ``ENABLED``.
+"""
+import cProfile
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils import timezone
+
+from . import metrics
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': False,
+    'PATHS': ['/api/activities/', '/api/auth/'],
+    'DEFAULT_QUERY_BUDGET': 10,
+    'QUERY_BUDGETS': {},
+    'SLOW_REQUEST_MS': 500,
+    'PROFILE_DIR': None,
+    'PROFILER': 'cprofile',
+    'SAMPLE_INTERVAL_MS': 5,
+}
+
+PHASES = ('auth', 'serialize', 'render')
+
+_current = ContextVar('request_profile', default=None)
+_installed = False
+
+
+def get_setting(name):
+    return getattr(settings, 'REQUEST_PROFILING', {}).get(name, DEFAULTS[name])
+
+
+class RequestProfile:
+    """Timings collected for one request, in seconds."""
+
+    def __init__(self):
+        self.queries = 0
+        self.query_time = 0.0
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self._depth = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper() hook
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.query_time += time.perf_counter() - start
+            self.queries += 1
+
+    def server_timing(self, total):
+        entries = [f'db;dur={self.query_time * 1000:.1f};desc="{self.queries} queries"']
+        entries += [f'{phase};dur={seconds * 1000:.1f}' for phase, seconds in self.phases.items() if seconds]
+        entries.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(entries)
+
+
+def _timed(phase, func):
+    """Add the time spent in ``func`` to the current request's ``phase``.
+
+    Nested calls (a serializer's ``.data`` inside another) are counted once.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        profile = _current.get()
+        if profile is None or profile._depth[phase]:
+            return func(*args, **kwargs)
+        profile._depth[phase] += 1
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile.phases[phase] += time.perf_counter() - start
+            profile._depth[phase] -= 1
+    return wrapper
+
+
+def install():
+    """Instrument DRF authentication, serialization and rendering once per process."""
+    global _installed
+    if _installed:
+        return
+    _installed = True
+    from rest_framework.renderers import JSONRenderer
+    from rest_framework.request import Request
+    from rest_framework.serializers import ListSerializer, Serializer
+
+    Request._authenticate = _timed('auth', Request._authenticate)
+    for serializer_class in (Serializer, ListSerializer):
+        serializer_class.data = property(_timed('serialize', serializer_class.data.fget))
+    JSONRenderer.render = _timed('render', JSONRenderer.render)
+
+
+class StackSampler:
+    """Samples one thread's stack every ``interval`` seconds from a helper thread."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-sampler', daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def dump(self, path):
+        with open(path, 'w') as output:
+            for stack, count in self.stacks.most_common():
+                output.write(f'{stack} {count}\n')
+
+
+class ProfilingMiddleware:
+    """Adds ``Server-Timing`` and query budget checks to profiled requests."""
+
+    def __init__(self, get_response):
+        if not get_setting('ENABLED'):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.paths = tuple(get_setting('PATHS'))
+        self.profile_dir = get_setting('PROFILE_DIR')
+        if self.profile_dir:
+            os.makedirs(self.profile_dir, exist_ok=True)
+        install()
+
+    def __call__(self, request):
+        if not request.path_info.startswith(self.paths):
+            return self.get_response(request)
+
+        profile = RequestProfile()
+        token = _current.set(profile)
+        profiler = self._start_profiler()
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(profile))
+                response = self.get_response(request)
+        finally:
+            total = time.perf_counter() - start
+            if isinstance(profiler, cProfile.Profile):
+                profiler.disable()
+            elif profiler is not None:
+                profiler.stop()
+            _current.reset(token)
+
+        view_name = metrics.view_name(request)
+        response['Server-Timing'] = profile.server_timing(total)
+        budget = get_setting('QUERY_BUDGETS').get(view_name, get_setting('DEFAULT_QUERY_BUDGET'))
+        if budget is not None and profile.queries > budget:
+            response['X-Query-Budget'] = f'exceeded; queries={profile.queries}; budget={budget}'
+            logger.warning(
+                'Query budget exceeded: %s %s (%s) ran %d queries, budget %d',
+                request.method, request.path, view_name, profile.queries, budget,
+            )
+        if profiler is not None and total * 1000 >= get_setting('SLOW_REQUEST_MS'):
+            self._dump(profiler, request, view_name, total)
+        return response
+
+    def _start_profiler(self):
+        if not self.profile_dir:
+            return None
+        if get_setting('PROFILER') == 'sampling':
+            sampler = StackSampler(threading.get_ident(), get_setting('SAMPLE_INTERVAL_MS') / 1000)
+            sampler.start()
+            return sampler
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    def _dump(self, profiler, request, view_name, total):
+        stamp = timezone.now().strftime('%Y%m%dT%H%M%S.%f')
+        name = f'{stamp}-{request.method}-{view_name}-{total * 1000:.0f}ms'
+        if isinstance(profiler, cProfile.Profile):
+            path = os.path.join(self.profile_dir, f'{name}.prof')
+            profiler.dump_stats(path)
+        else:
+            path = os.path.join(self.profile_dir, f'{name}.folded')
+            profiler.dump(path)
+        logger.info('Slow request %s %s took %.0f ms, profile written to %s',
+                    request.method, request.path, total * 1000, path)
@@ -0,0 +1,260 @@
+"""
+Slow query log.
+
+Every statement goes through ``CursorWrapper._execute_with_wrappers``; this
+module times it there and, when it takes longer than
+``SLOW_QUERY_LOG['THRESHOLD_MS']``, hands the SQL, a fingerprint of its
+parameters, the view being served and the line of project code that ran it to
+a background thread. That thread runs ``EXPLAIN`` for SELECTs, writes a JSON
+line to a rotating log file and adds the timing to the ``SlowQuery`` row for
+the normalized statement, which the admin lists by total time.
+
+The request thread only pays for a clock read per statement, plus a stack walk
+and a queue put for the slow ones.
+"""
+import hashlib
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+import traceback
+from functools import wraps
+from logging.handlers import RotatingFileHandler
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import IntegrityError, connections, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from . import metrics
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': False,
+    'THRESHOLD_MS': 200,
+    'EXPLAIN': True,
+    'ASYNC': True,
+    'QUEUE_SIZE': 1000,
+    'LOG_FILE': None,
+    'LOG_MAX_BYTES': 10 * 1024 * 1024,
+    'LOG_BACKUP_COUNT': 5,
+}
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER = re.compile(r'%s|\?')
+_VALUE_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+_local = threading.local()
+_config = {}
+_installed = False
+
+
+def get_setting(name):
+    return getattr(settings, 'SLOW_QUERY_LOG', {}).get(name, DEFAULTS[name])
+
+
+def _load_config(**kwargs):
+    _config['enabled'] = get_setting('ENABLED')
+    _config['threshold'] = get_setting('THRESHOLD_MS') / 1000
+
+
+def _setting_changed(setting, **kwargs):
+    if setting == 'SLOW_QUERY_LOG':
+        _load_config()
+
+
+def normalize_sql(sql):
+    """SQL with literals and placeholders replaced by ``?`` and IN lists collapsed."""
+    sql = _STRING.sub('?', sql)
+    sql = _PLACEHOLDER.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _VALUE_LIST.sub('(...)', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+def fingerprint(normalized_sql):
+    return hashlib.sha256(normalized_sql.encode('utf-8')).hexdigest()
+
+
+def params_fingerprint(params):
+    if params is None:
+        return ''
+    return hashlib.sha256(repr(params).encode('utf-8')).hexdigest()[:16]
+
+
+def calling_location():
+    """Innermost project frame (outside this app and installed packages) that ran the query."""
+    base_dir = str(settings.BASE_DIR)
+    own_dir = os.path.dirname(__file__)
+    for frame in reversed(traceback.extract_stack()):
+        filename = frame.filename
+        if filename.startswith(base_dir) and not filename.startswith(own_dir) and 'site-packages' not in filename:
+            return f'{os.path.relpath(filename, base_dir)}:{frame.lineno} in {frame.name}'
+    return ''
+
+
+def explain(alias, sql, params):
+    """Query plan of a SELECT on ``alias``, or an empty string."""
+    if not sql.lstrip().upper().startswith('SELECT'):
+        return ''
+    connection = connections[alias]
+    prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+    with connection.cursor() as cursor:
+        cursor.execute(prefix + sql, params)
+        rows = cursor.fetchall()
+    if connection.vendor == 'sqlite':
+        return '\n'.join(str(row[-1]) for row in rows)
+    return '\n'.join(' | '.join(str(column) for column in row) for row in rows)
+
+
+class SlowQueryRecorder:
+    """Queues slow statements and records them from a daemon thread."""
+
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=get_setting('QUEUE_SIZE'))
+        self.dropped = 0
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def record(self, alias, sql, params, many, duration):
+        entry = {
+            'alias': alias,
+            'sql': sql,
+            'params': None if many else params,
+            'params_fingerprint': params_fingerprint(params),
+            'duration_ms': round(duration * 1000, 3),
+            'view': metrics.current_view() or '',
+            'location': calling_location(),
+            'at': timezone.now().isoformat(),
+        }
+        if not get_setting('ASYNC'):
+            self.process(entry)
+            return
+        self._ensure_thread()
+        try:
+            self.queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def _ensure_thread(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='slow-query-recorder', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            entry = self.queue.get()
+            try:
+                self.process(entry)
+            except Exception:
+                logger.exception('Could not record slow query')
+            finally:
+                # Don't hold connections open in this thread between entries
+                connections.close_all()
+                self.queue.task_done()
+
+    def process(self, entry):
+        from .models import SlowQuery
+
+        _local.suppressed = True
+        try:
+            normalized = normalize_sql(entry['sql'])
+            key = fingerprint(normalized)
+            existing = SlowQuery.objects.filter(fingerprint=key, alias=entry['alias']).exclude(explain='')
+            plan = ''
+            if get_setting('EXPLAIN') and entry['params'] is not None and not existing.exists():
+                try:
+                    plan = explain(entry['alias'], entry['sql'], entry['params'])
+                except Exception as exc:
+                    plan = f'EXPLAIN failed: {exc}'
+            entry = {**entry, 'normalized_sql': normalized, 'fingerprint': key, 'explain': plan}
+            logger.warning(json.dumps({k: v for k, v in entry.items() if k != 'params'}))
+            self._store(SlowQuery, entry)
+        finally:
+            _local.suppressed = False
+
+    def _store(self, model, entry):
+        duration = entry['duration_ms']
+        changes = {
+            'count': F('count') + 1,
+            'total_ms': F('total_ms') + duration,
+            'max_ms': Greatest(F('max_ms'), duration),
+            'last_ms': duration,
+            'last_view': entry['view'][:200],
+            'last_location': entry['location'][:500],
+            'sample_sql': entry['sql'],
+            'params_fingerprint': entry['params_fingerprint'],
+            'last_seen': timezone.now(),
+        }
+        if entry['explain']:
+            changes['explain'] = entry['explain']
+        rows = model.objects.filter(fingerprint=entry['fingerprint'], alias=entry['alias'])
+        if rows.update(**changes):
+            return
+        try:
+            with transaction.atomic():
+                model.objects.create(
+                    fingerprint=entry['fingerprint'], alias=entry['alias'], normalized_sql=entry['normalized_sql'],
+                    sample_sql=entry['sql'], params_fingerprint=entry['params_fingerprint'], count=1,
+                    total_ms=duration, max_ms=duration, last_ms=duration, last_view=entry['view'][:200],
+                    last_location=entry['location'][:500], explain=entry['explain'],
+                )
+        except IntegrityError:
+            rows.update(**changes)
+
+
+recorder = SlowQueryRecorder()
+
+
+def _time_statement(original):
+    @wraps(original)
+    def _execute_with_wrappers(self, sql, params, many, executor):
+        if not _config['enabled'] or getattr(_local, 'suppressed', False):
+            return original(self, sql, params, many, executor)
+        start = time.perf_counter()
+        try:
+            return original(self, sql, params, many, executor)
+        finally:
+            duration = time.perf_counter() - start
+            if duration >= _config['threshold']:
+                recorder.record(self.db.alias, sql, params, many, duration)
+    return _execute_with_wrappers
+
+
+def _add_log_file():
+    path = get_setting('LOG_FILE')
+    if not path:
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    handler = RotatingFileHandler(
+        path, maxBytes=get_setting('LOG_MAX_BYTES'), backupCount=get_setting('LOG_BACKUP_COUNT')
+    )
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.WARNING)
+
+
+def install():
+    """Time statements once per process; the log itself follows SLOW_QUERY_LOG['ENABLED']."""
+    global _installed
+    if _installed:
+        return
+    _installed = True
+    from django.db.backends.utils import CursorWrapper
+
+    _load_config()
+    setting_changed.connect(_setting_changed)
+    CursorWrapper._execute_with_wrappers = _time_statement(CursorWrapper._execute_with_wrappers)
+    _add_log_file()
@@ -0,0 +1,203 @@
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from rest_framework import status
+from prometheus_client import CollectorRegistry, multiprocess
+from rest_framework.test import APIClient
+
+from monitoring import db_pool, metrics, slow_queries
+from monitoring.models import SlowQuery
+
+User = get_user_model()
+
+
+class DbPoolStatsTest(TestCase):
+    def setUp(self):
+        db_pool.stats.reset()
+        db_pool.end_checkouts()
+
+    def test_one_checkout_per_request(self):
+        User.objects.count()
+        User.objects.count()
+        stats = db_pool.stats.snapshot()['default']
+        self.assertEqual(stats['checkouts'], 1)
+        self.assertEqual(stats['reuses'], 1)
+
+        db_pool.end_checkouts()
+        User.objects.count()
+        self.assertEqual(db_pool.stats.snapshot()['default']['checkouts'], 2)
+
+    def test_connect_records_create(self):
+        db_pool.stats.record_connect('default', 0.25)
+        db_pool.stats.record_connect('default', 0.75)
+        stats = db_pool.stats.snapshot()['default']
+        self.assertEqual(stats['creates'], 2)
+        self.assertEqual(stats['connect_seconds_avg'], 0.5)
+        self.assertEqual(stats['connect_seconds_max'], 0.75)
+
+    def test_stats_endpoint_is_admin_only(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username='member', password='testpass123'))
+        self.assertEqual(client.get('/api/monitoring/db-pool/').status_code, status.HTTP_403_FORBIDDEN)
+
+        client.force_authenticate(User.objects.create_superuser(username='admin', password='testpass123'))
+        response = client.get('/api/monitoring/db-pool/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('default', response.data['connections'])
+        self.assertIn('conn_max_age', response.data['settings']['default'])
+
+
+def profiling(**overrides):
+    return override_settings(REQUEST_PROFILING={'ENABLED': True, **overrides})
+
+
+class ProfilingMiddlewareTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='profiled', password='testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_disabled_by_default(self):
+        response = self.client.get('/api/auth/dashboard/')
+        self.assertNotIn('Server-Timing', response)
+
+    @profiling()
+    def test_server_timing_breakdown(self):
+        response = self.client.get('/api/auth/dashboard/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        timing = response['Server-Timing']
+        for metric in ('db;dur=', 'auth;dur=', 'serialize;dur=', 'render;dur=', 'total;dur='):
+            self.assertIn(metric, timing)
+        self.assertNotIn('X-Query-Budget', response)
+
+    @profiling(QUERY_BUDGETS={'activity-stats': 1})
+    def test_query_budget_exceeded(self):
+        with self.assertLogs('monitoring.profiling', level='WARNING') as logs:
+            response = self.client.get('/api/activities/stats/')
+        self.assertTrue(response['X-Query-Budget'].startswith('exceeded;'))
+        self.assertIn('activity-stats', logs.output[0])
+
+    @profiling()
+    def test_other_paths_not_profiled(self):
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get('/api/monitoring/db-pool/')
+        self.assertNotIn('Server-Timing', response)
+
+    def test_slow_requests_leave_a_profile(self):
+        for profiler, suffix in (('cprofile', '.prof'), ('sampling', '.folded')):
+            directory = tempfile.mkdtemp(prefix='request-profiles-')
+            with profiling(PROFILE_DIR=directory, SLOW_REQUEST_MS=0, PROFILER=profiler):
+                client = APIClient()
+                client.force_authenticate(self.user)
+                with self.assertLogs('monitoring.profiling', level='INFO'):
+                    client.get('/api/activities/stats/')
+            files = os.listdir(directory)
+            self.assertEqual(len(files), 1)
+            self.assertTrue(files[0].endswith(suffix))
+            self.assertIn('activity-stats', files[0])
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='measured', password='testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    @override_settings(METRICS_TOKEN='scrape-secret')
+    def test_requests_recorded_per_view(self):
+        self.client.get('/api/activities/stats/')
+        body = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-secret').content.decode()
+        self.assertIn('http_requests_total{method="GET",status="200",view="activity-stats"}', body)
+        self.assertIn('http_request_duration_seconds_bucket{le="0.005",method="GET",view="activity-stats"}', body)
+        self.assertIn('http_request_db_queries_count{view="activity-stats"}', body)
+        self.assertIn('http_response_size_bytes_sum{view="activity-stats"}', body)
+        self.assertIn('cache_requests_total{backend="DummyCache",result="miss"}', body)
+
+    @override_settings(METRICS_TOKEN='scrape-secret')
+    def test_token_required_when_configured(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+
+    @override_settings(METRICS_TOKEN='')
+    def test_token_required_outside_debug(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        with self.settings(DEBUG=True):
+            self.assertEqual(self.client.get('/metrics').status_code, 200)
+        self.assertEqual([error.id for error in metrics.check_metrics_token(None)], ['monitoring.E001'])
+        with self.settings(METRICS_TOKEN='scrape-secret'):
+            self.assertEqual(metrics.check_metrics_token(None), [])
+
+    def test_workers_aggregated_through_multiprocess_directory(self):
+        directory = tempfile.mkdtemp(prefix='metrics-')
+        env = {**os.environ, 'PROMETHEUS_MULTIPROC_DIR': directory}
+        script = "from monitoring import metrics; metrics.REQUESTS.labels('activity-stats', 'GET', 200).inc()"
+        for _ in range(2):
+            subprocess.run([sys.executable, '-c', script], env=env, check=True, cwd=settings.BASE_DIR)
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry, path=directory)
+        value = registry.get_sample_value(
+            'http_requests_total', {'view': 'activity-stats', 'method': 'GET', 'status': '200'}
+        )
+        self.assertEqual(value, 2)
+
+
+def slow_query_log(**overrides):
+    return override_settings(SLOW_QUERY_LOG={
+        'ENABLED': True, 'THRESHOLD_MS': 0, 'ASYNC': False, 'LOG_FILE': None, **overrides
+    })
+
+
+class SlowQueryLogTest(TestCase):
+    def setUp(self):
+        slow_queries.install()
+        self.user = User.objects.create_user(username='slow', password='testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_normalize_sql(self):
+        self.assertEqual(
+            slow_queries.normalize_sql(
+                "SELECT *  FROM \"activities_activity\" WHERE (\"user_id\" = %s AND status IN (%s, %s, %s)"
+                " AND title = 'it''s' AND steps_count > 1000) LIMIT 21"
+            ),
+            'SELECT * FROM "activities_activity" WHERE ("user_id" = ? AND status IN (...)'
+            ' AND title = ? AND steps_count > ?) LIMIT ?',
+        )
+
+    def test_disabled_by_default(self):
+        self.client.get('/api/activities/stats/')
+        self.assertFalse(SlowQuery.objects.exists())
+
+    @slow_query_log()
+    def test_slow_statements_recorded_with_view_and_plan(self):
+        with self.assertLogs('monitoring.slow_queries', level='WARNING'):
+            self.client.get('/api/activities/?status=completed')
+            self.client.get('/api/activities/?status=planned')
+
+        entry = SlowQuery.objects.get(normalized_sql__contains='FROM "activities_activity"', count=2)
+        self.assertEqual(entry.last_view, 'activity-list-create')
+        self.assertIn('activity_user_', entry.explain)
+        self.assertTrue(entry.last_location.startswith('activities/'))
+        self.assertGreaterEqual(entry.max_ms, entry.last_ms)
+
+    @slow_query_log(ASYNC=True)
+    def test_recorded_off_the_request_thread(self):
+        threads = []
+        with patch.object(slow_queries.recorder, 'process', side_effect=lambda entry: threads.append(
+            threading.current_thread()
+        )):
+            User.objects.count()
+            slow_queries.recorder.queue.join()
+        self.assertTrue(threads)
+        self.assertNotIn(threading.main_thread(), threads)
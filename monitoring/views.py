@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.crypto import constant_time_compare
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+
+from . import db_pool, metrics
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def db_pool_stats(request):
+    """Connection reuse counters of this worker process, per database alias"""
+    return Response({
+        'settings': {
+            alias: {
+                'conn_max_age': config.get('CONN_MAX_AGE', 0),
+                'conn_health_checks': config.get('CONN_HEALTH_CHECKS', False),
+            }
+            for alias, config in settings.DATABASES.items()
+        },
+        'connections': db_pool.stats.snapshot(),
+    })
+
+
+def prometheus_metrics(request):
+    """Prometheus scrape endpoint; requires ``Bearer <METRICS_TOKEN>``, which only DEBUG may leave unset"""
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if not token and not settings.DEBUG:
+        return HttpResponse('Set METRICS_TOKEN to serve metrics', status=403, content_type='text/plain')
+    if token and not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse('Unauthorized', status=401, content_type='text/plain')
+    body, content_type = metrics.render()
+    return HttpResponse(body, content_type=content_type)